@@ -4,6 +4,25 @@ import sys
 import os
 import argparse
 import json
+import codecs
+import bisect
+import socket
+import socketserver
+import signal
+import threading
+import mmap
+import shutil
+import tempfile
+import time
+import collections
+import hashlib
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from candidate_store import CandidateStore, DEFAULT_STORE_DIR
+from diff_stats import diff_stats
+from overlay_fs import OverlayFS
 
 def get_clipboard_content():
     """Get content from system clipboard."""
@@ -21,164 +40,1639 @@ def get_clipboard_content():
     except Exception as e:
         raise RuntimeError(f"Error accessing clipboard: {e}")
 
-def save_full_content_to_candidate_file(content, candidate_number):
-    """Save full content to a numbered candidate file. Returns success status."""
-    candidates_dir = "candidates"
-    os.makedirs(candidates_dir, exist_ok=True)
-    filepath = os.path.join(candidates_dir, f"implementation_{candidate_number}.txt")
-    try:
-        with open(filepath, 'w', encoding='utf-8', errors='replace') as f:
-            f.write(content)
-        return True, f"Successfully saved full content to {filepath}"
-    except OSError as e:
-        return False, f"Error writing to {filepath}: {e}"
-    except Exception as e:
-        return False, f"An unexpected error occurred writing to {filepath}: {e}"
+FENCE = "```"
+END_FENCE = "```end:"
+_LANG_RE = re.compile(r"\w*")
+
+# Stack entry fields for BlockTokenizer.
+_OPEN_LINE, _LANGUAGE, _PATH, _CONTENT_START, _CONTENT_END, _BLANK_FALLBACK = range(6)
+
+class BlockTokenizer:
+    """
+    Single-pass, incremental tokenizer for ```language:path ... ```end:path blocks.
+
+    Text can be fed in arbitrary chunks; each call returns the (language, filepath, content)
+    tuples completed so far, in input order. Every line is inspected once and every opening
+    fence is pushed and popped at most once, so the total work is O(n) in the input size.
+
+    The grammar mirrors the original regex exactly: a block runs from its opening fence to
+    the first later ```end:<same path> line, leading and trailing whitespace-only lines are
+    trimmed from the content, and the content must span at least one line. Fences nested
+    inside a block are plain content, and an opening fence that never closes is ignored.
+    A block that closes while an earlier fence is still open is held back until that fence
+    either closes (swallowing it) or the input ends.
+    """
+
+    def __init__(self):
+        self._partial = []          # pieces of the current, not yet terminated line
+        self._lines = []            # lines retained since the oldest open fence
+        self._base = 0              # line number of self._lines[0]
+        self._line_no = 0           # line number of the next line
+        self._last_nonblank = -1    # line number of the latest non whitespace-only line
+        self._stack = []            # open fences and held-back blocks, in input order
+        self._open_by_path = {}     # path -> stack positions of the open fences for it
+
+    def feed(self, chunk):
+        """Consume a chunk of text and return the blocks it completed."""
+        blocks = []
+        start = 0
+        while True:
+            newline = chunk.find("\n", start)
+            if newline == -1:
+                if start < len(chunk):
+                    self._partial.append(chunk[start:])
+                return blocks
+            if self._partial:
+                self._partial.append(chunk[start:newline])
+                line = "".join(self._partial)
+                self._partial = []
+            else:
+                line = chunk[start:newline]
+            self._process_line(line, True, blocks)
+            start = newline + 1
+
+    def close(self):
+        """Signal end of input and return the remaining completed blocks."""
+        blocks = []
+        if self._partial:
+            line = "".join(self._partial)
+            self._partial = []
+            self._process_line(line, False, blocks)
+        # Fences that never closed are dropped; blocks held back behind them are final.
+        for entry in self._stack:
+            if entry[_CONTENT_END] is None and entry[_BLANK_FALLBACK]:
+                entry[_CONTENT_START] = entry[_CONTENT_END] = entry[_CONTENT_START] - 1
+            if entry[_CONTENT_END] is not None:
+                blocks.append(self._make_block(entry))
+        self._stack = []
+        self._open_by_path = {}
+        self._lines = []
+        return blocks
+
+    def _process_line(self, line, terminated, blocks):
+        line_no = self._line_no
+        self._line_no += 1
+        stack = self._stack
+        if stack:
+            self._lines.append(line)
+        stripped = line.lstrip()
+        if not stripped:
+            return
+        previous_nonblank = self._last_nonblank
+        self._last_nonblank = line_no
+        # Only the most recently opened fence can still be waiting for its first content line.
+        if stack and stack[-1][_CONTENT_START] is None:
+            stack[-1][_CONTENT_START] = line_no
+        if not stripped.startswith(FENCE):
+            return
+        if stripped.startswith(END_FENCE) and self._open_by_path:
+            tail = stripped[len(END_FENCE):]
+            positions = self._open_by_path.get(tail.rstrip() or tail[:1])
+            if positions:
+                # Positions are in input order, so the first one is the earliest open fence.
+                # Only the newest fence can lack content, and then no other fence shares its path.
+                position = positions[0]
+                entry = stack[position]
+                if entry[_CONTENT_START] < line_no:
+                    entry[_CONTENT_END] = previous_nonblank
+                    self._close(position, blocks)
+                    return
+                if entry[_OPEN_LINE] < line_no - 1:
+                    # Only whitespace-only lines separate the fence from this end line. The
+                    # regex keeps the last of them as content unless the path closes again later.
+                    entry[_BLANK_FALLBACK] = True
+                    return
+        if terminated:
+            self._open(stripped, line_no)
+
+    def _open(self, stripped, line_no):
+        lang_match = _LANG_RE.match(stripped, len(FENCE))
+        colon = lang_match.end()
+        if stripped[colon:colon + 1] != ":":
+            return
+        rest = stripped[colon + 1:]
+        path = rest.rstrip() or rest[:1]
+        if not path:
+            return
+        if not self._stack:
+            self._lines = []
+            self._base = line_no + 1
+        self._open_by_path.setdefault(path, []).append(len(self._stack))
+        self._stack.append([line_no, lang_match.group(), path, None, None, False])
+
+    def _close(self, position, blocks):
+        stack = self._stack
+        # Everything opened after this fence is part of its content now.
+        while len(stack) > position + 1:
+            inner = stack.pop()
+            if inner[_CONTENT_END] is None:
+                inner_positions = self._open_by_path[inner[_PATH]]
+                inner_positions.pop()
+                if not inner_positions:
+                    del self._open_by_path[inner[_PATH]]
+        entry = stack[position]
+        del self._open_by_path[entry[_PATH]]
+        if position == 0:
+            blocks.append(self._make_block(entry))
+            self._stack = []
+            self._lines = []
+
+    def _make_block(self, entry):
+        content = "\n".join(self._lines[entry[_CONTENT_START] - self._base:entry[_CONTENT_END] + 1 - self._base])
+        return entry[_LANGUAGE], entry[_PATH], content
+
+def tokenize_blocks(full_text):
+    """Return every (language, filepath, content) block in full_text, in input order."""
+    tokenizer = BlockTokenizer()
+    blocks = tokenizer.feed(full_text)
+    blocks.extend(tokenizer.close())
+    return blocks
+
+SEARCH_MARKER = "<<<<<<< SEARCH\n"
+DIVIDER_MARKER = "\n=======\n"
+REPLACE_MARKER = ">>>>>>> REPLACE"
+
+STREAM_CHUNK_SIZE = 64 * 1024
+BATCH_WINDOW_PER_WORKER = 4    # manifest records in flight per --workers process
+FILE_CACHE_MAX_ENTRIES = 1024
+SERVER_MAX_PROJECTS = 16        # project roots whose FileCache the apply server keeps warm
+LEDGER_MAX_ENTRIES = 100000    # the ledger is compacted to the most recent keys beyond this
+# Files at least this large are memory-mapped and edited as bytes (0 disables).
+MMAP_THRESHOLD = 64 * 1024 * 1024
+WRITE_CHUNK_SIZE = 8 * 1024 * 1024
 
 def parse_search_replace_blocks(content: str):
     """
     Parses a string containing one or more SEARCH/REPLACE blocks.
     Returns a tuple: (list of (search, replace) tuples, remaining content string).
+    Markers are located with bounded forward scans over the original string, so the
+    parse is a single O(n) pass that never copies the text between blocks.
     """
     sr_blocks = []
     remainder_parts = []
-    parts = content.split('<<<<<<< SEARCH\n')
+    marker = content.find(SEARCH_MARKER)
+    head = content if marker == -1 else content[:marker]
+    if head.strip():
+        remainder_parts.append(head)
 
-    if parts[0].strip():
-        remainder_parts.append(parts[0])
+    while marker != -1:
+        part_start = marker + len(SEARCH_MARKER)
+        next_marker = content.find(SEARCH_MARKER, part_start)
+        part_end = len(content) if next_marker == -1 else next_marker
 
-    for part in parts[1:]:
-        if '\n=======\n' not in part or '>>>>>>> REPLACE' not in part:
-            remainder_parts.append('<<<<<<< SEARCH\n' + part)
-            continue
-
-        search_text, rest_of_block = part.split('\n=======\n', 1)
-        end_marker = '>>>>>>> REPLACE'
-        end_marker_pos = rest_of_block.find(end_marker)
+        divider = content.find(DIVIDER_MARKER, part_start, part_end)
+        replace_start = divider + len(DIVIDER_MARKER)
+        end_marker_pos = -1 if divider == -1 else content.find(REPLACE_MARKER, replace_start, part_end)
 
         if end_marker_pos == -1:
-            remainder_parts.append('<<<<<<< SEARCH\n' + part)
-            continue
-
-        replace_candidate = rest_of_block[:end_marker_pos]
-        # Compatibility for Python < 3.9 which doesn't have removesuffix
-        replace_text = replace_candidate[:-1] if replace_candidate.endswith('\n') else replace_candidate
-        sr_blocks.append((search_text, replace_text))
+            remainder_parts.append(content[marker:part_end])
+        else:
+            replace_end = end_marker_pos
+            if replace_end > replace_start and content[replace_end - 1] == "\n":
+                replace_end -= 1
+            sr_blocks.append((content[part_start:divider], content[replace_start:replace_end]))
 
-        remainder = rest_of_block[end_marker_pos + len(end_marker):]
-        if remainder.strip():
-            remainder_parts.append(remainder)
+            remainder = content[end_marker_pos + len(REPLACE_MARKER):part_end]
+            if remainder.strip():
+                remainder_parts.append(remainder)
+        marker = next_marker
 
     return sr_blocks, "".join(remainder_parts).strip()
 
-def extract_and_apply_changes(full_text, project_root, readonly_files=None):
+HUNK_HEADER_RE = re.compile(r"@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+DIFF_HEADER_PREFIXES = ("diff ", "index ", "--- ", "+++ ", "new file mode", "deleted file mode",
+                        "similarity index", "old mode", "new mode")
+# Context lines `patch` may ignore at each end of a hunk that does not match exactly.
+MAX_HUNK_FUZZ = 2
+
+def parse_unified_diff_hunks(content: str):
     """
-    Extracts code blocks and writes them to files. Returns a list of operation logs.
+    Parses a block made only of unified diff hunks, optionally after git/diff file headers.
+    Returns a list of hunks, or None if any line does not fit the format (the block is then
+    an ordinary file body). Header line counts are not enforced, since models often get them
+    wrong; each hunk runs to the next header. A hunk is a dict with "header", "old_start",
+    "old_len", "old" and "new" (lists of lines without terminators), the number of
+    unchanged "leading" and "trailing" context lines, and "old_no_newline"/"new_no_newline",
+    set when a "\\ No newline at end of file" marker follows the last old/new line.
     """
-    pattern = re.compile(
-        r"^\s*```(\w*):([^\n]+?)\s*\n"
-        r"(.*?)"
-        r"\n^\s*```end:\2\s*$",
-        re.DOTALL | re.MULTILINE
-    )
+    if "@@ -" not in content:
+        return None
+    hunks = []
+    hunk = None
+    for line in content.split("\n"):
+        header = HUNK_HEADER_RE.match(line)
+        if header:
+            hunk = {
+                "header": header.group(0), "old_start": int(header.group(1)),
+                "old_len": int(header.group(2) or 1), "old": [], "new": [], "tags": [],
+                "old_no_newline": False, "new_no_newline": False,
+            }
+            hunks.append(hunk)
+        elif hunk is None:
+            if line.strip() and not line.startswith(DIFF_HEADER_PREFIXES):
+                return None
+        elif line.startswith("\\"):
+            # "\ No newline at end of file" marks the line before it.
+            if not hunk["tags"]:
+                return None
+            tag = hunk["tags"][-1]
+            hunk["old_no_newline"] |= tag in " -"
+            hunk["new_no_newline"] |= tag in " +"
+        else:
+            tag, text = (line[0], line[1:]) if line else (" ", "")
+            if tag == " ":
+                hunk["old"].append(text)
+                hunk["new"].append(text)
+            elif tag == "-":
+                hunk["old"].append(text)
+            elif tag == "+":
+                hunk["new"].append(text)
+            else:
+                return None
+            hunk["tags"].append(tag)
 
-    project_root_abs = os.path.abspath(project_root)
-    readonly_set = set(readonly_files or [])
-    operation_logs = []
+    for hunk in hunks:
+        tags = hunk.pop("tags")
+        changed = [i for i, tag in enumerate(tags) if tag != " "]
+        if not changed:
+            return None
+        hunk["leading"] = changed[0]
+        hunk["trailing"] = len(tags) - 1 - changed[-1]
+    return hunks or None
 
-    matches = pattern.findall(full_text)
+def apply_unified_diff_hunks(engine, hunks):
+    """
+    Applies hunks, in order, to the current text of a SearchReplaceEngine in one pass over
+    its lines. Like `patch`, each hunk is placed at the matching position nearest to where
+    its header (shifted by the offset of the previous hunk) says it should be, and when no
+    exact match exists up to MAX_HUNK_FUZZ context lines are dropped from each end. Match
+    candidates come from a hash index of the lines, keyed on the rarest line of the hunk.
+    Returns one log dict per hunk. Raises ValueError for an engine over a memory-mapped
+    original, since matching splits the whole text into lines.
+    """
+    if isinstance(engine.original, mmap.mmap):
+        raise ValueError(f"hunks are matched against the whole file, which is not loaded at or above "
+                         f"--mmap-threshold ({len(engine.original)} bytes); apply them with a higher threshold")
+    current = engine.text()
+    newline = current[:0] + ("\n" if isinstance(current, str) else b"\n")
+    lines = current.split(newline)
+    if not current or current.endswith(newline):
+        lines.pop()
+    line_starts = [0]
+    for line in lines:
+        line_starts.append(line_starts[-1] + len(line) + 1)
+    line_starts[-1] = len(current)
+    positions = {}
+    for number, line in enumerate(lines):
+        positions.setdefault(line, []).append(number)
 
-    if not matches:
-        operation_logs.append({
-            "filepath": None,
-            "operation_type": "parse",
-            "status": "error",
-            "message": "No valid code blocks found. Expected format: ```language:path/to/file ... ```end:path/to/file",
-        })
-        return operation_logs
+    def as_lines(texts):
+        return texts if isinstance(current, str) else [text.encode('utf-8', errors='replace') for text in texts]
 
-    for language, filepath, content in matches:
-        filepath = filepath.strip().replace("\\", "/")
-        target_path_abs = os.path.abspath(os.path.join(project_root_abs, filepath))
+    def locate(pattern, expected, min_start):
+        anchor = min(range(len(pattern)), key=lambda k: len(positions.get(pattern[k], ())))
+        best = None
+        for number in positions.get(pattern[anchor], ()):
+            start = number - anchor
+            if start < min_start or start + len(pattern) > len(lines) or lines[start:start + len(pattern)] != pattern:
+                continue
+            if best is None or abs(start - expected) < abs(best - expected):
+                best = start
+        return best
 
-        if not target_path_abs.startswith(project_root_abs):
-            operation_logs.append({
-                "filepath": filepath, "operation_type": "security_check", "status": "error",
-                "message": f"Path traversal attempt: '{filepath}' is outside of the project directory.",
-            })
-            continue
+    hunk_logs = []
+    edits = []          # (first line, line count, replacement lines) in file order
+    min_start = 0       # hunks may not overlap the lines claimed by the previous one
+    carried_offset = 0
+    for i, hunk in enumerate(hunks, 1):
+        old, new = as_lines(hunk["old"]), as_lines(hunk["new"])
+        expected = hunk["old_start"] - 1 if hunk["old_len"] else hunk["old_start"]
+        placement = None
+        for fuzz in range(MAX_HUNK_FUZZ + 1):
+            lead, trail = min(fuzz, hunk["leading"]), min(fuzz, hunk["trailing"])
+            if fuzz and lead + trail == 0:
+                break
+            pattern = old[lead:len(old) - trail]
+            target = expected + carried_offset + lead
+            if pattern:
+                start = locate(pattern, target, min_start)
+            else:
+                start = min(max(target, min_start), len(lines))
+            if start is not None:
+                placement = (start, lead, trail, fuzz, len(pattern))
+                break
 
-        if filepath in readonly_set:
-            operation_logs.append({
-                "filepath": filepath, "operation_type": "security_check", "status": "skipped",
-                "message": f"Attempt to modify a read-only file: {filepath}.",
+        hunk_log = {"hunk": hunk["header"]}
+        if placement is None:
+            hunk_log.update({"status": "not_found", "message": f"Hunk #{i} did not match the file."})
+        else:
+            start, lead, trail, fuzz, length = placement
+            offset = start - lead - expected
+            carried_offset = offset
+            min_start = start + length
+            # A marker on the last line sets how the file ends, unless fuzz dropped that line.
+            ending = None
+            if not trail and (hunk["old_no_newline"] or hunk["new_no_newline"]):
+                ending = not hunk["new_no_newline"]
+            edits.append((start, length, new[lead:len(new) - trail], ending))
+            hunk_log.update({
+                "status": "success", "offset": offset, "fuzz": fuzz,
+                "message": f"Hunk #{i} applied at line {start + 1}" + (
+                    f" (offset {offset}, fuzz {fuzz})." if offset or fuzz else "."),
             })
-            continue
+        hunk_logs.append(hunk_log)
 
-        sr_segments, content_remainder = parse_search_replace_blocks(content)
+    # Splicing from the end keeps earlier line offsets valid.
+    for start, length, replacement, ending in reversed(edits):
+        text = newline.join(replacement) + newline if replacement else current[:0]
+        begin, end = line_starts[start], line_starts[start + length]
+        if end == len(current) and text:
+            # The edit reaches the end of the file: keep an unterminated final line
+            # unterminated unless the hunk's markers say otherwise.
+            unterminated = bool(current) and not current.endswith(newline)
+            if unterminated and begin == end:
+                text = newline + text
+            if ending is False or (ending is None and unterminated):
+                text = text[:-1]
+        engine.splice(begin, end, text)
+    return hunk_logs
 
-        if sr_segments:
-            op_log = {
-                "filepath": filepath, "operation_type": "search_replace", "status": "pending",
-                "message": f"Found {len(sr_segments)} S/R operation(s).", "sr_operations": []
-            }
-            if content_remainder:
-                op_log["message"] += " Warning: Mixed content found and ignored."
+def normalize_whitespace(line):
+    """The form in which lines are compared by the whitespace-tolerant matcher."""
+    return " ".join(line.split())
 
-            if not os.path.exists(target_path_abs):
-                op_log.update({"status": "error", "message": f"File not found for SEARCH/REPLACE: {filepath}"})
-                operation_logs.append(op_log)
-                continue
+def leading_whitespace(line):
+    return line[:len(line) - len(line.lstrip())]
+
+# Originals smaller than this are searched with str.find; larger ones get a line index.
+LINE_INDEX_MIN_SIZE = 64 * 1024
+
+class SearchReplaceEngine:
+    """
+    Applies SEARCH/REPLACE operations to one text with the semantics of repeatedly calling
+    text.replace(search, replace, 1): each search replaces the first occurrence in the text
+    as modified by the operations before it.
+
+    The modified text is a piece table: (start, end) slices of the original interleaved with
+    inserted replacement strings, joined once by text(). Occurrences that lie inside an
+    original slice come from a line-hash offset index of the original (built in one pass),
+    so a multi-line search is located by a dict lookup instead of a scan. Occurrences that
+    overlap inserted text are found by searching small windows around the insertions that
+    precede the first original occurrence, taken from a sorted offset index of the pieces.
+
+    The original may also be bytes or a read-only mmap. str operations are then encoded to
+    UTF-8, and the result is streamed with iter_chunks() instead of being joined in memory.
+    """
+
+    def __init__(self, original):
+        self._empty = original[:0]
+        self._is_text = isinstance(original, str)
+        self._newline = "\n" if self._is_text else b"\n"
+        self.scanned = 0            # characters examined by find(), for --profile
+        self._reset(original)
+
+    def _reset(self, original):
+        self.original = original
+        self._pieces = [(0, len(original))] if original else []
+        self._reindex()
+        self._resume = {}
+        self._line_starts = None
+        self._line_positions = None
+        self._whitespace_index = None
+
+    def apply(self, search, replace):
+        """Replaces the first occurrence of search in the current text. Returns False if it is absent."""
+        if not self._is_text and isinstance(search, str):
+            search = search.encode('utf-8', errors='replace')
+            replace = replace.encode('utf-8', errors='replace')
+        start = self.find(search)
+        if start == -1:
+            return False
+        self.splice(start, start + len(search), replace)
+        return True
+
+    def apply_whitespace_tolerant(self, search, replace):
+        """
+        Fallback for a search that apply() did not find. Matches whole lines with their
+        whitespace normalized, through a hash index of the normalized lines keyed on the
+        rarest search line, and applies the replacement only if exactly one window matches.
+        The index is kept until the text changes, so fallbacks that find nothing to replace
+        do not rebuild it.
+        The replacement is re-indented from the search's indentation to the file's.
+        Returns the number of matching windows (counting stops at 2), so 1 means applied.
+        """
+        if not self._is_text:
+            return 0
+        search_lines = search.split("\n")
+        replace_lines = replace.split("\n")
+        # Blank lines around the search (and the matching ones around the replacement) need not match.
+        while search_lines and not search_lines[0].strip():
+            search_lines.pop(0)
+            if replace_lines and not replace_lines[0].strip():
+                replace_lines.pop(0)
+        while search_lines and not search_lines[-1].strip():
+            search_lines.pop()
+            if replace_lines and not replace_lines[-1].strip():
+                replace_lines.pop()
+        if not search_lines:
+            return 0
+
+        lines, normalized, positions, line_starts = self._normalized_line_index()
+        pattern = [normalize_whitespace(line) for line in search_lines]
+        anchor = min(range(len(pattern)), key=lambda k: len(positions.get(pattern[k], ())))
+        matches = []
+        for number in positions.get(pattern[anchor], ()):
+            first = number - anchor
+            if first >= 0 and normalized[first:first + len(pattern)] == pattern:
+                matches.append(first)
+                if len(matches) > 1:
+                    return len(matches)
+        if not matches:
+            return 0
+
+        first = matches[0]
+        file_indent, search_indent = leading_whitespace(lines[first]), leading_whitespace(search_lines[0])
+        replacement = "\n".join(
+            file_indent + line[len(search_indent):] if line.strip() and line.startswith(search_indent) else line
+            for line in replace_lines
+        )
+        start = line_starts[first]
+        end = line_starts[first + len(pattern)] - 1
+        if not replace_lines and end < line_starts[-1] - 1:
+            end += 1  # a deletion takes its line break with it
+        self.splice(start, end, replacement)
+        return 1
+
+    def text(self):
+        """Returns the modified text."""
+        return self._empty.join(self._piece_text(piece) for piece in self._pieces)
+
+    def iter_chunks(self, chunk_size=WRITE_CHUNK_SIZE):
+        """Yields the modified text in pieces of at most chunk_size, without joining it."""
+        for piece in self._pieces:
+            if isinstance(piece, tuple):
+                for start in range(piece[0], piece[1], chunk_size):
+                    yield self.original[start:min(start + chunk_size, piece[1])]
+            elif piece:
+                yield piece
+
+    def is_unchanged(self):
+        """Returns True if the modified text equals the original, checking only the edited spans."""
+        offset = 0
+        for piece in self._pieces:
+            if isinstance(piece, tuple):
+                if piece[0] != offset:
+                    return False
+                offset = piece[1]
+            else:
+                if self.original[offset:offset + len(piece)] != piece:
+                    return False
+                offset += len(piece)
+        return offset == len(self.original)
+
+    def find(self, search):
+        """Returns the offset of the first occurrence of search in the current text, or -1."""
+        size = len(search)
+        best = self._find_in_original_slices(search)
+
+        # Any other occurrence overlaps an inserted piece (or the seam it left behind), so it
+        # lies within size - 1 characters around one of them; only those starting before best
+        # can come first.
+        inserted, offsets, pieces = self._inserted_indexes, self._offsets, self._pieces
+        count = len(inserted) if best == -1 else bisect.bisect_left(self._inserted_offsets, best + size - 1)
+        k = 0
+        while k < count:
+            i = inserted[k]
+            low = max(0, offsets[i] - (size - 1))
+            if best != -1 and low >= best:
+                break
+            high = min(self._total, offsets[i] + len(pieces[i]) + size - 1)
+            # Overlapping windows of nearby insertions are searched as one.
+            k += 1
+            while k < count and offsets[inserted[k]] - (size - 1) <= high:
+                high = min(self._total, offsets[inserted[k]] + len(pieces[inserted[k]]) + size - 1)
+                k += 1
+            self.scanned += high - low
+            window = self._window(i, low, high) if inserted[k - 1] == i else self._slice(low, high, offsets)
+            found = window.find(search)
+            if found != -1:
+                if best == -1 or low + found < best:
+                    best = low + found
+                break
+        return best
+
+    def splice(self, start, end, replacement):
+        """Replaces the current text between offsets start and end with replacement."""
+        pieces, offsets = self._pieces, self._offsets
+        first = max(0, bisect.bisect_right(offsets, start) - 1)
+        last = bisect.bisect_left(offsets, end, first)
+        before, after = pieces[:first], []
+        for i in range(first, last):
+            piece = pieces[i]
+            piece_start = offsets[i]
+            length = self._piece_length(piece)
+            if piece_start + length <= start:
+                before.append(piece)
+            else:
+                if piece_start < start:
+                    before.append(self._sub_piece(piece, 0, start - piece_start))
+                if piece_start + length > end:
+                    after.append(self._sub_piece(piece, end - piece_start, length))
+
+        # Adjacent inserted pieces are merged, so every inserted piece sits between original slices.
+        middle = replacement
+        if before and not isinstance(before[-1], tuple):
+            middle = before.pop() + middle
+        if after and not isinstance(after[0], tuple):
+            middle = middle + after.pop(0)
+        elif not after and last < len(pieces) and not isinstance(pieces[last], tuple):
+            middle = middle + pieces[last]
+            last += 1
+        self._pieces = before + [middle] + after + pieces[last:]
+        self._reindex()
+        self._whitespace_index = None
+
+    def _reindex(self):
+        """Rebuilds the offsets of the pieces and the sorted indexes of inserted and original ones."""
+        lengths = [piece[1] - piece[0] if isinstance(piece, tuple) else len(piece) for piece in self._pieces]
+        self._offsets = list(itertools.accumulate(lengths, initial=0))
+        self._total = self._offsets.pop()
+        self._inserted_indexes = [i for i, piece in enumerate(self._pieces) if not isinstance(piece, tuple)]
+        self._inserted_offsets = [self._offsets[i] for i in self._inserted_indexes]
+        self._slice_indexes = [i for i, piece in enumerate(self._pieces) if isinstance(piece, tuple)]
+        self._slice_starts = [self._pieces[i][0] for i in self._slice_indexes]
+
+    def _window(self, i, low, high):
+        """The current text from low to high around inserted piece i, cut from its neighbours."""
+        pieces, offsets = self._pieces, self._offsets
+        piece_start, piece_end = offsets[i], offsets[i] + len(pieces[i])
+        before = pieces[i - 1] if i else None
+        after = pieces[i + 1] if i + 1 < len(pieces) else None
+        if (low < piece_start and (before is None or offsets[i - 1] > low)) or \
+                (high > piece_end and (after is None or piece_end + after[1] - after[0] < high)):
+            return self._slice(low, high, offsets)  # a neighbour is shorter than the window
+        left = self.original[before[1] - (piece_start - low):before[1]] if low < piece_start else self._empty
+        right = self.original[after[0]:after[0] + high - piece_end] if high > piece_end else self._empty
+        return left + pieces[i] + right
+
+    def _find_in_original_slices(self, search):
+        pieces, offsets = self._pieces, self._offsets
+        slice_indexes, slice_starts = self._slice_indexes, self._slice_starts
+        size = len(search)
+        # Original slices only ever shrink, so an occurrence that no longer fits inside one
+        # never will again and the next search for the same text can resume past it.
+        for position in self._original_occurrences(search, self._resume.get(search, 0)):
+            k = bisect.bisect_right(slice_starts, position) - 1
+            if k >= 0:
+                i = slice_indexes[k]
+                piece_start, piece_end = pieces[i]
+                if position + size <= piece_end:
+                    self._resume[search] = position
+                    return offsets[i] + position - piece_start
+        self._resume[search] = len(self.original) + 1
+        return -1
+
+    def _original_occurrences(self, search, start):
+        """Yields the offsets of search in the original text from start onwards, in order."""
+        original = self.original
+        parts = search.split(self._newline)
+        if len(parts) >= 3 and isinstance(original, str) and len(original) >= LINE_INDEX_MIN_SIZE:
+            line_starts, line_positions = self._line_index()
+            # Every occurrence contains parts[1:-1] as complete lines; key on the rarest one.
+            key = min(range(1, len(parts) - 1), key=lambda i: len(line_positions.get(parts[i], ())))
+            candidates = line_positions.get(parts[key])
+            if not candidates:
+                return
+            lead = sum(len(part) + 1 for part in parts[:key])
+            first_line = bisect.bisect_left(line_starts, start + lead)
+            for line_number in candidates[bisect.bisect_left(candidates, first_line):]:
+                position = line_starts[line_number] - lead
+                self.scanned += len(search)
+                if original.startswith(search, position):
+                    yield position
+            return
+
+        position = original.find(search, start)
+        while position != -1:
+            self.scanned += position - start + len(search)
+            yield position
+            start = position + 1
+            position = original.find(search, start)
+        self.scanned += max(0, len(original) - start)
+
+    def _line_index(self):
+        if self._line_starts is None:
+            line_starts = []
+            line_positions = {}
+            offset = 0
+            for line_number, line in enumerate(self.original.split(self._newline)):
+                line_starts.append(offset)
+                line_positions.setdefault(line, []).append(line_number)
+                offset += len(line) + 1
+            self._line_starts, self._line_positions = line_starts, line_positions
+        return self._line_starts, self._line_positions
+
+    def _normalized_line_index(self):
+        """
+        Lines of the current text, their normalized forms, {normalized line: [line numbers]}
+        and the offset of every line plus one past the end, for apply_whitespace_tolerant().
+        """
+        if self._whitespace_index is None:
+            lines = self.text().split("\n")
+            normalized = [normalize_whitespace(line) for line in lines]
+            positions = {}
+            line_starts = [0]
+            for number, line in enumerate(normalized):
+                positions.setdefault(line, []).append(number)
+                line_starts.append(line_starts[-1] + len(lines[number]) + 1)
+            self._whitespace_index = lines, normalized, positions, line_starts
+        return self._whitespace_index
+
+    def _slice(self, low, high, offsets):
+        parts = []
+        i = max(0, bisect.bisect_right(offsets, low) - 1)
+        while i < len(self._pieces) and offsets[i] < high:
+            piece = self._pieces[i]
+            length = self._piece_length(piece)
+            if offsets[i] + length > low:
+                parts.append(self._piece_text(self._sub_piece(
+                    piece, max(0, low - offsets[i]), min(length, high - offsets[i]))))
+            i += 1
+        return self._empty.join(parts)
+
+    def _piece_length(self, piece):
+        if isinstance(piece, tuple):
+            return piece[1] - piece[0]
+        return len(piece)
+
+    def _piece_text(self, piece):
+        if isinstance(piece, tuple):
+            return self.original[piece[0]:piece[1]]
+        return piece
+
+    def _sub_piece(self, piece, start, end):
+        if isinstance(piece, tuple):
+            return (piece[0] + start, piece[0] + end)
+        return piece[start:end]
+
+def iter_stream_blocks(chunks):
+    """Yields (language, filepath, content) blocks from an iterable of text chunks as soon as each one is complete."""
+    tokenizer = BlockTokenizer()
+    for chunk in chunks:
+        yield from tokenizer.feed(chunk)
+    yield from tokenizer.close()
+
+def iter_stdin_chunks(stream, chunk_size=STREAM_CHUNK_SIZE):
+    """Yields decoded text from a binary stream as soon as each read returns, without waiting for EOF."""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    read = getattr(stream, 'read1', stream.read)
+    while True:
+        data = read(chunk_size)
+        if not data:
+            break
+        text = decoder.decode(data)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+def decode_text(data):
+    """Decodes file bytes the way open(path, 'r', encoding='utf-8', errors='replace') reads them."""
+    return data.decode('utf-8', errors='replace').replace('\r\n', '\n').replace('\r', '\n')
+
+def encode_text(text):
+    """Encodes text the way open(path, 'w', encoding='utf-8', errors='replace') writes it."""
+    if os.linesep != '\n':
+        text = text.replace('\n', os.linesep)
+    return text.encode('utf-8', errors='replace')
 
+class FileCache:
+    """
+    Raw and decoded file contents kept across requests by the apply server. Entries are
+    validated against (mtime_ns, size, inode) on every use, so external edits are picked up.
+    """
+
+    def __init__(self, max_entries=FILE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def read(self, path):
+        """Returns (bytes, decoded text) for path, reading it only if it changed since last time."""
+        key = self._stat_key(path)
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == key:
+            return entry[1], entry[2]
+        with open(path, 'rb') as f:
+            data = f.read()
+        text = decode_text(data)
+        self._store(path, key, data, text)
+        return data, text
+
+    def update(self, path, data):
+        """Records bytes that were just written to path."""
+        self._store(path, self._stat_key(path), data, decode_text(data))
+
+    def _store(self, path, key, data, text):
+        with self._lock:
+            self._entries.pop(path, None)
+            while len(self._entries) >= self.max_entries:
+                del self._entries[next(iter(self._entries))]
+            self._entries[path] = (key, data, text)
+
+    def _stat_key(self, path):
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+class TargetFile:
+    """
+    In-memory copy of one target file. Every block for the file is applied to this copy, which
+    is read at most once and written back on commit only if its encoded bytes changed.
+
+    Files of at least mmap_threshold bytes are not decoded: they are memory-mapped, edited
+    as bytes, and the result is streamed to a temporary file that replaces the original.
+    With an OverlayFS, the file is read through the overlay and written into it instead.
+    """
+
+    def __init__(self, path, cache=None, mmap_threshold=MMAP_THRESHOLD, overlay=None):
+        self.path = path
+        self.cache = cache          # optional FileCache shared between runs
+        self.overlay = overlay      # optional OverlayFS that receives the writes
+        self.mmap_threshold = mmap_threshold
+        self.mapped = None          # read-only mmap backing the engine in bytes mode
+        self.engine = None          # SearchReplaceEngine over the current content, once known
+        self.disk_bytes = None      # bytes on disk when last read or written, None if absent
+        self.disk_known = False
+        self.dirty = False
+        self.pending_logs = []      # operation logs applied since the last commit
+        self.bytes_read = 0         # running totals, for --profile
+        self.bytes_written = 0
+        self.ledger_pairs = []      # (search, replace) applied in this run, for --ledger
+        self._digest = None
+
+    def exists(self):
+        if self.engine is not None:
+            return True
+        return self.overlay.exists(self.path) if self.overlay is not None else os.path.exists(self.path)
+
+    def load(self):
+        """Returns the engine over the current content, reading the file on first use."""
+        if self.engine is None:
+            self.mapped = self._map_if_large()
+            if self.mapped is not None:
+                self.engine = SearchReplaceEngine(self.mapped)
+                self.bytes_read += len(self.mapped)
+            elif self.overlay is not None:
+                self.disk_bytes = self.overlay.read_bytes(self.path)
+                text = decode_text(self.disk_bytes)
+            elif self.cache is not None:
+                self.disk_bytes, text = self.cache.read(self.path)
+            else:
+                with open(self.path, 'rb') as f:
+                    self.disk_bytes = f.read()
+                text = decode_text(self.disk_bytes)
+            if self.mapped is None:
+                self.disk_known = True
+                self.bytes_read += len(self.disk_bytes)
+                self.engine = SearchReplaceEngine(text)
+        return self.engine
+
+    def digest(self):
+        """SHA-256 of the file as it is on disk, reusing the bytes already read when possible."""
+        if self._digest is None:
+            if self.disk_known and self.disk_bytes is not None:
+                self._digest = hashlib.sha256(self.disk_bytes).hexdigest()
+            elif self.overlay is not None:
+                self._digest = hashlib.sha256(self.overlay.read_bytes(self.path)).hexdigest()
+            else:
+                digest = hashlib.sha256()
+                with open(self.path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(WRITE_CHUNK_SIZE), b""):
+                        digest.update(chunk)
+                self._digest = digest.hexdigest()
+        return self._digest
+
+    def set_content(self, content):
+        self._release_map()
+        self.engine = SearchReplaceEngine(content)
+        self.dirty = True
+
+    def commit(self, transaction=None):
+        """
+        Writes the pending content. Returns True if the file was written, False if the bytes
+        on disk already matched, or None if nothing was pending. With a Transaction, the
+        content is only staged and replaces the file when the transaction commits.
+        """
+        if self.mapped is not None:
+            return self._commit_mapped(transaction)
+        if not self.dirty:
+            return None
+        self.dirty = False
+        self._digest = None
+        text = self.engine.text()
+        self.engine = SearchReplaceEngine(text)
+        data = encode_text(text)
+        if not self.disk_known and self.overlay is not None:
+            try:
+                self.disk_bytes = self.overlay.read_bytes(self.path)
+            except OSError:
+                self.disk_bytes = None
+            self.disk_known = self.disk_bytes is not None
+        elif not self.disk_known:
+            try:
+                # A size mismatch already proves the content changed; only read when it could match.
+                if os.path.getsize(self.path) == len(data):
+                    with open(self.path, 'rb') as f:
+                        self.disk_bytes = f.read()
+                    self.bytes_read += len(self.disk_bytes)
+                else:
+                    self.disk_bytes = None
+            except OSError:
+                self.disk_bytes = None
+            self.disk_known = self.disk_bytes is not None
+        if data == self.disk_bytes:
+            return False
+        self.bytes_written += len(data)
+        if self.overlay is not None:
+            self.overlay.write_bytes(self.path, data)
+            self.disk_bytes = data
+            return True
+        if transaction is not None:
+            transaction.stage(self.path, [data])
+            self.disk_bytes = data
+            self.disk_known = True
+            return True
+        dir_name = os.path.dirname(self.path)
+        if dir_name: os.makedirs(dir_name, exist_ok=True)
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        self.disk_bytes = data
+        if self.cache is not None:
+            self.cache.update(self.path, data)
+        self.disk_known = True
+        return True
+
+    def _map_if_large(self):
+        if self.overlay is not None or not self.mmap_threshold or os.path.getsize(self.path) < self.mmap_threshold:
+            return None
+        with open(self.path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Text mode translates \r and \r\n, so byte and text offsets only agree without them.
+        if mapped.find(b"\r") != -1:
+            mapped.close()
+            return None
+        return mapped
+
+    def _release_map(self):
+        if self.mapped is not None:
+            self.engine = None
+            self.mapped.close()
+            self.mapped = None
+
+    def _commit_mapped(self, transaction):
+        """Streams the edited bytes to a temporary file next to the target and swaps it in."""
+        dirty, self.dirty = self.dirty, False
+        self._digest = None
+        if not dirty or self.engine.is_unchanged():
+            self._release_map()
+            return None if not dirty else False
+        if transaction is not None:
             try:
-                with open(target_path_abs, 'r', encoding='utf-8', errors='replace') as f:
-                    current_file_content = f.read()
-
-                modified_content = current_file_content
-                successful_ops = 0
-
-                for i, (search_text, replace_text) in enumerate(sr_segments):
-                    sr_op_log = {"search_text_preview": search_text[:80].replace(chr(10), '↵') + '...'}
-                    if not search_text:
-                        sr_op_log.update({"status": "skipped", "message": "Search text was empty."})
-                    elif search_text in modified_content:
-                        modified_content = modified_content.replace(search_text, replace_text, 1)
+                transaction.stage(self.path, self._counted_chunks())
+            finally:
+                self._release_map()
+            self.disk_known = False
+            return True
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(self.path)}.", suffix=".tmp",
+                                        dir=os.path.dirname(self.path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in self._counted_chunks():
+                    f.write(chunk)
+            shutil.copymode(self.path, tmp_path)
+            self._release_map()
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            self._release_map()
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self.disk_known = False
+        return True
+
+    def _counted_chunks(self):
+        for chunk in self.engine.iter_chunks():
+            self.bytes_written += len(chunk)
+            yield chunk
+
+class ApplyLedger:
+    """
+    Append-only on-disk set of keys hash(file content, search, replace), one per S/R operation
+    whose result is known to be in a file with that content. A retry that re-sends the same
+    response then recognizes each operation with a dict lookup instead of searching for it.
+    """
+
+    def __init__(self, path, max_entries=LEDGER_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._keys = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(digest, search, replace):
+        data = "\0".join((digest, search, replace)).encode('utf-8', errors='replace')
+        return hashlib.sha256(data).hexdigest()[:32]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._load()
+
+    def record(self, keys):
+        """Adds keys, appending only the ones not already present."""
+        with self._lock:
+            known = self._load()
+            new_keys = [key for key in dict.fromkeys(keys) if key not in known]
+            if not new_keys:
+                return
+            known.update(dict.fromkeys(new_keys))
+            dir_name = os.path.dirname(self.path)
+            if dir_name: os.makedirs(dir_name, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write("".join(key + "\n" for key in new_keys))
+
+    def _load(self):
+        if self._keys is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    keys = [line.strip() for line in f if line.strip()]
+            except FileNotFoundError:
+                keys = []
+            if len(keys) > self.max_entries:
+                keys = keys[-self.max_entries:]
+                # Batch workers share the ledger, so each process compacts through its own file.
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write("".join(key + "\n" for key in keys))
+                os.replace(tmp_path, self.path)
+            self._keys = dict.fromkeys(keys)  # insertion-ordered set
+        return self._keys
+
+JOURNAL_NAME = ".apply-journal.json"
+
+def _fsync_path(path, directory=False):
+    if directory and not hasattr(os, "O_DIRECTORY"):
+        return  # directories cannot be fsynced on this platform
+    fd = os.open(path, os.O_RDONLY | (os.O_DIRECTORY if directory else 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class Transaction:
+    """
+    All-or-nothing set of file writes under one project root. New contents are staged in
+    temporary files next to their targets; commit() fsyncs them in one batch, makes a journal
+    of the pending renames durable, renames every file into place, fsyncs the directories and
+    removes the journal. recover_transaction() uses the journal left by an interrupted run to
+    finish its renames (roll forward) or discard its staged files (roll back).
+    """
+
+    def __init__(self, root, targets):
+        self.root = root
+        self.journal_path = os.path.join(root, JOURNAL_NAME)
+        self.txid = f"{os.getpid()}-{time.time_ns()}"
+        self.staged = []            # (temporary path, target path)
+        self.digests = {}           # target path -> SHA-256 of its staged content
+        self.created_dirs = []      # directories staging created, parents first; removed on rollback
+        self.ledger_entries = []    # (target, [(search, replace), ...]) to record once committed
+        self._lock = threading.Lock()
+        self.targets = list(targets)
+        # Until the commit record replaces it, the journal says which staged files to discard.
+        self._write_journal(self._staging_record())
+
+    @staticmethod
+    def temp_path(path, txid):
+        return os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{txid}.apply-tmp")
+
+    def stage(self, path, chunks):
+        """Writes the new content of path to its temporary file, without syncing it yet."""
+        tmp_path = self.temp_path(path, self.txid)
+        self._make_parent_dirs(os.path.dirname(path))
+        digest = hashlib.sha256()
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+            if os.path.exists(path):
+                shutil.copymode(path, tmp_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        with self._lock:
+            self.staged.append((tmp_path, path))
+            self.digests[path] = digest.hexdigest()
+
+    def defer_ledger(self, target, pairs):
+        """Holds S/R pairs for the ledger until commit() has put the target's content in place."""
+        with self._lock:
+            self.ledger_entries.append((target, pairs))
+
+    def committed_digest(self, target):
+        """SHA-256 of the target's content after a successful commit."""
+        return self.digests.get(target.path) or target.digest()
+
+    def commit(self):
+        for tmp_path, path in self.staged:
+            _fsync_path(tmp_path)
+        self._write_journal({"state": "committing", "txid": self.txid, "renames": self.staged})
+        _finish_renames(self.staged)
+        os.unlink(self.journal_path)
+
+    def rollback(self):
+        for tmp_path, path in self.staged:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        _remove_created_dirs(self.created_dirs)
+        if os.path.exists(self.journal_path):
+            os.unlink(self.journal_path)
+
+    def _staging_record(self):
+        return {"state": "staging", "txid": self.txid, "targets": self.targets, "created_dirs": self.created_dirs}
+
+    def _make_parent_dirs(self, dir_name):
+        if not dir_name or os.path.isdir(dir_name):
+            return
+        with self._lock:
+            missing = []
+            while dir_name != self.root and not os.path.exists(dir_name):
+                missing.append(dir_name)
+                dir_name = os.path.dirname(dir_name)
+            if missing:
+                # Journaled before they exist, so recovery of an interrupted run removes them too.
+                self.created_dirs.extend(reversed(missing))
+                self._write_journal(self._staging_record())
+                os.makedirs(missing[0], exist_ok=True)
+
+    def _write_journal(self, record):
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+        _fsync_path(self.root, directory=True)
+
+def _remove_created_dirs(created_dirs):
+    for directory in reversed(created_dirs):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass  # already gone, or something else has been put there since
+
+def _finish_renames(renames):
+    directories = set()
+    for tmp_path, path in renames:
+        if os.path.exists(tmp_path):
+            os.replace(tmp_path, path)
+        directories.add(os.path.dirname(path) or ".")
+    for directory in directories:
+        _fsync_path(directory, directory=True)
+
+def _is_under(path, root):
+    return isinstance(path, str) and os.path.isabs(path) and os.path.commonpath([root, os.path.abspath(path)]) == root
+
+def _check_journal(record, project_root_abs):
+    """
+    Raises ValueError unless a journal only names files that this module could have staged
+    under project_root_abs: targets inside the root and their own temporary files. The journal
+    is read from the project itself, so it must not be able to rename or delete anything else.
+    """
+    if not isinstance(record, dict) or record.get("state") not in ("staging", "committing"):
+        raise ValueError("unrecognized journal record")
+    txid = record.get("txid")
+    if not isinstance(txid, str) or not txid or "/" in txid or os.sep in txid or txid in (".", ".."):
+        raise ValueError(f"invalid transaction id {txid!r}")
+    if record["state"] == "committing":
+        renames = record.get("renames")
+        if not isinstance(renames, list):
+            raise ValueError("journal has no renames")
+        for entry in renames:
+            if not (isinstance(entry, list) and len(entry) == 2 and _is_under(entry[1], project_root_abs)
+                    and entry[0] == Transaction.temp_path(entry[1], txid)):
+                raise ValueError(f"journal rename {entry!r} is not a staged file inside the project")
+    else:
+        targets = record.get("targets", [])
+        if not isinstance(targets, list) or not all(_is_under(path, project_root_abs) for path in targets):
+            raise ValueError("journal names a target outside the project")
+        created_dirs = record.get("created_dirs", [])
+        if not isinstance(created_dirs, list) or not all(
+                _is_under(path, project_root_abs) and os.path.abspath(path) != project_root_abs for path in created_dirs):
+            raise ValueError("journal names a directory outside the project")
+
+def recover_transaction(project_root_abs):
+    """
+    Completes or undoes a transaction that a previous run left behind in project_root_abs.
+    Returns an operation log describing what was done, or None if there was nothing to do.
+    Raises ValueError, leaving everything in place, if the journal is not one this module wrote.
+    """
+    journal_path = os.path.join(project_root_abs, JOURNAL_NAME)
+    if not os.path.exists(journal_path):
+        return None
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        record = json.load(f)
+    _check_journal(record, project_root_abs)
+    if record["state"] == "committing":
+        _finish_renames(record["renames"])
+        message = f"Rolled forward an interrupted transaction ({len(record['renames'])} file(s))."
+    else:
+        for path in record.get("targets", ()):
+            tmp_path = Transaction.temp_path(path, record.get("txid"))
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        _remove_created_dirs(record.get("created_dirs", []))
+        message = "Rolled back an interrupted transaction; no files had been replaced."
+    os.unlink(journal_path)
+    return {"filepath": None, "operation_type": "recovery", "status": "success", "message": message}
+
+class ApplyProfile:
+    """
+    Per-phase wall time and byte counters collected by --profile. Shared by the worker
+    threads of one run, so updates are locked.
+    """
+    PHASES = ("parse", "read", "match", "write")
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(self.PHASES, 0.0)
+        self.scan_chars = 0
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def add(self, phase, seconds, scan_chars=0):
+        with self._lock:
+            self.seconds[phase] += seconds
+            self.scan_chars += scan_chars
+
+    def summary(self, operation_logs):
+        """Returns the "profile" entry of the final result."""
+        profiles = [op["profile"] for op in operation_logs if "profile" in op]
+        return {
+            "total_ms": round((time.perf_counter() - self._started) * 1000, 3),
+            "phases_ms": {phase: round(seconds * 1000, 3) for phase, seconds in self.seconds.items()},
+            "bytes_read": sum(p["bytes_read"] for p in profiles),
+            "bytes_written": sum(p["bytes_written"] for p in profiles),
+            "scan_chars": self.scan_chars,
+        }
+
+def resolve_target(filepath, project_root_abs, readonly_set):
+    """
+    Normalizes a block's filepath and checks that it may be modified.
+    Returns (filepath, absolute target path, error log or None).
+    """
+    filepath = filepath.strip().replace("\\", "/")
+    target_path_abs = os.path.abspath(os.path.join(project_root_abs, filepath))
+
+    if not target_path_abs.startswith(project_root_abs):
+        return filepath, target_path_abs, {
+            "filepath": filepath, "operation_type": "security_check", "status": "error",
+            "message": f"Path traversal attempt: '{filepath}' is outside of the project directory.",
+        }
+
+    if filepath in readonly_set:
+        return filepath, target_path_abs, {
+            "filepath": filepath, "operation_type": "security_check", "status": "skipped",
+            "message": f"Attempt to modify a read-only file: {filepath}.",
+        }
+    return filepath, target_path_abs, None
+
+def apply_block(target, filepath, content, profile=None, ledger=None, whitespace_fallback=False):
+    """
+    Applies a single fenced block to the in-memory copy of its target file. Returns its operation log.
+    With a profile, the log and each S/R entry also carry a "profile" dict of timings and counters.
+    With a ledger, S/R operations it records for the file's content are reported as already_applied.
+    With whitespace_fallback, a search that is not found exactly is retried ignoring whitespace.
+    """
+    if profile is not None:
+        started = time.perf_counter()
+        read_before = target.bytes_read
+    sr_segments, content_remainder = parse_search_replace_blocks(content)
+    hunks = None
+    if not sr_segments and not filepath.endswith((".diff", ".patch")):
+        hunks = parse_unified_diff_hunks(content)
+    if profile is None:
+        return _apply_parsed_block(target, filepath, content, sr_segments, content_remainder, hunks, None, ledger,
+                                   whitespace_fallback)
+
+    parsed = time.perf_counter()
+    profile.add("parse", parsed - started)
+    op_log = _apply_parsed_block(target, filepath, content, sr_segments, content_remainder, hunks, profile, ledger,
+                                 whitespace_fallback)
+    op_log["profile"] = {
+        "wall_ms": round((time.perf_counter() - started) * 1000, 3),
+        "bytes_read": target.bytes_read - read_before,
+        "bytes_written": 0,
+        "scan_chars": sum(sr_op["profile"]["scan_chars"] for sr_op in op_log.get("sr_operations", ())),
+    }
+    return op_log
+
+def _load_target(target, profile):
+    if profile is None:
+        return target.load()
+    started = time.perf_counter()
+    engine = target.load()
+    profile.add("read", time.perf_counter() - started)
+    return engine
+
+def _apply_parsed_block(target, filepath, content, sr_segments, content_remainder, hunks, profile, ledger,
+                        whitespace_fallback):
+    if sr_segments:
+        op_log = {
+            "filepath": filepath, "operation_type": "search_replace", "status": "pending",
+            "message": f"Found {len(sr_segments)} S/R operation(s).", "sr_operations": []
+        }
+        if content_remainder:
+            op_log["message"] += " Warning: Mixed content found and ignored."
+
+        if not target.exists():
+            op_log.update({"status": "error", "message": f"File not found for SEARCH/REPLACE: {filepath}"})
+            return op_log
+
+        try:
+            engine = _load_target(target, profile)
+            digest = target.digest() if ledger is not None else None
+            successful_ops = 0
+            already_applied = 0
+
+            for i, (search_text, replace_text) in enumerate(sr_segments):
+                sr_op_log = {"search_text_preview": search_text[:80].replace(chr(10), '↵') + '...'}
+                if profile is not None:
+                    op_started, scanned_before = time.perf_counter(), engine.scanned
+                if not search_text:
+                    sr_op_log.update({"status": "skipped", "message": "Search text was empty."})
+                elif digest is not None and ApplyLedger.key(digest, search_text, replace_text) in ledger:
+                    already_applied += 1
+                    target.ledger_pairs.append((search_text, replace_text))
+                    sr_op_log.update({"status": "already_applied", "message": f"Replacement #{i+1} was already applied."})
+                elif engine.apply(search_text, replace_text):
+                    successful_ops += 1
+                    if ledger is not None:
+                        target.ledger_pairs.append((search_text, replace_text))
+                    sr_op_log.update({"status": "success", "message": f"Replacement #{i+1} applied."})
+                else:
+                    windows = engine.apply_whitespace_tolerant(search_text, replace_text) if whitespace_fallback else 0
+                    if windows == 1:
                         successful_ops += 1
-                        sr_op_log.update({"status": "success", "message": f"Replacement #{i+1} applied."})
+                        if ledger is not None:
+                            target.ledger_pairs.append((search_text, replace_text))
+                        sr_op_log.update({"status": "success", "match": "whitespace",
+                                          "message": f"Replacement #{i+1} applied ignoring whitespace differences."})
+                    elif windows > 1:
+                        sr_op_log.update({"status": "not_found", "message": f"Search text for operation #{i+1} not found; "
+                                          "ignoring whitespace it matches more than one place."})
                     else:
                         sr_op_log.update({"status": "not_found", "message": f"Search text for operation #{i+1} not found."})
-                    op_log["sr_operations"].append(sr_op_log)
-
-                if successful_ops > 0:
-                    with open(target_path_abs, 'w', encoding='utf-8', errors='replace') as f:
-                        f.write(modified_content)
-                    op_log.update({
-                        "status": "success",
-                        "message": f"Successfully applied {successful_ops}/{len(sr_segments)} S/R operation(s)."
-                    })
-                else:
-                    op_log.update({
-                        "status": "skipped",
-                        "message": "No search texts found; no changes made."
-                    })
-                operation_logs.append(op_log)
-            except (OSError, Exception) as e:
-                op_log.update({"status": "error", "message": f"Error during S/R: {e}"})
-                operation_logs.append(op_log)
-        else: # Normal write mode
-            op_log = {"filepath": filepath, "operation_type": "write", "status": "pending"}
-            try:
-                dir_name = os.path.dirname(target_path_abs)
-                if dir_name: os.makedirs(dir_name, exist_ok=True)
-                with open(target_path_abs, 'w', encoding='utf-8', errors='replace') as f:
-                    f.write(content)
-                op_log.update({"status": "success", "message": f"Successfully wrote {len(content)} characters."})
-                operation_logs.append(op_log)
-            except (OSError, Exception) as e:
+                if profile is not None:
+                    elapsed = time.perf_counter() - op_started
+                    sr_op_log["profile"] = {"wall_ms": round(elapsed * 1000, 3), "scan_chars": engine.scanned - scanned_before}
+                    profile.add("match", elapsed, scan_chars=engine.scanned - scanned_before)
+                op_log["sr_operations"].append(sr_op_log)
+
+            if successful_ops > 0:
+                target.dirty = True
+                op_log.update({
+                    "status": "success",
+                    "message": f"Successfully applied {successful_ops}/{len(sr_segments)} S/R operation(s)."
+                })
+                if already_applied:
+                    op_log["message"] += f" {already_applied} already applied."
+            elif already_applied:
+                op_log.update({
+                    "status": "already_applied",
+                    "message": f"{already_applied}/{len(sr_segments)} S/R operation(s) were already applied; no changes made."
+                })
+            else:
+                op_log.update({
+                    "status": "skipped",
+                    "message": "No search texts found; no changes made."
+                })
+        except (OSError, Exception) as e:
+            op_log.update({"status": "error", "message": f"Error during S/R: {e}"})
+        return op_log
+
+    if hunks:
+        op_log = {
+            "filepath": filepath, "operation_type": "unified_diff", "status": "pending",
+            "message": f"Found {len(hunks)} hunk(s).", "hunk_operations": []
+        }
+        try:
+            if not target.exists():
+                if any(hunk["old"] for hunk in hunks):
+                    op_log.update({"status": "error", "message": f"File not found for unified diff: {filepath}"})
+                    return op_log
+                target.set_content("")  # a diff against /dev/null creates the file
+            engine = _load_target(target, profile)
+            if profile is not None:
+                hunks_started = time.perf_counter()
+            op_log["hunk_operations"] = apply_unified_diff_hunks(engine, hunks)
+            if profile is not None:
+                profile.add("match", time.perf_counter() - hunks_started)
+            applied = sum(1 for hunk_log in op_log["hunk_operations"] if hunk_log["status"] == "success")
+            if applied > 0:
+                target.dirty = True
+                op_log.update({"status": "success", "message": f"Successfully applied {applied}/{len(hunks)} hunk(s)."})
+            else:
+                op_log.update({"status": "skipped", "message": "No hunks matched; no changes made."})
+        except (OSError, Exception) as e:
+            op_log.update({"status": "error", "message": f"Error applying unified diff: {e}"})
+        return op_log
+    else: # Normal write mode
+        target.set_content(content)
+        return {"filepath": filepath, "operation_type": "write", "status": "success",
+                "message": f"Successfully wrote {len(content)} characters."}
+
+def commit_target(target, profile=None, ledger=None, transaction=None):
+    """
+    Writes a target file and folds the outcome into the logs of the operations it carries.
+    With a ledger, the S/R operations now in the file are recorded against its new content.
+    """
+    logs, target.pending_logs = target.pending_logs, []
+    if profile is not None:
+        started, read_before, written_before = time.perf_counter(), target.bytes_read, target.bytes_written
+    try:
+        written = target.commit(transaction)
+    except (OSError, Exception) as e:
+        for op_log in logs:
+            if op_log["status"] != "success":
+                continue
+            if op_log["operation_type"] == "write":
                 op_log.update({"status": "error", "message": f"Error writing file: {e}"})
-                operation_logs.append(op_log)
+            elif op_log["operation_type"] == "unified_diff":
+                op_log.update({"status": "error", "message": f"Error applying unified diff: {e}"})
+            else:
+                op_log.update({"status": "error", "message": f"Error during S/R: {e}"})
+        return
+    if written is False and logs:
+        logs[-1]["message"] += " File content unchanged; write skipped."
+    if ledger is not None and target.ledger_pairs:
+        # Every operation applied so far in this run is in the new content, not only the latest ones.
+        if transaction is not None:
+            # Staged content may still be rolled back; keys are recorded once it is committed.
+            transaction.defer_ledger(target, list(target.ledger_pairs))
+        else:
+            _record_ledger(ledger, target.digest, target.ledger_pairs)
+    if profile is not None and logs:
+        elapsed = time.perf_counter() - started
+        profile.add("write", elapsed)
+        # The file is written once for all of its operations; the cost is charged to the last one.
+        logs[-1]["profile"].update({
+            "write_ms": round(elapsed * 1000, 3),
+            "bytes_read": logs[-1]["profile"]["bytes_read"] + target.bytes_read - read_before,
+            "bytes_written": target.bytes_written - written_before,
+        })
+
+def _record_ledger(ledger, digest, pairs):
+    """Records pairs against the content whose SHA-256 digest() returns."""
+    try:
+        ledger.record([ApplyLedger.key(digest(), search, replace) for search, replace in pairs])
+    except OSError:
+        pass  # the ledger only speeds up retries; failing to update it must not fail the apply
+
+def apply_blocks(blocks, project_root, readonly_files=None, on_operation=None, write_through=False, jobs=1,
+                 file_cache=None, mmap_threshold=MMAP_THRESHOLD, profile=None, ledger=None, whitespace_fallback=False,
+                 atomic=False, overlay=None):
+    """
+    Applies blocks in order as they are produced by the iterable. Returns a list of operation logs.
+
+    Blocks for the same file are applied to one in-memory copy that is read once. By default each
+    file is written once after all its blocks are applied, and with jobs > 1 independent files are
+    processed concurrently on a thread pool; logs always come back in input order. With
+    write_through, blocks are applied one at a time and each file is written after every block.
+    on_operation, if given, is called with each log as soon as its file is on disk: in input
+    order with write_through, in completion order otherwise (never concurrently).
+    file_cache, if given, is a FileCache that lets repeated runs skip unchanged reads. Files of at
+    least mmap_threshold bytes are edited through a memory map instead of being decoded. profile,
+    if given, is an ApplyProfile that collects timings and counters (see apply_block). ledger, if
+    given, is an ApplyLedger that makes re-applying the same S/R operations a lookup.
+    whitespace_fallback enables the whitespace-tolerant matcher for searches not found exactly.
+
+    With atomic, either every file is replaced or none is: writes are staged and committed as
+    one Transaction once all blocks are applied, and if any operation failed the staged files
+    are discarded and the successful operations are reported as rolled_back. A transaction
+    interrupted by a crash is recovered before anything else is applied to the project.
+
+    With overlay, an OverlayFS over project_root, files are read through the overlay and
+    written into it; nothing on disk is modified.
+    """
+    project_root_abs = os.path.abspath(project_root)
+    readonly_set = set(readonly_files or [])
+    if atomic and write_through:
+        raise ValueError("Atomic transactions cannot be combined with write-through application.")
+    if overlay is not None and (atomic or overlay.root != project_root_abs):
+        raise ValueError("An overlay must cover project_root and cannot be combined with atomic transactions.")
+
+    try:
+        recovery_log = recover_transaction(project_root_abs) if overlay is None else None
+    except (OSError, ValueError, KeyError) as e:
+        # Applying on top of a half-finished transaction could mix two responses; stop instead.
+        op_log = {"filepath": None, "operation_type": "recovery", "status": "error",
+                  "message": f"Could not recover the interrupted transaction in {JOURNAL_NAME}: {e}"}
+        if on_operation:
+            on_operation(op_log)
+        return [op_log]
+    if recovery_log and on_operation:
+        on_operation(recovery_log)
+
+    if write_through:
+        operation_logs = _apply_blocks_write_through(blocks, project_root_abs, readonly_set, on_operation, file_cache,
+                                                     overlay, mmap_threshold, profile, ledger, whitespace_fallback)
+    else:
+        operation_logs = _apply_blocks_grouped(blocks, project_root_abs, readonly_set, on_operation, jobs, file_cache,
+                                               overlay, mmap_threshold, profile, ledger, whitespace_fallback, atomic)
+
+    if not operation_logs:
+        op_log = {
+            "filepath": None,
+            "operation_type": "parse",
+            "status": "error",
+            "message": "No valid code blocks found. Expected format: ```language:path/to/file ... ```end:path/to/file",
+        }
+        operation_logs.append(op_log)
+        if on_operation:
+            on_operation(op_log)
+    if recovery_log:
+        operation_logs.insert(0, recovery_log)
+    return operation_logs
+
+def _apply_blocks_write_through(blocks, project_root_abs, readonly_set, on_operation, file_cache, overlay,
+                                mmap_threshold, profile, ledger, whitespace_fallback):
+    targets = {}
+    operation_logs = []
+    for language, filepath, content in blocks:
+        filepath, target_path_abs, op_log = resolve_target(filepath, project_root_abs, readonly_set)
+        if op_log is None:
+            target = targets.get(target_path_abs)
+            if target is None:
+                target = targets[target_path_abs] = TargetFile(target_path_abs, file_cache, mmap_threshold, overlay)
+            op_log = apply_block(target, filepath, content, profile, ledger, whitespace_fallback)
+            target.pending_logs.append(op_log)
+            commit_target(target, profile, ledger)
+        operation_logs.append(op_log)
+        if on_operation:
+            on_operation(op_log)
     return operation_logs
 
+def _apply_blocks_grouped(blocks, project_root_abs, readonly_set, on_operation, jobs, file_cache, overlay,
+                          mmap_threshold, profile, ledger, whitespace_fallback, atomic):
+    operation_logs = []
+    groups = {}  # target path -> [(log index, filepath, content), ...] in input order
+    report_lock = threading.Lock()
+    for language, filepath, content in blocks:
+        filepath, target_path_abs, op_log = resolve_target(filepath, project_root_abs, readonly_set)
+        if op_log is None:
+            groups.setdefault(target_path_abs, []).append((len(operation_logs), filepath, content))
+        elif on_operation and not atomic:
+            on_operation(op_log)
+        operation_logs.append(op_log)
+    transaction = Transaction(project_root_abs, groups) if atomic and groups else None
+
+    def apply_group(item):
+        target_path_abs, entries = item
+        target = TargetFile(target_path_abs, file_cache, mmap_threshold, overlay)
+        for index, filepath, content in entries:
+            op_log = apply_block(target, filepath, content, profile, ledger, whitespace_fallback)
+            target.pending_logs.append(op_log)
+            operation_logs[index] = op_log
+        logs = list(target.pending_logs)
+        commit_target(target, profile, ledger, transaction)
+        if on_operation and not atomic:
+            with report_lock:
+                for op_log in logs:
+                    on_operation(op_log)
+
+    if jobs > 1 and len(groups) > 1:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            # list() re-raises any unexpected worker exception here.
+            list(pool.map(apply_group, groups.items()))
+    else:
+        for item in groups.items():
+            apply_group(item)
+
+    if atomic:
+        if transaction is not None:
+            _finish_transaction(transaction, operation_logs, ledger)
+        if on_operation:
+            for op_log in operation_logs:
+                on_operation(op_log)
+    return operation_logs
+
+def _finish_transaction(transaction, operation_logs, ledger=None):
+    failed = any(op_log["status"] == "error" for op_log in operation_logs)
+    if not failed:
+        try:
+            transaction.commit()
+        except OSError as e:
+            # The journal, if it was written, lets the next run roll the renames forward.
+            for op_log in operation_logs:
+                if op_log["status"] == "success":
+                    op_log.update({"status": "error", "message": f"Transaction commit failed: {e}"})
+            return
+        if ledger is not None:
+            for target, pairs in transaction.ledger_entries:
+                _record_ledger(ledger, lambda: transaction.committed_digest(target), pairs)
+        return
+    transaction.rollback()
+    for op_log in operation_logs:
+        if op_log["status"] == "success":
+            op_log.update({"status": "rolled_back",
+                           "message": op_log["message"] + " Not written: another operation failed."})
+
+def extract_and_apply_changes(full_text, project_root, readonly_files=None, jobs=1, file_cache=None,
+                              mmap_threshold=MMAP_THRESHOLD, on_operation=None, profile=None, ledger=None,
+                              whitespace_fallback=False, atomic=False, overlay=None):
+    """
+    Extracts code blocks and writes them to files, or into overlay if one is given.
+    Returns a list of operation logs.
+    """
+    if profile is None:
+        blocks = tokenize_blocks(full_text)
+    else:
+        started = time.perf_counter()
+        blocks = tokenize_blocks(full_text)
+        profile.add("parse", time.perf_counter() - started)
+    return apply_blocks(blocks, project_root, readonly_files, on_operation=on_operation, jobs=jobs,
+                        file_cache=file_cache, mmap_threshold=mmap_threshold, profile=profile, ledger=ledger,
+                        whitespace_fallback=whitespace_fallback, atomic=atomic, overlay=overlay)
+
+def build_final_result(operation_logs):
+    """Builds the summary dict printed by main() from a list of operation logs."""
+    has_errors = any(op.get('status') == 'error' for op in operation_logs)
+    return {
+        "status": "error" if has_errors else "success",
+        "summary": f"Processed {len(operation_logs)} operation(s).",
+        "operations": operation_logs
+    }
+
+def apply_response(text, project_root, readonly_files=None, jobs=1, file_cache=None, on_operation=None,
+                   mmap_threshold=MMAP_THRESHOLD, profile=False, ledger_path=None, whitespace_fallback=False,
+                   atomic=False, dry_run=False):
+    """
+    Applies one response with the options main() accepts and returns the result dict it prints.
+    With dry_run, edits go into an OverlayFS and the result carries its "patch" instead of
+    files being written; with profile, it carries the "profile" summary.
+    """
+    apply_profile = ApplyProfile() if profile else None
+    overlay = OverlayFS(project_root) if dry_run else None
+    operation_logs = extract_and_apply_changes(
+        text, project_root, readonly_files=readonly_files, jobs=jobs, file_cache=file_cache,
+        mmap_threshold=mmap_threshold, on_operation=on_operation, profile=apply_profile,
+        ledger=open_ledger(ledger_path) if ledger_path else None,
+        whitespace_fallback=whitespace_fallback, atomic=atomic, overlay=overlay
+    )
+    final_result = build_final_result(operation_logs)
+    if overlay is not None:
+        final_result["patch"] = overlay.diff()
+    if apply_profile is not None:
+        final_result["profile"] = apply_profile.summary(operation_logs)
+    return final_result
+
+@functools.lru_cache(maxsize=8)
+def open_ledger(path):
+    """One ApplyLedger per path and process, so the server and batch workers load it once."""
+    return ApplyLedger(path)
+
+def response_options(args):
+    """The apply_response keyword arguments selected on the command line."""
+    return {
+        "mmap_threshold": args.mmap_threshold, "profile": args.profile, "ledger_path": args.ledger,
+        "whitespace_fallback": args.whitespace_fallback, "atomic": args.atomic, "dry_run": args.dry_run,
+    }
+
+def build_summary_event(final_result):
+    """
+    Returns the payload of an NDJSON "summary" event: the result dict with its operations, which
+    were already sent as events, replaced by their count and a count per status.
+    """
+    summary = {key: value for key, value in final_result.items() if key != "operations"}
+    operations = final_result.get("operations", [])
+    summary["operation_count"] = len(operations)
+    summary["operation_status"] = dict(collections.Counter(op.get("status") for op in operations))
+    return summary
+
+def print_result(final_result, output_format="json"):
+    """Prints a result dict as indented JSON, or as the closing NDJSON summary event."""
+    if output_format == "ndjson":
+        write_event("summary", build_summary_event(final_result))
+    else:
+        json.dump(final_result, sys.stdout, indent=2)
+
+def write_event(event, payload, out=None):
+    """Writes one compact NDJSON event line and flushes it immediately."""
+    out = out or sys.stdout
+    out.write(json.dumps({"event": event, **payload}) + "\n")
+    out.flush()
+
 def main():
     parser = argparse.ArgumentParser(
         description="Extracts and applies code changes from text. Outputs a JSON result."
@@ -188,22 +1682,149 @@ def main():
         help="A list of file paths that should not be modified."
     )
     parser.add_argument("-c", "--clipboard", action="store_true", help="Read from clipboard")
+    parser.add_argument(
+        "--jobs", type=int, default=1, metavar="N",
+        help="Apply independent files concurrently on N threads (batch mode only; default: 1)."
+    )
+    parser.add_argument(
+        "--mmap-threshold", type=int, default=MMAP_THRESHOLD, metavar="BYTES",
+        help=f"Edit files of at least this size as memory-mapped bytes (default: {MMAP_THRESHOLD}; 0 disables)."
+    )
+    parser.add_argument(
+        "--serve", metavar="SOCKET_PATH",
+        help="Run a persistent apply server on a Unix socket (see apply_client.py)."
+    )
+    parser.add_argument(
+        "--output", choices=("json", "ndjson"), default="json",
+        help="json prints one result at the end; ndjson emits an event per operation as its file is "
+             "written, then a summary event (default: json)."
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="Add wall time, bytes read/written and match scan length to every operation, "
+             "and a per-phase breakdown to the summary."
+    )
+    parser.add_argument(
+        "--ledger", default=os.environ.get("APPLY_LEDGER"), metavar="PATH",
+        help="Ledger file that lets a retry recognize S/R operations it already applied "
+             "(default: $APPLY_LEDGER; off when unset)."
+    )
+    parser.add_argument(
+        "--whitespace-fallback", action="store_true",
+        help="Retry SEARCH texts that are not found exactly while ignoring indentation and other "
+             "whitespace; applied only when exactly one place matches."
+    )
+    parser.add_argument(
+        "--atomic", action="store_true",
+        help="Replace all files or none: stage writes and commit them through a journal once every "
+             "operation has succeeded (batch mode only)."
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true",
+        help="Apply into an in-memory overlay of the project and add the resulting unified diff to "
+             "the result as \"patch\"; no files are modified (batch mode only)."
+    )
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="Apply each block from stdin as soon as its end marker arrives and emit NDJSON events."
+    )
+
+    parser.add_argument(
+        "--batch", metavar="MANIFEST",
+        help="Apply every {project_root, response, readonly_files} record of a JSONL manifest."
+    )
+    parser.add_argument(
+        "--batch-output", default="-", metavar="PATH",
+        help="JSONL file for --batch per-record results (default: stdout, with the summary on stderr)."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, metavar="N",
+        help="Processes used by --batch (default: CPU count)."
+    )
 
     candidate_group = parser.add_mutually_exclusive_group()
-    candidate_group.add_argument("-1", "--candidate1", action="store_true", help="Save to candidates/implementation_1.txt")
-    candidate_group.add_argument("-2", "--candidate2", action="store_true", help="Save to candidates/implementation_2.txt")
-    candidate_group.add_argument("-3", "--candidate3", action="store_true", help="Save to candidates/implementation_3.txt")
-    candidate_group.add_argument("-4", "--candidate4", action="store_true", help="Save to candidates/implementation_4.txt")
-    candidate_group.add_argument("-5", "--candidate5", action="store_true", help="Save to candidates/implementation_5.txt")
+    candidate_group.add_argument(
+        "-s", "--save-candidate", action="store_true",
+        help="Save the input to the candidate store instead of applying it."
+    )
+    candidate_group.add_argument("--apply-candidate", metavar="ID", help="Apply a stored candidate (id or unique prefix).")
+    candidate_group.add_argument("--list-candidates", action="store_true", help="List stored candidates.")
+    candidate_group.add_argument(
+        "--diff-candidates", nargs=2, metavar=("OLD_ID", "NEW_ID"),
+        help="Print a unified diff between two stored candidates."
+    )
+    parser.add_argument(
+        "--candidate-store", default=DEFAULT_STORE_DIR, metavar="DIR",
+        help=f"Candidate store directory (default: {DEFAULT_STORE_DIR})."
+    )
+    parser.add_argument("--model", help="Model recorded by --save-candidate, or filter for --list-candidates.")
+    parser.add_argument(
+        "--tag", action="append", default=[],
+        help="Tag recorded by --save-candidate, or filter for --list-candidates (repeatable)."
+    )
 
     args = parser.parse_args()
 
+    candidate_action = args.save_candidate or args.apply_candidate or args.list_candidates or args.diff_candidates
+    if args.serve or args.batch:
+        mode = "--serve" if args.serve else "--batch"
+        if args.readonly_files:
+            parser.error(f"{mode} takes readonly files from each request and cannot be combined with --readonly-files.")
+        if args.output != "json":
+            parser.error(f"{mode} returns one JSON result per request and cannot be combined with --output ndjson.")
+        if args.atomic and args.dry_run:
+            parser.error("--dry-run does not write files and cannot be combined with --atomic.")
+    if args.serve:
+        if args.batch or args.stream or args.clipboard or candidate_action:
+            parser.error("--serve cannot be combined with --batch, --stream, --clipboard or candidate flags.")
+        try:
+            serve(args.serve, response_options(args))
+        except KeyboardInterrupt:
+            pass
+        except (RuntimeError, OSError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+
     final_result = {}
 
     try:
-        candidate_number = next((i for i, c in enumerate([args.candidate1, args.candidate2, args.candidate3, args.candidate4, args.candidate5], 1) if c), None)
+        if args.jobs < 1:
+            parser.error("--jobs must be at least 1.")
+
+        if args.batch:
+            if args.stream or args.clipboard or candidate_action:
+                parser.error("--batch reads its manifest and cannot be combined with --stream, --clipboard or candidate flags.")
+            if args.workers < 1:
+                parser.error("--workers must be at least 1.")
+            return batch_main(args)
+        if args.stream:
+            if args.clipboard or candidate_action:
+                parser.error("--stream reads from stdin and cannot be combined with --clipboard or candidate flags.")
+            if args.atomic or args.dry_run:
+                parser.error("--stream writes each block as it arrives and cannot be combined with --atomic or --dry-run.")
+            return stream_main(args)
+        if args.atomic and args.dry_run:
+            parser.error("--dry-run does not write files and cannot be combined with --atomic.")
+        if args.clipboard and args.apply_candidate:
+            parser.error("--apply-candidate reads from the candidate store and cannot be combined with --clipboard.")
 
-        if args.clipboard:
+        store = CandidateStore(args.candidate_store)
+        if args.list_candidates:
+            candidates = store.list(tags=args.tag, model=args.model)
+            print_result({"status": "success", "summary": f"{len(candidates)} candidate(s) in {store.root}.",
+                          "operations": [], "candidates": candidates}, args.output)
+            return
+        if args.diff_candidates:
+            diff = store.diff(*args.diff_candidates)
+            stats = diff_stats(*(store.load(candidate) for candidate in args.diff_candidates))
+            summary = f"Candidates differ (+{stats.additions} -{stats.deletions} lines)." if diff else "Candidates are identical."
+            print_result({"status": "success", "summary": summary, "operations": [], "diff": diff}, args.output)
+            return
+
+        if args.apply_candidate:
+            full_input_text = store.load(args.apply_candidate)
+        elif args.clipboard:
             full_input_text = get_clipboard_content()
         else:
             full_input_text = sys.stdin.read()
@@ -211,34 +1832,282 @@ def main():
         if not full_input_text.strip():
             raise ValueError("No input received.")
 
-        if candidate_number:
-            success, message = save_full_content_to_candidate_file(full_input_text, candidate_number)
-            final_result = {"status": "success" if success else "error", "summary": message, "operations": []}
+        if args.save_candidate:
+            entry = store.save(full_input_text, model=args.model, tags=args.tag)
+            final_result = {"status": "success", "summary": f"Saved candidate {entry['id'][:12]} to {store.root}.",
+                            "operations": [], "candidate": entry}
         else:
-            project_root = os.getcwd()
-            operation_logs = extract_and_apply_changes(full_input_text, project_root, readonly_files=args.readonly_files)
-
-            has_errors = any(op.get('status') == 'error' for op in operation_logs)
+            on_operation = (lambda op_log: write_event("operation", op_log)) if args.output == "ndjson" else None
+            final_result = apply_response(
+                full_input_text, os.getcwd(), readonly_files=args.readonly_files, jobs=args.jobs,
+                on_operation=on_operation, **response_options(args)
+            )
 
-            final_result = {
-                "status": "error" if has_errors else "success",
-                "summary": f"Processed {len(operation_logs)} operation(s).",
-                "operations": operation_logs
-            }
-
-        json.dump(final_result, sys.stdout, indent=2)
+        print_result(final_result, args.output)
         if final_result.get("status") == "error":
             sys.exit(1)
 
     except (RuntimeError, ValueError) as e:
-        json.dump({"status": "error", "summary": str(e), "operations": []}, sys.stdout, indent=2)
+        print_result({"status": "error", "summary": str(e), "operations": []}, args.output)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print_result({"status": "error", "summary": "Operation cancelled by user (Ctrl+C).", "operations": []}, args.output)
+        sys.exit(1)
+    except Exception as e:
+        print_result({"status": "error", "summary": f"An unexpected fatal error occurred: {e}", "operations": []}, args.output)
         sys.exit(1)
+
+def stream_main(args):
+    """
+    Applies blocks from stdin as they arrive. Each operation log is written as an NDJSON
+    "operation" event when its block completes, followed by a "summary" event.
+    """
+    try:
+        chunks = iter_stdin_chunks(sys.stdin.buffer)
+        # Tokenizing is interleaved with reading stdin here, so the parse phase covers S/R parsing only.
+        profile = ApplyProfile() if args.profile else None
+        operation_logs = apply_blocks(
+            iter_stream_blocks(chunks), os.getcwd(), readonly_files=args.readonly_files,
+            on_operation=lambda op_log: write_event("operation", op_log), write_through=True,
+            mmap_threshold=args.mmap_threshold, profile=profile,
+            ledger=open_ledger(args.ledger) if args.ledger else None,
+            whitespace_fallback=args.whitespace_fallback
+        )
+        final_result = build_final_result(operation_logs)
+        if profile is not None:
+            final_result["profile"] = profile.summary(operation_logs)
     except KeyboardInterrupt:
-        json.dump({"status": "error", "summary": "Operation cancelled by user (Ctrl+C).", "operations": []}, sys.stdout, indent=2)
+        final_result = {"status": "error", "summary": "Operation cancelled by user (Ctrl+C).", "operations": []}
+    except Exception as e:
+        final_result = {"status": "error", "summary": f"An unexpected fatal error occurred: {e}", "operations": []}
+
+    print_result(final_result, "ndjson")
+    if final_result.get("status") == "error":
         sys.exit(1)
+
+def iter_manifest_offsets(manifest_path):
+    """Yields the byte offset of every non-blank line of a JSONL manifest."""
+    with open(manifest_path, 'rb') as f:
+        offset = 0
+        for line in f:
+            if line.strip():
+                yield offset
+            offset += len(line)
+
+def apply_manifest_record(manifest_path, index, offset, jobs=1, options=None):
+    """
+    Applies the manifest record at a byte offset and returns its result line: the dict main()
+    would print plus "index", "project_root" and "seconds". options are apply_response keyword
+    arguments shared by every record. Never raises, so one bad record cannot abort a batch.
+    Workers read their own record so only offsets cross processes.
+    """
+    start = time.perf_counter()
+    result = {"index": index, "project_root": None}
+    try:
+        with open(manifest_path, 'rb') as f:
+            f.seek(offset)
+            record = json.loads(f.readline())
+        if not isinstance(record, dict):
+            raise ValueError("Manifest record must be a JSON object.")
+        project_root = record.get("project_root")
+        result["project_root"] = project_root
+        if not project_root or not os.path.isdir(project_root):
+            raise ValueError(f"Project root is not a directory: {project_root!r}")
+        response = record.get("response") or ""
+        if not response.strip():
+            raise ValueError("No input received.")
+        result.update(apply_response(
+            response, os.path.abspath(project_root), readonly_files=record.get("readonly_files") or [],
+            jobs=jobs, **(options or {})
+        ))
+        result["response_bytes"] = len(response.encode('utf-8', errors='replace'))
+    except (RuntimeError, ValueError) as e:
+        result.update({"status": "error", "summary": str(e), "operations": []})
     except Exception as e:
-        json.dump({"status": "error", "summary": f"An unexpected fatal error occurred: {e}", "operations": []}, sys.stdout, indent=2)
+        result.update({"status": "error", "summary": f"An unexpected fatal error occurred: {e}", "operations": []})
+    result["seconds"] = round(time.perf_counter() - start, 6)
+    return result
+
+def apply_manifest(manifest_path, on_result, workers=1, jobs=1, options=None):
+    """
+    Applies every record of a JSONL manifest on a pool of `workers` processes, calling
+    on_result with each result line in manifest order as soon as it and its predecessors
+    are done. Returns aggregate throughput and failure statistics.
+    """
+    start = time.perf_counter()
+    status_counts = collections.Counter()
+    operation_counts = collections.Counter()
+    failure_counts = collections.Counter()
+    durations = []
+    response_bytes = 0
+
+    def record(result):
+        nonlocal response_bytes
+        status_counts[result["status"]] += 1
+        if result["status"] == "error":
+            failed = [op for op in result["operations"] if op.get("status") == "error"]
+            failure_counts[failed[0].get("message", "") if failed else result["summary"]] += 1
+        for op in result["operations"]:
+            operation_counts[op.get("status")] += 1
+        durations.append(result["seconds"])
+        response_bytes += result.get("response_bytes", 0)
+        on_result(result)
+
+    offsets = enumerate(iter_manifest_offsets(manifest_path))
+    if workers == 1:
+        for index, offset in offsets:
+            record(apply_manifest_record(manifest_path, index, offset, jobs, options))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # A bounded window of futures keeps output ordered without queueing the whole manifest.
+            pending = collections.deque()
+            for index, offset in offsets:
+                pending.append(pool.submit(apply_manifest_record, manifest_path, index, offset, jobs, options))
+                if len(pending) >= workers * BATCH_WINDOW_PER_WORKER:
+                    record(pending.popleft().result())
+            while pending:
+                record(pending.popleft().result())
+
+    elapsed = time.perf_counter() - start
+    durations.sort()
+    total = len(durations)
+
+    def percentile(q):
+        return durations[min(total - 1, int(q * total))] if total else None
+
+    return {
+        "status": "error" if status_counts["error"] else "success",
+        "summary": f"Processed {total} record(s): {status_counts['success']} succeeded, {status_counts['error']} failed.",
+        "records": total,
+        "record_status": dict(status_counts),
+        "operation_status": dict(operation_counts),
+        "top_failures": [{"message": message, "count": count} for message, count in failure_counts.most_common(10)],
+        "wall_seconds": round(elapsed, 3),
+        "records_per_second": round(total / elapsed, 2) if elapsed else None,
+        "operations_per_second": round(sum(operation_counts.values()) / elapsed, 2) if elapsed else None,
+        "response_mb_per_second": round(response_bytes / (1024 * 1024) / elapsed, 3) if elapsed else None,
+        "record_seconds": {"p50": percentile(0.5), "p95": percentile(0.95), "max": durations[-1] if total else None},
+        "workers": workers,
+    }
+
+def write_result_line(result, out):
+    out.write(json.dumps(result) + "\n")
+    out.flush()
+
+def batch_main(args):
+    """Runs --batch: result lines go to --batch-output, the aggregate summary is printed at the end."""
+    out = sys.stdout if args.batch_output == "-" else open(args.batch_output, 'w', encoding='utf-8')
+    try:
+        summary = apply_manifest(
+            args.batch, lambda result: write_result_line(result, out), workers=args.workers,
+            jobs=args.jobs, options=response_options(args)
+        )
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    json.dump(summary, sys.stderr if out is sys.stdout else sys.stdout, indent=2)
+    if summary["status"] == "error":
         sys.exit(1)
 
+class ProjectState:
+    """Warm state the apply server keeps for one project root between requests."""
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()    # requests for the same project are applied one at a time
+        self.users = 0                  # requests holding this state, counted under the projects lock
+        self.file_cache = FileCache()
+
+def handle_server_request(request, projects, projects_lock, options=None):
+    """
+    Applies one server request {"text", "project_root", "readonly_files"[, "jobs"]} with the
+    apply_response keyword arguments the server was started with. Returns the same result
+    dict that main() prints.
+    """
+    try:
+        if not isinstance(request, dict):
+            raise ValueError("Request must be a JSON object.")
+        text = request.get("text") or ""
+        if not text.strip():
+            raise ValueError("No input received.")
+        project_root = request.get("project_root")
+        if not project_root or not os.path.isdir(project_root):
+            raise ValueError(f"Project root is not a directory: {project_root!r}")
+        project_root = os.path.abspath(project_root)
+
+        with projects_lock:
+            # Re-inserting keeps projects ordered from least to most recently used.
+            state = projects.pop(project_root, None) or ProjectState(project_root)
+            projects[project_root] = state
+            # Counted before the projects lock is released, so no request can evict the state
+            # between this lookup and taking its lock, and create a second one for the same root.
+            state.users += 1
+            for root in list(projects):
+                if len(projects) <= SERVER_MAX_PROJECTS:
+                    break
+                if not projects[root].users:    # a project in use stays warm
+                    del projects[root]
+        try:
+            with state.lock:
+                return apply_response(
+                    text, project_root, readonly_files=request.get("readonly_files") or [],
+                    jobs=max(1, int(request.get("jobs", 1))), file_cache=state.file_cache, **(options or {})
+                )
+        finally:
+            with projects_lock:
+                state.users -= 1
+    except (RuntimeError, ValueError) as e:
+        return {"status": "error", "summary": str(e), "operations": []}
+    except Exception as e:
+        return {"status": "error", "summary": f"An unexpected fatal error occurred: {e}", "operations": []}
+
+def serve(socket_path, options=None):
+    """
+    Runs a long-lived apply server on a Unix socket. Each request is one JSON line and is
+    answered with one JSON line holding the result main() would print; a connection may
+    send any number of requests. options are apply_response keyword arguments applied to
+    every request. Runs until interrupted.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise RuntimeError("--serve requires Unix domain socket support.")
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except OSError:
+            os.unlink(socket_path)  # stale socket left by a server that did not shut down cleanly
+        else:
+            raise RuntimeError(f"Another server is already listening on {socket_path}.")
+        finally:
+            probe.close()
+
+    projects = {}
+    projects_lock = threading.Lock()
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    response = {"status": "error", "summary": f"Invalid request: {e}", "operations": []}
+                else:
+                    response = handle_server_request(request, projects, projects_lock, options)
+                self.wfile.write(json.dumps(response).encode('utf-8') + b"\n")
+                self.wfile.flush()
+
+    server = socketserver.ThreadingUnixStreamServer(socket_path, RequestHandler)
+    server.daemon_threads = True
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"apply server listening on {socket_path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
 if __name__ == "__main__":
     main()
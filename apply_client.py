@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Thin client for `apply.py --serve`. Sends the response text on stdin to a running apply
+server and prints the same JSON result that apply.py would, without paying for the
+apply.py startup on every call.
+"""
+import os
+import sys
+import json
+import socket
+import argparse
+
+DEFAULT_SOCKET = os.environ.get("APPLY_SOCKET", "/tmp/apply.sock")
+
+def send_request(socket_path, request):
+    """Sends one request to the server and returns the decoded result."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode('utf-8') + b"\n")
+        with sock.makefile('rb') as response:
+            line = response.readline()
+    if not line:
+        raise RuntimeError("Server closed the connection without a response.")
+    return json.loads(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Send stdin to a running `apply.py --serve` server.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"Server socket path (default: {DEFAULT_SOCKET}, or $APPLY_SOCKET).")
+    parser.add_argument("--project-root", default=os.getcwd(), help="Project to apply the changes to (default: current directory).")
+    parser.add_argument("--readonly-files", nargs='*', default=[], help="A list of file paths that should not be modified.")
+    parser.add_argument("--jobs", type=int, default=1, help="Apply independent files concurrently on N threads.")
+    args = parser.parse_args()
+
+    request = {
+        "text": sys.stdin.read(),
+        "project_root": os.path.abspath(args.project_root),
+        "readonly_files": args.readonly_files,
+        "jobs": args.jobs,
+    }
+    try:
+        result = send_request(args.socket, request)
+    except (OSError, RuntimeError, ValueError) as e:
+        result = {"status": "error", "summary": f"Could not reach apply server at {args.socket}: {e}", "operations": []}
+
+    json.dump(result, sys.stdout, indent=2)
+    if result.get("status") == "error":
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
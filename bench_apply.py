@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for apply.py: block/SEARCH-REPLACE parsing throughput, application throughput
+and peak memory on synthetic LLM responses. Each case runs in a fresh subprocess so its
+peak RSS is its own. Results can be stored as a baseline and compared against later runs.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import apply
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".bench_apply_baseline.json")
+
+# name -> generator parameters
+CASES = {
+    "small":      {"files": 10, "blocks_per_file": 2, "sr_per_block": 3, "file_size": 4 * 1024, "malformed_ratio": 0.0},
+    "many-files": {"files": 300, "blocks_per_file": 1, "sr_per_block": 4, "file_size": 8 * 1024, "malformed_ratio": 0.0},
+    "many-blocks": {"files": 5, "blocks_per_file": 15, "sr_per_block": 4, "file_size": 64 * 1024, "malformed_ratio": 0.0},
+    "large-file": {"files": 1, "blocks_per_file": 4, "sr_per_block": 50, "file_size": 2 * 1024 * 1024, "malformed_ratio": 0.0},
+    "malformed":  {"files": 100, "blocks_per_file": 2, "sr_per_block": 2, "file_size": 4 * 1024, "malformed_ratio": 0.5},
+}
+
+def _source_lines(rng, count, prefix):
+    return [f"    {prefix}_{i} = compute({rng.randint(0, 10**6)}, 'v{i}')" for i in range(count)]
+
+def generate_case(files, blocks_per_file, sr_per_block, file_size, malformed_ratio, seed=0):
+    """
+    Builds a synthetic project and an LLM response that edits it.
+    Returns (files dict {relative path: content}, response text). sr_per_block == 0 produces
+    whole-file write blocks. malformed_ratio is the fraction of blocks that are broken:
+    unterminated fences, mismatched end paths, or S/R blocks without a divider.
+    """
+    rng = random.Random(seed)
+    project = {}
+    blocks = []
+    for f in range(files):
+        path = f"pkg/mod_{f}.py"
+        lines = _source_lines(rng, max(1, file_size // 48), f"value_{f}")
+        project[path] = "\n".join(lines) + "\n"
+        # Pick distinct anchors in file order so every operation can succeed.
+        anchors = sorted(rng.sample(range(len(lines) - 2), min(len(lines) - 2, blocks_per_file * sr_per_block))) if len(lines) > 2 else []
+        for b in range(blocks_per_file):
+            if sr_per_block:
+                chunk = anchors[b * sr_per_block:(b + 1) * sr_per_block]
+                body = "".join(
+                    f"<<<<<<< SEARCH\n{lines[a]}\n{lines[a + 1]}\n=======\n"
+                    f"{lines[a].replace('compute', 'recompute')}\n{lines[a + 1]}\n>>>>>>> REPLACE\n"
+                    for a in chunk
+                )
+            else:
+                body = "\n".join(_source_lines(rng, max(1, file_size // 48), f"new_{f}_{b}")) + "\n"
+
+            if rng.random() < malformed_ratio:
+                kind = rng.randrange(3)
+                if kind == 0:
+                    blocks.append(f"```python:{path}\n{body}\n")
+                elif kind == 1:
+                    blocks.append(f"```python:{path}\n{body}```end:{path}.bak\n")
+                else:
+                    blocks.append(f"```python:{path}\n{body.replace(chr(10) + '=======' + chr(10), chr(10))}```end:{path}\n")
+            else:
+                blocks.append(f"Some explanation for block {b} of {path}.\n\n```python:{path}\n{body}```end:{path}\n\n")
+    return project, "".join(blocks)
+
+def _write_project(root, project):
+    for path, content in project.items():
+        target = os.path.join(root, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_case(params, repeat=3, seed=0, jobs=1):
+    """Runs one case in this process and returns its metrics dict. Best of `repeat` runs."""
+    project, response = generate_case(seed=seed, **params)
+    size_mb = len(response.encode('utf-8')) / (1024 * 1024)
+
+    parse_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for language, filepath, content in apply.tokenize_blocks(response):
+            apply.parse_search_replace_blocks(content)
+        parse_times.append(time.perf_counter() - start)
+
+    apply_times = []
+    operations = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(repeat):
+            root = os.path.join(tmp, f"run{i}")
+            _write_project(root, project)
+            start = time.perf_counter()
+            logs = apply.extract_and_apply_changes(response, root, jobs=jobs)
+            apply_times.append(time.perf_counter() - start)
+            operations = sum(len(log.get("sr_operations", ())) or 1 for log in logs)
+            shutil.rmtree(root)
+
+    parse_time = min(parse_times)
+    apply_time = min(apply_times)
+    return {
+        "response_mb": round(size_mb, 3),
+        "operations": operations,
+        "parse_mb_per_s": round(size_mb / parse_time, 2) if parse_time else None,
+        "apply_ops_per_s": round(operations / apply_time, 1) if apply_time else None,
+        "apply_seconds": round(apply_time, 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1) if resource else None,
+    }
+
+def run_case_isolated(name, params, repeat, seed, jobs):
+    """Runs a case in a fresh interpreter so that peak RSS is measured for that case alone."""
+    command = [sys.executable, os.path.abspath(__file__), "--run-case-json", json.dumps(params),
+               "--repeat", str(repeat), "--seed", str(seed), "--jobs", str(jobs)]
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+def compare(results, baseline, tolerance):
+    """Returns a list of human-readable regressions of results against baseline."""
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in ("parse_mb_per_s", "apply_ops_per_s"):
+            if base.get(key) and metrics.get(key) is not None and metrics[key] < base[key] * (1 - tolerance):
+                regressions.append(f"{name}: {key} {metrics[key]} < baseline {base[key]}")
+        if base.get("peak_rss_mb") and metrics.get("peak_rss_mb") is not None \
+                and metrics["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{name}: peak_rss_mb {metrics['peak_rss_mb']} > baseline {base['peak_rss_mb']}")
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark apply.py parsing and application throughput.")
+    parser.add_argument("cases", nargs="*", help=f"Cases to run (default: all). Available: {', '.join(CASES)}, custom")
+    parser.add_argument("--files", type=int, default=20, help="custom case: number of files")
+    parser.add_argument("--blocks-per-file", type=int, default=2, help="custom case: fenced blocks per file")
+    parser.add_argument("--sr-per-block", type=int, default=4, help="custom case: S/R pairs per block (0 = whole-file writes)")
+    parser.add_argument("--file-size", type=int, default=16 * 1024, help="custom case: approximate file size in bytes")
+    parser.add_argument("--malformed-ratio", type=float, default=0.0, help="custom case: fraction of malformed blocks")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the best one is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=1, help="Passed through to extract_and_apply_changes")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, metavar="PATH",
+                        help="Store the results as the new baseline")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, metavar="PATH",
+                        help="Compare against a stored baseline and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown before flagging (default: 0.15)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--run-case-json", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.run_case_json:
+        json.dump(run_case(json.loads(args.run_case_json), args.repeat, args.seed, args.jobs), sys.stdout)
+        return
+
+    cases = dict(CASES)
+    cases["custom"] = {
+        "files": args.files, "blocks_per_file": args.blocks_per_file, "sr_per_block": args.sr_per_block,
+        "file_size": args.file_size, "malformed_ratio": args.malformed_ratio,
+    }
+    names = args.cases or list(CASES)
+    unknown = [name for name in names if name not in cases]
+    if unknown:
+        sys.exit(f"Unknown case(s): {', '.join(unknown)}")
+
+    results = {}
+    for name in names:
+        results[name] = run_case_isolated(name, cases[name], args.repeat, args.seed, args.jobs)
+        if not args.json:
+            m = results[name]
+            print(f"{name:12} {m['response_mb']:8.2f} MB  parse {m['parse_mb_per_s']:9.2f} MB/s  "
+                  f"apply {m['apply_ops_per_s']:10.1f} ops/s ({m['operations']} ops)  peak RSS {m['peak_rss_mb']} MB")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+    if args.json:
+        json.dump({"results": results, "regressions": regressions}, sys.stdout, indent=2)
+    elif args.compare:
+        print("\n".join(["Regressions:"] + regressions) if regressions else "No regressions against baseline.")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+                       "results": results}, f, indent=2)
+        if not args.json:
+            print(f"Baseline saved to {args.save_baseline}")
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark for the LLM client scripts. Starts openai_standin.py in-process (or uses
+--base-url), points update_code.py and cli_deepseek.py at it through OPENAI_BASE_URL and
+DEEPSEEK_BASE_URL, runs each script as a subprocess many times with a bounded number in
+flight, and reports throughput and tail latency per case. Startup of the interpreter and the
+openai package is part of every run, as it is for a user.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import openai_standin
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# name -> (script, extra arguments); update_code.py cases force the model path with --no-local.
+CASES = {
+    "update_code":        ("update_code.py", ["--no-local", "--whole-file"]),
+    "update_code-region": ("update_code.py", ["--no-local"]),
+    "update_code-stream": ("update_code.py", ["--no-local", "--whole-file", "--stream"]),
+    "cli_deepseek":       ("cli_deepseek.py", []),
+}
+
+def generate_source(lines):
+    """A Python file of `lines` lines made of small functions, and a snippet that edits one of them."""
+    functions = max(1, lines // 3)
+    source = "".join(f"def f{i}(x):\n    return x + {i}\n\n" for i in range(functions))
+    snippet = f"def f{functions // 2}(x):\n    return x * {functions // 2}\n"
+    return source, snippet
+
+def run_once(case, workdir, index, source, snippet, env):
+    """Runs one invocation of the case's script. Returns (ok, seconds, detail)."""
+    script, extra = CASES[case]
+    command = [sys.executable, os.path.join(HERE, script)]
+    if script == "update_code.py":
+        target = os.path.join(workdir, f"target_{index}.py")
+        with open(target, 'w') as f:
+            f.write(source)
+        command += [target, "--metrics", ""] + extra
+        stdin = snippet
+    else:
+        command += ["Reply with this text: " + snippet] + extra
+        stdin = None
+    start = time.perf_counter()
+    result = subprocess.run(command, input=stdin, capture_output=True, text=True, env=env, cwd=workdir)
+    elapsed = time.perf_counter() - start
+    output = (result.stdout + result.stderr).strip()
+    if script == "update_code.py":
+        ok = result.returncode == 0 and "Successfully updated" in output
+    else:
+        ok = result.returncode == 0 and not result.stdout.startswith("Error:")
+    detail = None if ok else (output.splitlines()[-1] if output else f"exit code {result.returncode}")
+    return ok, elapsed, detail
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))] if sorted_values else None
+
+def run_case(case, runs, concurrency, base_url, source, snippet, stats=None):
+    """Runs a case `runs` times, at most `concurrency` at once, and returns its metrics dict."""
+    env = dict(os.environ, OPENAI_BASE_URL=base_url, OPENAI_API_KEY="standin",
+               DEEPSEEK_BASE_URL=base_url, DEEPSEEK_API_KEY="standin")
+    before = stats.snapshot() if stats else None
+    workdir = tempfile.mkdtemp(prefix=f"bench_llm_{case}_")
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda i: run_once(case, workdir, i, source, snippet, env), range(runs)))
+        wall = time.perf_counter() - start
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = sorted(seconds for ok, seconds, _ in results if ok)
+    failures = [detail for ok, _, detail in results if not ok]
+    metrics = {
+        "runs": runs,
+        "failed": len(failures),
+        "wall_seconds": round(wall, 3),
+        "runs_per_second": round(len(latencies) / wall, 2) if wall else None,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_p99": percentile(latencies, 0.99),
+        "latency_max": latencies[-1] if latencies else None,
+        "first_failure": failures[0] if failures else None,
+    }
+    if stats:
+        after = stats.snapshot()
+        tokens = after["completion_tokens"] - before["completion_tokens"]
+        metrics["server_tokens_per_second"] = round(tokens / wall, 1) if wall else None
+        metrics["server_rejections"] = (after["errors"] - before["errors"]) + (after["rate_limited"] - before["rate_limited"])
+    return metrics
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark update_code.py and cli_deepseek.py against a local API stand-in.")
+    parser.add_argument("cases", nargs="*", help=f"Cases to run (default: all). Available: {', '.join(CASES)}")
+    parser.add_argument("--runs", type=int, default=20, help="Invocations per case")
+    parser.add_argument("--concurrency", type=int, default=4, help="Invocations in flight at once")
+    parser.add_argument("--file-lines", type=int, default=300, help="Size of the file update_code.py edits")
+    parser.add_argument("--base-url", help="Use an already running server instead of starting the stand-in")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Stand-in completion tokens per second")
+    parser.add_argument("--ttft", type=float, default=0.2, help="Stand-in time to first token, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Stand-in fraction of 500 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Stand-in fraction of 429 responses")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    names = args.cases or list(CASES)
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        sys.exit(f"Unknown case(s): {', '.join(unknown)}")
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        config = openai_standin.StandinConfig(args.token_rate, args.ttft, args.error_rate, args.rate_limit_rate,
+                                              retry_after=0, seed=args.seed)
+        server, base_url = openai_standin.start_in_thread(config)
+
+    source, snippet = generate_source(args.file_lines)
+    results = {}
+    try:
+        for name in names:
+            results[name] = m = run_case(name, args.runs, args.concurrency, base_url, source, snippet,
+                                         server.stats if server else None)
+            if not args.json:
+                print(f"{name:20} {m['runs'] - m['failed']:4}/{m['runs']} ok  {m['runs_per_second']} runs/s  "
+                      f"p50 {m['latency_p50'] or 0:.3f}s  p95 {m['latency_p95'] or 0:.3f}s  "
+                      f"p99 {m['latency_p99'] or 0:.3f}s  max {m['latency_max'] or 0:.3f}s"
+                      + (f"  {m['server_tokens_per_second']} tok/s" if server else ""))
+                if m["first_failure"]:
+                    print(f"{'':20} first failure: {m['first_failure']}")
+    finally:
+        if server:
+            server.shutdown()
+            server.server_close()
+    if args.json:
+        json.dump({"base_url": base_url, "results": results}, sys.stdout, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Content-addressed store for candidate LLM responses. Each response is kept once as a
+zlib-compressed blob named by its SHA-256; an append-only index records when it was saved,
+by which model and with which tags, so listing never has to touch the blobs.
+
+Layout under the store directory:
+    objects/ab/cdef...   compressed blob for the response whose id is "abcdef..."
+    index.jsonl          one {"id", "timestamp", "model", "tags", "size"} line per save
+"""
+import os
+import json
+import time
+import zlib
+import difflib
+import hashlib
+import tempfile
+
+DEFAULT_STORE_DIR = "candidates"
+MIN_ID_PREFIX = 4
+
+class CandidateStore:
+    """Saves, lists, loads and diffs candidates in one store directory."""
+
+    def __init__(self, root=DEFAULT_STORE_DIR):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_path = os.path.join(root, "index.jsonl")
+
+    def save(self, content, model=None, tags=()):
+        """
+        Stores content and returns its index entry. Saving content that is already stored
+        writes no new blob; the new model and tags are merged into the existing entry.
+        """
+        data = content.encode('utf-8', errors='replace')
+        candidate_id = hashlib.sha256(data).hexdigest()
+        blob_path = self._blob_path(candidate_id)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(zlib.compress(data, 6))
+                os.replace(tmp_path, blob_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+
+        record = {
+            "id": candidate_id,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "model": model,
+            "tags": sorted(set(tags)),
+            "size": len(data),
+        }
+        # One short write per line keeps concurrent appends from interleaving.
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + "\n")
+        return self.entries()[candidate_id]
+
+    def entries(self):
+        """Returns {id: entry} merged from the index, in the order candidates were first saved."""
+        entries = {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return entries
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a torn line from an interrupted save
+            entry = entries.get(record["id"])
+            if entry is None:
+                entries[record["id"]] = dict(record, tags=list(record.get("tags") or []))
+                continue
+            entry["tags"] = sorted(set(entry["tags"]) | set(record.get("tags") or []))
+            if record.get("model"):
+                entry["model"] = record["model"]
+        return entries
+
+    def list(self, tags=(), model=None):
+        """Returns index entries, oldest first, keeping those with every tag in tags and the given model."""
+        return [
+            entry for entry in self.entries().values()
+            if set(tags) <= set(entry["tags"]) and (model is None or entry.get("model") == model)
+        ]
+
+    def resolve(self, id_prefix):
+        """Returns the full id for a unique id prefix. Raises ValueError otherwise."""
+        id_prefix = (id_prefix or "").strip().lower()
+        if len(id_prefix) < MIN_ID_PREFIX:
+            raise ValueError(f"Candidate id must be at least {MIN_ID_PREFIX} characters: {id_prefix!r}")
+        matches = [candidate_id for candidate_id in self.entries() if candidate_id.startswith(id_prefix)]
+        if not matches:
+            raise ValueError(f"No candidate matches {id_prefix!r} in {self.root}.")
+        if len(matches) > 1:
+            raise ValueError(f"Candidate id {id_prefix!r} is ambiguous ({len(matches)} matches).")
+        return matches[0]
+
+    def load(self, id_prefix):
+        """Returns the stored content for a candidate id or unique prefix."""
+        candidate_id = self.resolve(id_prefix)
+        try:
+            with open(self._blob_path(candidate_id), 'rb') as f:
+                data = zlib.decompress(f.read())
+        except (OSError, zlib.error) as e:
+            raise RuntimeError(f"Cannot read candidate {candidate_id[:12]}: {e}")
+        if hashlib.sha256(data).hexdigest() != candidate_id:
+            raise RuntimeError(f"Candidate {candidate_id[:12]} is corrupt (hash mismatch).")
+        return data.decode('utf-8')
+
+    def diff(self, old_prefix, new_prefix, context=3):
+        """Returns a unified diff between two stored candidates."""
+        old_id, new_id = self.resolve(old_prefix), self.resolve(new_prefix)
+        return "".join(difflib.unified_diff(
+            self.load(old_id).splitlines(keepends=True), self.load(new_id).splitlines(keepends=True),
+            fromfile=old_id[:12], tofile=new_id[:12], n=context
+        ))
+
+    def _blob_path(self, candidate_id):
+        return os.path.join(self.objects_dir, candidate_id[:2], candidate_id[2:])
@@ -51,10 +51,10 @@ if not api_key:
     logger.error("DEEPSEEK_API_KEY environment variable not set.")
     sys.exit(1)
 
-# Initialize DeepSeek API client
+# Initialize DeepSeek API client (DEEPSEEK_BASE_URL points it elsewhere, e.g. at openai_standin.py)
 client = AsyncOpenAI(
     api_key=api_key,
-    base_url="https://api.deepseek.com/beta",
+    base_url=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com/beta"),
 )
 
 def extract_sys_and_content(input_text):
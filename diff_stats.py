@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Line-diff statistics without building a diff. Lines are interned to integers once, the common
+prefix and suffix are trimmed, and the rest is split at the lines that occur exactly once on
+both sides and keep their relative order (patience diff). Regions without such lines are split
+at the longest run of matching lines that starts with the rarest line and stays near the
+region's diagonal (histogram diff, as in git), and regions made only of very common lines are
+left to difflib when small and paired along their diagonal otherwise. Only the counts and the
+changed spans are kept, so a 20k-line file costs a few dict lookups per line.
+
+    stats = diff_stats(old_text, new_text)
+    stats.additions, stats.deletions, stats.spans
+"""
+import sys
+import bisect
+import difflib
+import argparse
+import itertools
+from collections import Counter, namedtuple
+
+# A line that occurs more often than this in a region is never used to split it.
+MAX_CHAIN_LENGTH = 64
+# Regions of common lines larger than this (old lines x new lines) are not given to difflib.
+MAX_MATCHER_CELLS = 250_000
+# How far off a region's diagonal a split may sit before closeness counts more than length.
+DIAGONAL_SLACK = 8
+
+DiffStats = namedtuple("DiffStats", ["additions", "deletions", "spans", "truncated"])
+DiffStats.__doc__ = """
+additions/deletions: changed line counts. spans: (old start, old end, new start, new end) per
+changed region, 0-based and end-exclusive, in file order. truncated: True when max_hunks limited
+the spans. They are then merged across unchanged lines, which the counts leave out; a region the
+cap kept from being refined counts whole, so the counts are an upper bound.
+"""
+
+def intern_lines(old_lines, new_lines):
+    """Maps every distinct line of both sequences to a small integer. Returns the two int lists."""
+    ids = {line: k for k, line in enumerate(dict.fromkeys(itertools.chain(old_lines, new_lines)))}
+    return [ids[line] for line in old_lines], [ids[line] for line in new_lines]
+
+def diff_line_stats(old_lines, new_lines, max_hunks=None):
+    """Returns DiffStats for two sequences of lines. max_hunks caps the number of changed regions."""
+    a, b = intern_lines(old_lines, new_lines)
+    spans = []
+    truncated = False
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        a_lo, a_hi, b_lo, b_hi = stack.pop()
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            a_lo += 1
+            b_lo += 1
+        while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+            a_hi -= 1
+            b_hi -= 1
+        if a_lo == a_hi or b_lo == b_hi:
+            if a_lo < a_hi or b_lo < b_hi:
+                spans.append((a_lo, a_hi, b_lo, b_hi))
+            continue
+        # Every region still on the stack may add a span, so the cap is reached before they are split.
+        if max_hunks is not None and len(spans) + len(stack) >= max_hunks:
+            truncated = True
+            spans.append((a_lo, a_hi, b_lo, b_hi))
+            continue
+        anchors = _unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+        if not anchors:
+            split = _rare_match(a, b, a_lo, a_hi, b_lo, b_hi)
+            if split is not None:
+                anchors = [(split[0] + k, split[1] + k) for k in range(split[2])]
+            else:
+                anchors = _common_line_anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+            if not anchors:
+                spans.append((a_lo, a_hi, b_lo, b_hi))
+                continue
+        # Gaps are pushed right to left, so they are popped and recorded in file order.
+        ends = [(a_lo - 1, b_lo - 1)] + anchors + [(a_hi, b_hi)]
+        for (a_end, b_end), (a_next, b_next) in reversed(list(zip(ends, ends[1:]))):
+            if a_end + 1 < a_next or b_end + 1 < b_next:
+                stack.append((a_end + 1, a_next, b_end + 1, b_next))
+
+    spans = _merge_adjacent(spans)
+    # Counted before coalescing: the unchanged lines between merged spans are not changes.
+    additions = sum(b_hi - b_lo for _, _, b_lo, b_hi in spans)
+    deletions = sum(a_hi - a_lo for a_lo, a_hi, _, _ in spans)
+    if max_hunks is not None and len(spans) > max_hunks:
+        truncated = True
+        spans = _coalesce(spans, max(1, max_hunks))
+    return DiffStats(additions=additions, deletions=deletions, spans=spans, truncated=truncated)
+
+def diff_stats(old_text, new_text, max_hunks=None):
+    """DiffStats between two texts, compared line by line."""
+    return diff_line_stats(old_text.splitlines(), new_text.splitlines(), max_hunks)
+
+def _unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi):
+    """
+    Returns [(a index, b index)] for lines occurring exactly once in both regions, reduced to
+    the longest subsequence whose order agrees on both sides.
+    """
+    a_region, b_region = a[a_lo:a_hi], b[b_lo:b_hi]
+    a_counts, b_counts = Counter(a_region), Counter(b_region)
+    unique = [line for line, count in a_counts.items() if count == 1 and b_counts.get(line) == 1]
+    if not unique:
+        return []
+    # For a line that occurs once, the last index is its only index.
+    a_index = {line: i for i, line in enumerate(a_region, a_lo)}
+    b_index = {line: j for j, line in enumerate(b_region, b_lo)}
+    pairs = sorted(zip(map(a_index.__getitem__, unique), map(b_index.__getitem__, unique)))
+    b_order = [j for _, j in pairs]
+    if b_order == sorted(b_order):
+        return pairs  # nothing moved, the usual case
+
+    # Longest increasing subsequence of b indexes (patience sorting).
+    tails, tail_index, previous = [], [], [None] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, j)
+        if pos:
+            previous[k] = tail_index[pos - 1]
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[pos] = j
+            tail_index[pos] = k
+    anchors = []
+    k = tail_index[-1]
+    while k is not None:
+        anchors.append(pairs[k])
+        k = previous[k]
+    anchors.reverse()
+    return anchors
+
+def _rare_match(a, b, a_lo, a_hi, b_lo, b_hi):
+    """
+    Returns (a start, b start, length) of a matching run starting at a line with the lowest
+    occurrence count in a, or None if every shared line occurs more than MAX_CHAIN_LENGTH
+    times. Runs within DIAGONAL_SLACK lines of the region's diagonal are preferred, the longest
+    first; a longer run further off lines up the wrong copies of repeated content, and every
+    line between them would count as changed. Failing that, the run closest to it is taken.
+    """
+    occurrences = {}
+    for i in range(a_lo, a_hi):
+        occurrences.setdefault(a[i], []).append(i)
+
+    slope = (b_hi - b_lo) / (a_hi - a_lo)
+    slack = abs((b_hi - b_lo) - (a_hi - a_lo)) + DIAGONAL_SLACK
+    best = None
+    best_key = (MAX_CHAIN_LENGTH + 1,)
+    j = b_lo
+    while j < b_hi:
+        positions = occurrences.get(b[j])
+        if positions is None or len(positions) > best_key[0]:
+            j += 1
+            continue
+        next_j = j + 1
+        for i in positions:
+            start_i, start_j = i, j
+            while start_i > a_lo and start_j > b_lo and a[start_i - 1] == b[start_j - 1]:
+                start_i -= 1
+                start_j -= 1
+            end_i, end_j = i + 1, j + 1
+            while end_i < a_hi and end_j < b_hi and a[end_i] == b[end_j]:
+                end_i += 1
+                end_j += 1
+            distance = abs((start_j - b_lo) - (start_i - a_lo) * slope)
+            key = (len(positions), distance > slack, -(end_i - start_i) if distance <= slack else distance)
+            if key < best_key:
+                best, best_key = (start_i, start_j, end_i - start_i), key
+            next_j = max(next_j, end_j)
+        # Lines inside the run just matched cannot start a better one.
+        j = next_j
+    return best
+
+def _common_line_anchors(a, b, a_lo, a_hi, b_lo, b_hi):
+    """
+    [(a index, b index)] to split a region made only of common lines. difflib matches small
+    regions; its cost grows faster than the square of the region, so past MAX_MATCHER_CELLS
+    the lines are paired along the region's diagonal instead, which is linear and exact for
+    changes that keep the line count.
+    """
+    if (a_hi - a_lo) * (b_hi - b_lo) <= MAX_MATCHER_CELLS:
+        matcher = difflib.SequenceMatcher(None, a[a_lo:a_hi], b[b_lo:b_hi], autojunk=False)
+        return [(a_lo + i + k, b_lo + j + k) for i, j, n in matcher.get_matching_blocks() for k in range(n)]
+    slope = (b_hi - b_lo) / (a_hi - a_lo)
+    anchors = []
+    last_j = b_lo - 1
+    for i in range(a_lo, a_hi):
+        j = b_lo + int((i - a_lo) * slope)
+        if j > last_j and a[i] == b[j]:
+            anchors.append((i, j))
+            last_j = j
+    return anchors
+
+def _merge_adjacent(spans):
+    merged = []
+    for span in sorted(spans):
+        if merged and merged[-1][1] == span[0] and merged[-1][3] == span[2]:
+            last = merged.pop()
+            span = (last[0], span[1], last[2], span[3])
+        merged.append(span)
+    return merged
+
+def _coalesce(spans, count):
+    """Merges spans across the smallest unchanged gaps until only `count` remain."""
+    gaps = sorted(range(1, len(spans)), key=lambda k: spans[k][0] - spans[k - 1][1])
+    joined = set(gaps[:len(spans) - count])
+    merged = [spans[0]]
+    for k in range(1, len(spans)):
+        if k in joined:
+            last = merged.pop()
+            merged.append((last[0], spans[k][1], last[2], spans[k][3]))
+        else:
+            merged.append(spans[k])
+    return merged
+
+def main():
+    parser = argparse.ArgumentParser(description="Print line-diff statistics between two files.")
+    parser.add_argument("old_file")
+    parser.add_argument("new_file")
+    parser.add_argument("--max-hunks", type=int, help="Stop refining after this many changed regions.")
+    parser.add_argument("--spans", action="store_true", help="Also list the changed line ranges.")
+    args = parser.parse_args()
+
+    with open(args.old_file, 'r', encoding='utf-8', errors='replace') as f:
+        old_text = f.read()
+    with open(args.new_file, 'r', encoding='utf-8', errors='replace') as f:
+        new_text = f.read()
+    stats = diff_stats(old_text, new_text, args.max_hunks)
+    print(f"+{stats.additions} -{stats.deletions} in {len(stats.spans)} region(s)"
+          + (" (truncated)" if stats.truncated else ""))
+    if args.spans:
+        for a_lo, a_hi, b_lo, b_hi in stats.spans:
+            print(f"  old {a_lo + 1}-{a_hi}  new {b_lo + 1}-{b_hi}")
+
+if __name__ == "__main__":
+    sys.exit(main())
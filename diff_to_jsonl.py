@@ -1,21 +1,27 @@
 import os
+import sys
 import json
 import subprocess
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+def run_git_diff(path):
+    """Run git diff against HEAD for the specified path; raises on failure."""
+    # Change to the directory containing the path
+    working_dir = os.path.dirname(path) if os.path.isfile(path) else path
+    result = subprocess.run(
+        ['git', 'diff', '--no-color', 'HEAD'],
+        cwd=working_dir,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return result.stdout
 
 def get_git_diff(path):
     """Get git diff for the specified path."""
     try:
-        # Change to the directory containing the path
-        working_dir = os.path.dirname(path) if os.path.isfile(path) else path
-        result = subprocess.run(
-            ['git', 'diff', '--no-color', 'HEAD'],
-            cwd=working_dir,
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return result.stdout
+        return run_git_diff(path)
     except subprocess.CalledProcessError as e:
         print(f"Error getting git diff: {e}")
         return None
@@ -35,26 +41,94 @@ def get_instance_id(path):
     parent_dir = os.path.basename(directory)
     return parent_dir
 
-def create_jsonl_output(diff_data, instance_id, output_file="output.jsonl", model_name="default-model"):
-    """Create JSONL output with the specified format."""
-    output_data = {
+def make_record(diff_data, instance_id, model_name="default-model"):
+    """Build one prediction record."""
+    return {
         "instance_id": instance_id,
         "model_patch": diff_data,
         "model_name_or_path": model_name
     }
 
-    with open(output_file, 'w') as f:
-        json.dump(output_data, f)
+def recorded_instances(output_file):
+    """instance_ids already in output_file; empty if it does not exist."""
+    if not os.path.exists(output_file):
+        return set()
+    with open(output_file) as f:
+        return {json.loads(line)["instance_id"] for line in f if line.strip()}
+
+def create_jsonl_output(diff_data, instance_id, output_file="output.jsonl", model_name="default-model", append=False):
+    """Create JSONL output with the specified format, replacing output_file unless append is set."""
+    with open(output_file, 'a' if append else 'w') as f:
+        json.dump(make_record(diff_data, instance_id, model_name), f)
         f.write('\n')
 
+def find_instances(root):
+    """Instance directories directly under root, sorted by name."""
+    return [
+        os.path.join(root, name) for name in sorted(os.listdir(root))
+        if not name.startswith('.') and os.path.isdir(os.path.join(root, name))
+    ]
+
+def collect_instance(path):
+    """Worker for batch mode. Returns (instance_id, diff, error); exactly one of diff and error is None."""
+    instance_id = get_instance_id(path)
+    try:
+        return instance_id, run_git_diff(path), None
+    except subprocess.CalledProcessError as e:
+        message = (e.stderr or '').strip() or str(e)
+        return instance_id, None, message.splitlines()[0]
+    except OSError as e:
+        return instance_id, None, str(e)
+
+def batch_output(paths, output_file, model_name="default-model", workers=None, append=False):
+    """
+    Collect diffs for many instances on a process pool and write one record per instance to
+    output_file, in the order of paths, replacing the file unless append is set. A failed
+    instance is reported and skipped; the rest still run. Returns the list of
+    (instance_id, error) failures.
+    """
+    failures = []
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(output_file, 'a' if append else 'w') as f:
+        # map yields in submission order, so records land in the same order on every run.
+        for instance_id, diff_data, error in pool.map(collect_instance, paths, chunksize=8):
+            if error is not None:
+                print(f"{instance_id}: error getting git diff: {error}", file=sys.stderr)
+                failures.append((instance_id, error))
+                continue
+            json.dump(make_record(diff_data, instance_id, model_name), f)
+            f.write('\n')
+    return failures
+
 def main():
     parser = argparse.ArgumentParser(description='Process git diff and create JSONL output')
-    parser.add_argument('path', help='Path to the file or directory to process')
-    parser.add_argument('--output', default='output.jsonl', help='Output JSONL file path')
+    parser.add_argument('path', nargs='*', help='Path to the file or directory to process; several paths run in batch mode')
+    parser.add_argument('--root', help='Batch mode: process every instance directory directly under this directory')
+    parser.add_argument('--output', default='output.jsonl',
+                        help='Output JSONL file path; it is overwritten unless --append is given')
+    parser.add_argument('--append', action='store_true',
+                        help='Add records to --output instead of overwriting it, skipping instance_ids already in it')
     parser.add_argument('--model-name', default='default-model', help='Model name or path')
+    parser.add_argument('--workers', type=int, default=None, help='Batch mode: number of worker processes (default: CPU count)')
 
     args = parser.parse_args()
 
+    if args.root or len(args.path) > 1:
+        paths = args.path + (find_instances(args.root) if args.root else [])
+        if args.append:
+            recorded = recorded_instances(args.output)
+            skipped = [path for path in paths if get_instance_id(path) in recorded]
+            if skipped:
+                print(f"Skipping {len(skipped)} instance(s) already in {args.output}")
+            paths = [path for path in paths if get_instance_id(path) not in recorded]
+        failures = batch_output(paths, args.output, args.model_name, args.workers, args.append)
+        print(f"Wrote {len(paths) - len(failures)} of {len(paths)} instance(s) to {args.output}")
+        if failures:
+            sys.exit(1)
+        return
+    if not args.path:
+        parser.error("a path or --root is required")
+    args.path = args.path[0]
+
     # Get git diff
     diff_data = get_git_diff(args.path)
     if diff_data is None:
@@ -62,9 +136,12 @@ def main():
 
     # Get instance ID from parent folder
     instance_id = get_instance_id(args.path)
+    if args.append and instance_id in recorded_instances(args.output):
+        print(f"{instance_id} is already in {args.output}")
+        return
 
     # Create JSONL output
-    create_jsonl_output(diff_data, instance_id, args.output, args.model_name)
+    create_jsonl_output(diff_data, instance_id, args.output, args.model_name, args.append)
     print(f"Output written to {args.output}")
 
 if __name__ == "__main__":
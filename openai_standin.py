@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for an OpenAI-compatible chat completions API, for load and regression tests of
+the scripts here without a network or an API key. It answers POST .../chat/completions, both
+streamed (server-sent events) and not, at a configurable token rate and time to first token,
+and can inject 500 errors and 429 rate limits.
+
+The reply is the request's predicted output when there is one (so update_code.py sees its file
+come back unchanged), else the content of the first <code>...</code> in the last message, else
+that message itself. Point the clients at it with:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=x python update_code.py ...
+    DEEPSEEK_BASE_URL=http://127.0.0.1:8765/v1 DEEPSEEK_API_KEY=x python cli_deepseek.py ...
+"""
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 8765
+TOKEN_RE = re.compile(r"\s*\S+|\s+")
+CODE_RE = re.compile(r"<code>(.*?)</code>", re.DOTALL)
+
+class StandinConfig:
+    """Behaviour of the stand-in server. Rates are probabilities per request."""
+
+    def __init__(self, token_rate=200.0, ttft=0.2, error_rate=0.0, rate_limit_rate=0.0, retry_after=1, seed=None):
+        self.token_rate = token_rate    # completion tokens per second, 0 for no delay
+        self.ttft = ttft                # seconds before the first token
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+
+class StandinStats:
+    """Counters a harness can read while the server runs in-process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.completion_tokens = 0
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        with self.lock:
+            return {"requests": self.requests, "errors": self.errors, "rate_limited": self.rate_limited,
+                    "completion_tokens": self.completion_tokens}
+
+def tokenize(text):
+    """Splits text into word-sized pieces that concatenate back to it."""
+    return TOKEN_RE.findall(text)
+
+def reply_for(request):
+    """Returns (reply text, whether it is the predicted output)."""
+    prediction = request.get("prediction") or {}
+    if isinstance(prediction.get("content"), str):
+        return prediction["content"], True
+    messages = request.get("messages") or [{}]
+    content = messages[-1].get("content") or ""
+    if not isinstance(content, str):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    match = CODE_RE.search(content)
+    return (match.group(1) if match else content), False
+
+def usage_for(request, tokens, predicted):
+    prompt_tokens = sum(len(tokenize(m.get("content") or "")) for m in request.get("messages") or []
+                        if isinstance(m.get("content"), str))
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(tokens),
+        "total_tokens": prompt_tokens + len(tokens),
+        "completion_tokens_details": {
+            "accepted_prediction_tokens": len(tokens) if predicted else 0,
+            "rejected_prediction_tokens": 0,
+        },
+    }
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "openai-standin/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            return self.send_json(200, {"object": "list", "data": [{"id": "standin", "object": "model"}]})
+        self.send_json(404, error_body("Not found", "invalid_request_error"))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            return self.send_json(400, error_body(f"Invalid JSON body: {e}", "invalid_request_error"))
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self.send_json(404, error_body(f"Unknown endpoint {self.path}", "invalid_request_error"))
+
+        config, stats = self.server.config, self.server.stats
+        stats.add(requests=1)
+        roll = config.random.random()
+        if roll < config.rate_limit_rate:
+            stats.add(rate_limited=1)
+            return self.send_json(429, error_body("Rate limit reached (stand-in).", "rate_limit_exceeded"),
+                                  {"Retry-After": str(config.retry_after)})
+        if roll < config.rate_limit_rate + config.error_rate:
+            stats.add(errors=1)
+            return self.send_json(500, error_body("Injected server error (stand-in).", "server_error"))
+
+        text, predicted = reply_for(request)
+        tokens = tokenize(text)
+        if request.get("max_tokens"):
+            tokens = tokens[:int(request["max_tokens"])]
+        completion_id = f"chatcmpl-standin-{time.time_ns()}"
+        base = {"id": completion_id, "created": int(time.time()), "model": request.get("model") or "standin"}
+        usage = usage_for(request, tokens, predicted)
+        stats.add(completion_tokens=len(tokens))
+        if request.get("stream"):
+            include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+            self.stream(base, tokens, usage if include_usage else None)
+        else:
+            time.sleep(config.ttft + (len(tokens) / config.token_rate if config.token_rate else 0))
+            self.send_json(200, dict(base, object="chat.completion", usage=usage, choices=[{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "".join(tokens)},
+            }]))
+
+    def stream(self, base, tokens, usage):
+        config = self.server.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(payload):
+            self.wfile.write(b"data: " + payload + b"\n\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            return json.dumps(dict(base, object="chat.completion.chunk", choices=[
+                {"index": 0, "delta": delta, "finish_reason": finish_reason}
+            ])).encode('utf-8')
+
+        started = time.perf_counter()
+        time.sleep(config.ttft)
+        event(chunk({"role": "assistant", "content": ""}))
+        for n, token in enumerate(tokens, 1):
+            event(chunk({"content": token}))
+            if config.token_rate:
+                # Pace against the start so per-token sleep overhead does not accumulate.
+                delay = started + config.ttft + n / config.token_rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        event(chunk({}, "stop"))
+        if usage is not None:
+            event(json.dumps(dict(base, object="chat.completion.chunk", choices=[], usage=usage)).encode('utf-8'))
+        event(b"[DONE]")
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+def error_body(message, error_type):
+    return {"error": {"message": message, "type": error_type, "code": error_type}}
+
+def make_server(host="127.0.0.1", port=DEFAULT_PORT, config=None, verbose=False):
+    """Returns a stand-in server bound to (host, port); port 0 picks a free one. Call serve_forever()."""
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.config = config or StandinConfig()
+    server.stats = StandinStats()
+    server.verbose = verbose
+    return server
+
+def start_in_thread(config=None, host="127.0.0.1", port=0):
+    """Starts a stand-in server on a background thread. Returns (server, base URL ending in /v1)."""
+    server = make_server(host, port, config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{server.server_address[0]}:{server.server_address[1]}/v1"
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible chat completions stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Completion tokens per second (0: no delay).")
+    parser.add_argument("--ttft", type=float, default=0.2, help="Seconds before the first token.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 500.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with a 429.")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s.")
+    parser.add_argument("--seed", type=int, help="Seed for error and rate-limit injection.")
+    parser.add_argument("--verbose", action="store_true", help="Log every request.")
+    args = parser.parse_args()
+
+    config = StandinConfig(args.token_rate, args.ttft, args.error_rate, args.rate_limit_rate, args.retry_after, args.seed)
+    server = make_server(args.host, args.port, config, args.verbose)
+    print(f"Stand-in listening on http://{args.host}:{server.server_address[1]}/v1", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats.snapshot()), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
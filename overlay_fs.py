@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Copy-on-write in-memory view of a project directory. Reads fall through to the files on
+disk until a path is written; writes only ever go to memory. apply.py writes into an
+overlay instead of the worktree when one is passed to extract_and_apply_changes, so many
+candidate responses can be applied side by side and then inspected, exported as a patch
+or materialized into a scratch directory without touching the real project.
+"""
+import os
+import shutil
+import difflib
+import tempfile
+import threading
+
+NO_NEWLINE_MARKER = "\\ No newline at end of file\n"
+
+class OverlayFS:
+    """Files written on top of root, keyed by absolute path. Safe to share between threads."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._files = {}            # absolute path -> bytes written through the overlay
+        self._lock = threading.Lock()
+
+    def exists(self, path):
+        return path in self._files or os.path.exists(path)
+
+    def read_bytes(self, path):
+        """Returns the content of an absolute path as seen through the overlay."""
+        data = self._files.get(path)
+        if data is not None:
+            return data
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def write_bytes(self, path, data):
+        with self._lock:
+            self._files[path] = bytes(data)
+
+    def read_text(self, filepath):
+        """Returns the decoded content of a project-relative filepath as seen through the overlay."""
+        return self.read_bytes(self._abspath(filepath)).decode('utf-8', errors='replace')
+
+    def changed_files(self):
+        """Returns the sorted project-relative paths whose overlay content differs from disk."""
+        return sorted(
+            os.path.relpath(path, self.root).replace(os.sep, "/")
+            for path, data in list(self._files.items())
+            if self._disk_bytes(path) != data
+        )
+
+    def diff(self, context=3):
+        """Returns a git-style unified diff of every changed file against the files on disk."""
+        out = []
+        for filepath in self.changed_files():
+            path = self._abspath(filepath)
+            old = self._disk_bytes(path)
+            old_lines = [] if old is None else old.decode('utf-8', errors='replace').splitlines(keepends=True)
+            new_lines = self._files[path].decode('utf-8', errors='replace').splitlines(keepends=True)
+            out.append(f"diff --git a/{filepath} b/{filepath}\n")
+            if old is None:
+                out.append("new file mode 100644\n")
+            for line in difflib.unified_diff(old_lines, new_lines, n=context,
+                                             fromfile="/dev/null" if old is None else f"a/{filepath}",
+                                             tofile=f"b/{filepath}"):
+                # The last line of a file without a trailing newline needs git's marker after it.
+                out.append(line if line.endswith("\n") else line + "\n" + NO_NEWLINE_MARKER)
+        return "".join(out)
+
+    def materialize(self, dest=None, ignore=None):
+        """
+        Copies the project into dest (a new temporary directory by default) with the overlay
+        applied and returns its path. ignore is passed through to shutil.copytree.
+        """
+        if dest is None:
+            dest = tempfile.mkdtemp(prefix="apply-overlay-")
+        shutil.copytree(self.root, dest, symlinks=True, ignore=ignore, dirs_exist_ok=True)
+        for path, data in list(self._files.items()):
+            target = os.path.join(dest, os.path.relpath(path, self.root))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+        return dest
+
+    def _abspath(self, filepath):
+        return os.path.abspath(os.path.join(self.root, filepath))
+
+    def _disk_bytes(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
@@ -1,512 +1,596 @@
+import os
+import re
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
-from unittest.mock import patch, mock_open, call
-from apply import extract_and_write_code_blocks
-
-class TestExtractAndWriteCodeBlocks(unittest.TestCase):
-
-    @patch('builtins.print')
-    @patch('os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_single_valid_block_python_comment(self, mock_file_open, mock_os_makedirs, mock_print):
-        input_text = (
-            "```python\n"
-            "// path/to/file.py\n"
-            "print(\"Hello\")\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        expected_filepath = "path/to/file.py"
-        expected_content = "print(\"Hello\")"
-
-        mock_print.assert_any_call("Found 1 code block(s). Processing...")
-        mock_print.assert_any_call(f"  Processing: {expected_filepath}")
-        mock_os_makedirs.assert_called_once_with("path/to", exist_ok=True)
-        mock_file_open.assert_called_once_with(expected_filepath, 'w', encoding='utf-8')
-        mock_file_open().write.assert_called_once_with(expected_content)
-        mock_print.assert_any_call(f"    Successfully wrote to {expected_filepath}")
-
-    @patch('builtins.print')
-    @patch('os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_single_valid_block_hash_comment(self, mock_file_open, mock_os_makedirs, mock_print):
-        input_text = (
-            "```bash\n"
-            "# path/to/script.sh\n"
-            "echo \"Hello\"\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        expected_filepath = "path/to/script.sh"
-        expected_content = "echo \"Hello\""
-
-        mock_os_makedirs.assert_called_once_with("path/to", exist_ok=True)
-        mock_file_open.assert_called_once_with(expected_filepath, 'w', encoding='utf-8')
-        mock_file_open().write.assert_called_once_with(expected_content)
-
-    @patch('builtins.print')
-    @patch('os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_single_valid_block_sql_comment(self, mock_file_open, mock_os_makedirs, mock_print):
-        input_text = (
-            "```sql\n"
-            "-- path/to/query.sql\n"
-            "SELECT 1;\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        expected_filepath = "path/to/query.sql"
-        expected_content = "SELECT 1;"
-
-        mock_os_makedirs.assert_called_once_with("path/to", exist_ok=True)
-        mock_file_open.assert_called_once_with(expected_filepath, 'w', encoding='utf-8')
-        mock_file_open().write.assert_called_once_with(expected_content)
-
-    @patch('builtins.print')
-    @patch('os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_multiple_valid_blocks(self, mock_file_open, mock_os_makedirs, mock_print):
-        input_text = (
-            "```python\n"
-            "// path/to/file1.py\n"
-            "print(1)\n"
-            "```\n"
-            "Some text in between\n"
-            "```\n"
-            "// another/file2.txt\n"
-            "content2\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        mock_print.assert_any_call("Found 2 code block(s). Processing...")
-        mock_os_makedirs.assert_any_call("path/to", exist_ok=True)
-        mock_os_makedirs.assert_any_call("another", exist_ok=True)
-        self.assertEqual(mock_os_makedirs.call_count, 2)
-
-        mock_file_open.assert_any_call("path/to/file1.py", 'w', encoding='utf-8')
-        mock_file_open.assert_any_call("another/file2.txt", 'w', encoding='utf-8')
-        self.assertEqual(mock_file_open.call_count, 2)
-
-        handle_write_calls = mock_file_open().write.call_args_list
-        self.assertIn(call("print(1)"), handle_write_calls)
-        self.assertIn(call("content2"), handle_write_calls)
-
-        mock_print.assert_any_call("    Successfully wrote to path/to/file1.py")
-        mock_print.assert_any_call("    Successfully wrote to another/file2.txt")
-
-    @patch('builtins.print')
-    @patch('os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_no_code_blocks_found(self, mock_file_open, mock_os_makedirs, mock_print):
-        input_text = "This is just some text, no code blocks here."
-        extract_and_write_code_blocks(input_text)
-
-        mock_print.assert_called_once_with("No valid code blocks found.")
-        mock_os_makedirs.assert_not_called()
-        mock_file_open.assert_not_called()
-
-    @patch('builtins.print')
-    @patch('os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_empty_filepath_skipped(self, mock_file_open, mock_os_makedirs, mock_print):
-        input_text = (
-            "```\n"
-            "// \n"
-            "content\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        mock_print.assert_any_call("Found 1 code block(s). Processing...")
-        mock_print.assert_any_call("Warning: Found a code block with an empty filepath. Skipping.")
-        mock_os_makedirs.assert_not_called()
-        mock_file_open.assert_not_called()
-
-    @patch('builtins.print')
-    @patch('os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_path_normalization_windows_style(self, mock_file_open, mock_os_makedirs, mock_print):
-        input_text = (
-            "```\n"
-            "// path\\to\\file.txt\n"
-            "content\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        expected_filepath = "path/to/file.txt"
-        mock_os_makedirs.assert_called_once_with("path/to", exist_ok=True)
-        mock_file_open.assert_called_once_with(expected_filepath, 'w', encoding='utf-8')
-        mock_file_open().write.assert_called_once_with("content")
-
-    @patch('builtins.print')
-    @patch('os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_top_level_file_no_directory_creation(self, mock_file_open, mock_os_makedirs, mock_print):
-        input_text = (
-            "```\n"
-            "// top_level_file.txt\n"
-            "Top level content\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        mock_os_makedirs.assert_not_called()
-        mock_file_open.assert_called_once_with("top_level_file.txt", 'w', encoding='utf-8')
-        mock_file_open().write.assert_called_once_with("Top level content")
-
-    @patch('builtins.print')
-    @patch('os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_content_with_various_whitespaces(self, mock_file_open, mock_os_makedirs, mock_print):
-        expected_content = (
-            "  leading spaces\n"
-            "middle line\n"
-            "trailing spaces  \n"
-            "\n"
-            "  \t  tabs and spaces"
-        )
-        input_text = (
-            "```\n"
-            "// dir/complex_content.txt\n"
-            f"{expected_content}\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        mock_os_makedirs.assert_called_once_with("dir", exist_ok=True)
-        mock_file_open.assert_called_once_with("dir/complex_content.txt", 'w', encoding='utf-8')
-        mock_file_open().write.assert_called_once_with(expected_content)
-
-    @patch('builtins.print')
-    @patch('os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_filepath_with_spaces_in_comment_line_handled_by_regex_and_strip(self, mock_file_open, mock_os_makedirs,
-mock_print):
-        input_text = (
-            "```\n"
-            "//   path/with/spaces.txt   \n"
-            "content\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        expected_filepath = "path/with/spaces.txt"
-        mock_os_makedirs.assert_called_once_with("path/with", exist_ok=True)
-        mock_file_open.assert_called_once_with(expected_filepath, 'w', encoding='utf-8')
-
-    @patch('builtins.print')
-    @patch('os.makedirs', side_effect=OSError("Permission denied"))
-    @patch('builtins.open', new_callable=mock_open)
-    def test_os_error_on_makedirs(self, mock_file_open, mock_os_makedirs_raising_error, mock_print):
-        input_text = (
-            "```\n"
-            "// new_dir/file.txt\n"
-            "content\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        expected_filepath = "new_dir/file.txt"
-        mock_os_makedirs_raising_error.assert_called_once_with("new_dir", exist_ok=True)
-
-        error_message_found = any(
-            f"Error writing to {expected_filepath}: Permission denied" in args[0]
-            for args, _ in mock_print.call_args_list if args
-        )
-        self.assertTrue(error_message_found, "Error message for makedirs failure not printed.")
-        mock_file_open.assert_not_called()
-
-    @patch('builtins.print')
-    @patch('os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_os_error_on_file_write(self, mock_file_open, mock_os_makedirs, mock_print):
-        mock_file_open.return_value.write.side_effect = OSError("Disk full")
-        input_text = (
-            "```\n"
-            "// path/to/another.txt\n"
-            "important data\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        expected_filepath = "path/to/another.txt"
-        mock_os_makedirs.assert_called_once_with("path/to", exist_ok=True)
-        mock_file_open.assert_called_once_with(expected_filepath, 'w', encoding='utf-8')
-        mock_file_open().write.assert_called_once_with("important data")
 
-        error_message_found = any(
-            f"Error writing to {expected_filepath}: Disk full" in args[0]
-            for args, _ in mock_print.call_args_list if args
+from apply import (
+    SERVER_MAX_PROJECTS,
+    ApplyLedger,
+    ApplyProfile,
+    BlockTokenizer,
+    SearchReplaceEngine,
+    apply_blocks,
+    apply_manifest,
+    build_final_result,
+    extract_and_apply_changes,
+    handle_server_request,
+    iter_stream_blocks,
+    parse_search_replace_blocks,
+    tokenize_blocks,
+)
+import apply
+import bench_apply
+from candidate_store import CandidateStore
+from overlay_fs import OverlayFS
+
+# The fence grammar apply.py used to match with a single regex; the tokenizer must agree with it.
+LEGACY_BLOCK_PATTERN = re.compile(
+    r"^\s*```(\w*):([^\n]+?)\s*\n"
+    r"(.*?)"
+    r"\n^\s*```end:\2\s*$",
+    re.DOTALL | re.MULTILINE
+)
+
+def sr_block(search, replace):
+    return f"<<<<<<< SEARCH\n{search}\n=======\n{replace}\n>>>>>>> REPLACE\n"
+
+def fenced(path, body, language="python"):
+    return f"```{language}:{path}\n{body}```end:{path}\n"
+
+class TestBlockTokenizer(unittest.TestCase):
+
+    def test_single_block(self):
+        text = "intro\n```python:src/app.py\nprint('hi')\n```end:src/app.py\noutro"
+        self.assertEqual(tokenize_blocks(text), [("python", "src/app.py", "print('hi')")])
+
+    def test_nested_fence_is_content(self):
+        text = "```md:README.md\n```python:a.py\nx = 1\n```end:a.py\n```end:README.md\n"
+        self.assertEqual(tokenize_blocks(text), [("md", "README.md", "```python:a.py\nx = 1\n```end:a.py")])
+
+    def test_unterminated_fence_is_ignored(self):
+        text = "```python:a.py\nnever closed\n```python:b.py\ny = 2\n```end:b.py\n"
+        self.assertEqual(tokenize_blocks(text), [("python", "b.py", "y = 2")])
+
+    def test_blank_lines_around_content_are_trimmed(self):
+        text = "```python:a.py  \n\n  \nx = 1\n\n```end:a.py\n"
+        self.assertEqual(tokenize_blocks(text), [("python", "a.py", "x = 1")])
+
+    def test_chunked_feed_matches_whole_input(self):
+        text = "".join(fenced(f"f{i}.py", f"x = {i}\n") for i in range(20)) + "```python:open.py\n"
+        tokenizer = BlockTokenizer()
+        blocks = []
+        for i in range(0, len(text), 7):
+            blocks.extend(tokenizer.feed(text[i:i + 7]))
+        blocks.extend(tokenizer.close())
+        self.assertEqual(blocks, tokenize_blocks(text))
+        self.assertEqual(list(iter_stream_blocks(iter([text[:5], text[5:]]))), blocks)
+
+    def test_matches_legacy_regex_on_random_input(self):
+        pieces = ["```py:a", "```py:b", "```end:a", "```end:b", "  ```end:a  ", "```:a", "",
+                  "   ", "foo", "```", "```py:", "```end:", "```py:a\r", "x```end:a"]
+        rng = random.Random(1234)
+        for _ in range(3000):
+            text = "\n".join(rng.choice(pieces) for _ in range(rng.randint(0, 16)))
+            self.assertEqual(tokenize_blocks(text), LEGACY_BLOCK_PATTERN.findall(text), repr(text))
+
+    def test_many_unterminated_fences_stay_fast(self):
+        text = "".join(f"```py:file{i}.py\nx = {i}\n" for i in range(20000))
+        self.assertEqual(tokenize_blocks(text), [])
+
+class TestParseSearchReplaceBlocks(unittest.TestCase):
+
+    def test_multiple_blocks(self):
+        blocks, remainder = parse_search_replace_blocks(sr_block("a", "b") + sr_block("c\nd", ""))
+        self.assertEqual(blocks, [("a", "b"), ("c\nd", "")])
+        self.assertEqual(remainder, "")
+
+    def test_incomplete_block_is_remainder(self):
+        content = "note\n<<<<<<< SEARCH\na\n>>>>>>> REPLACE\n"
+        blocks, remainder = parse_search_replace_blocks(content)
+        self.assertEqual(blocks, [])
+        self.assertEqual(remainder, content.strip())
+
+class TestSearchReplaceEngine(unittest.TestCase):
+
+    def test_matches_sequential_replace(self):
+        rng = random.Random(99)
+        alphabet = ["a", "b", "\n", "ab", "\nb"]
+        for _ in range(3000):
+            original = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 25)))
+            engine = SearchReplaceEngine(original)
+            expected = original
+            for _ in range(rng.randint(1, 6)):
+                search = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 3)))
+                replace = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 3)))
+                found = search in expected
+                if found:
+                    expected = expected.replace(search, replace, 1)
+                self.assertEqual(engine.apply(search, replace), found)
+            self.assertEqual(engine.text(), expected)
+
+    def test_line_index_on_large_text(self):
+        lines = [f"    value_{i} = compute({i})" for i in range(5000)]
+        original = "\n".join(lines) + "\n"
+        engine = SearchReplaceEngine(original)
+        search = "\n".join(lines[100:103])
+        self.assertTrue(engine.apply(search, "replaced"))
+        self.assertTrue(engine.apply("replaced\n" + lines[103] + "\n" + lines[104], "twice"))
+        self.assertFalse(engine.apply(search, "x"))
+        expected = original.replace(search, "replaced", 1).replace("replaced\n" + lines[103] + "\n" + lines[104], "twice", 1)
+        self.assertEqual(engine.text(), expected)
+
+    def test_many_operations_keep_the_original(self):
+        # Hundreds of pending replacements are searched through the piece index, never rebased.
+        rng = random.Random(3)
+        lines = [f"line {i % 97} x" for i in range(20000)]
+        original = "\n".join(lines)
+        for text in (original, original.encode()):
+            engine = SearchReplaceEngine(text)
+            expected = original
+            for _ in range(600):
+                start = rng.randrange(len(lines) - 4)
+                search = "\n".join(lines[start:start + rng.randint(1, 4)])
+                replace = rng.choice(["", "Z", "line 3 x\nline 4 x", search + "\nnew"])
+                found = search in expected
+                if found:
+                    expected = expected.replace(search, replace, 1)
+                self.assertEqual(engine.apply(search, replace), found)
+            self.assertIs(engine.original, text)
+            self.assertEqual(engine.text(), expected if isinstance(text, str) else expected.encode())
+
+    def test_whitespace_tolerant_fallback_reindents(self):
+        original = "class A:\n    def f(self):\n        return 1  \n\n    def g(self):\n        return 2\n"
+        engine = SearchReplaceEngine(original)
+        search, replace = "def f(self):\n    return 1", "def f(self):\n    x = 1\n    return x"
+        self.assertFalse(engine.apply(search, replace))
+        self.assertEqual(engine.apply_whitespace_tolerant(search, replace), 1)
+        self.assertEqual(engine.text(), "class A:\n    def f(self):\n        x = 1\n        return x\n\n    def g(self):\n        return 2\n")
+        self.assertEqual(engine.apply_whitespace_tolerant("\treturn", ""), 0)
+
+    def test_whitespace_tolerant_fallback_requires_a_unique_window(self):
+        engine = SearchReplaceEngine("if a:\n    pass\nif b:\n    pass\n")
+        self.assertEqual(engine.apply_whitespace_tolerant("pass", "return"), 2)
+        self.assertEqual(engine.apply_whitespace_tolerant("if b:\n  pass\n", ""), 1)
+        self.assertEqual(engine.text(), "if a:\n    pass\n")
+
+    def test_whitespace_index_is_reused_until_the_text_changes(self):
+        rng = random.Random(5)
+        lines = ["if a:", "    x = 1", "  y = 2", "", "\treturn x", "z = 3"]
+        for _ in range(300):
+            original = "\n".join(rng.choice(lines) for _ in range(rng.randint(0, 12)))
+            engine = SearchReplaceEngine(original)
+            for _ in range(rng.randint(1, 6)):
+                search = "\n".join(" " * rng.randint(0, 3) + rng.choice(lines).strip() for _ in range(rng.randint(1, 2)))
+                replace = "\n".join(rng.choice(lines) for _ in range(rng.randint(0, 2)))
+                # A fresh engine over the same text builds its index from scratch.
+                fresh = SearchReplaceEngine(engine.text())
+                index = engine._whitespace_index
+                matches = engine.apply_whitespace_tolerant(search, replace)
+                self.assertEqual(matches, fresh.apply_whitespace_tolerant(search, replace))
+                self.assertEqual(engine.text(), fresh.text())
+                if matches != 1 and index is not None:
+                    self.assertIs(engine._whitespace_index, index)
+                if rng.random() < 0.3 and engine.apply(rng.choice(lines).strip() or "x", "q"):
+                    self.assertIsNone(engine._whitespace_index)
+
+class TestExtractAndApplyChanges(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "project")
+        os.makedirs(self.root)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, path, content):
+        target = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return target
+
+    def read(self, path):
+        with open(os.path.join(self.root, path), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def test_search_replace_and_write(self):
+        self.write("a.py", "x = 1\ny = 2\n")
+        text = fenced("a.py", sr_block("x = 1", "x = 10")) + fenced("new/b.py", "print('b')\n")
+        logs = extract_and_apply_changes(text, self.root)
+        self.assertEqual([log["status"] for log in logs], ["success", "success"])
+        self.assertEqual(self.read("a.py"), "x = 10\ny = 2\n")
+        self.assertEqual(self.read("new/b.py"), "print('b')")
+
+    def test_whitespace_fallback_is_opt_in(self):
+        self.write("a.py", "def f():\n\treturn 1\n")
+        text = fenced("a.py", sr_block("return 1", "return 2") + sr_block("  def f():", "def g():"))
+        self.assertEqual(extract_and_apply_changes(text, self.root)[0]["sr_operations"][1]["status"], "not_found")
+        logs = extract_and_apply_changes(text, self.root, whitespace_fallback=True)
+        self.assertEqual([op.get("match") for op in logs[0]["sr_operations"]], [None, "whitespace"])
+        self.assertEqual(self.read("a.py"), "def g():\n\treturn 2\n")
+
+    def test_not_found_and_missing_file(self):
+        self.write("a.py", "x = 1\n")
+        text = fenced("a.py", sr_block("nope", "x")) + fenced("missing.py", sr_block("a", "b"))
+        logs = extract_and_apply_changes(text, self.root)
+        self.assertEqual(logs[0]["status"], "skipped")
+        self.assertEqual(logs[0]["sr_operations"][0]["status"], "not_found")
+        self.assertEqual(logs[1]["status"], "error")
+
+    def test_security_checks(self):
+        self.write("ro.py", "x = 1\n")
+        text = fenced("../escape.py", "x\n") + fenced("ro.py", "y\n")
+        logs = extract_and_apply_changes(text, self.root, readonly_files=["ro.py"])
+        self.assertEqual([log["status"] for log in logs], ["error", "skipped"])
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "escape.py")))
+        self.assertEqual(self.read("ro.py"), "x = 1\n")
+
+    def test_no_blocks(self):
+        logs = extract_and_apply_changes("just prose", self.root)
+        self.assertEqual(logs[0]["operation_type"], "parse")
+        self.assertEqual(logs[0]["status"], "error")
+
+    def test_blocks_for_one_file_are_applied_in_order(self):
+        self.write("a.py", "x = 1\n")
+        text = fenced("a.py", sr_block("x = 1", "x = 2")) + fenced("a.py", sr_block("x = 2", "x = 3"))
+        logs = extract_and_apply_changes(text, self.root)
+        self.assertEqual([log["status"] for log in logs], ["success", "success"])
+        self.assertEqual(self.read("a.py"), "x = 3\n")
+
+    def test_unchanged_file_is_not_rewritten(self):
+        target = self.write("a.py", "x = 1\n")
+        os.utime(target, (1000000000, 1000000000))
+        text = fenced("a.py", sr_block("x = 1", "x = 2")) + fenced("a.py", sr_block("x = 2", "x = 1"))
+        logs = extract_and_apply_changes(text, self.root)
+        self.assertEqual(logs[1]["status"], "success")
+        self.assertIn("write skipped", logs[1]["message"])
+        self.assertEqual(os.stat(target).st_mtime, 1000000000)
+
+    def test_mapped_file_is_edited_as_bytes(self):
+        target = os.path.join(self.root, "big.bin")
+        with open(target, 'wb') as f:
+            f.write(b"head \xff\xfe\nx = 1\ntail\n")
+        os.chmod(target, 0o640)
+        text = fenced("big.bin", sr_block("x = 1", "x = 2")) + fenced("big.bin", sr_block("nope", "y"))
+        logs = extract_and_apply_changes(text, self.root, mmap_threshold=1)
+        self.assertEqual([log["status"] for log in logs], ["success", "skipped"])
+        with open(target, 'rb') as f:
+            self.assertEqual(f.read(), b"head \xff\xfe\nx = 2\ntail\n")
+        self.assertEqual(os.stat(target).st_mode & 0o777, 0o640)
+        self.assertEqual(os.listdir(self.root), ["big.bin"])
+
+    def test_jobs_keep_input_order(self):
+        for i in range(30):
+            self.write(f"m{i}.py", f"v = {i}\n")
+        text = "".join(fenced(f"m{i}.py", sr_block(f"v = {i}", f"v = {i + 1}")) for i in reversed(range(30)))
+        sequential = extract_and_apply_changes(text, self.root)
+        for i in range(30):
+            self.write(f"m{i}.py", f"v = {i}\n")
+        parallel = extract_and_apply_changes(text, self.root, jobs=8)
+        self.assertEqual(parallel, sequential)
+        self.assertEqual([log["filepath"] for log in parallel], [f"m{i}.py" for i in reversed(range(30))])
+
+    def test_unified_diff_hunks_with_offset_and_fuzz(self):
+        self.write("a.py", "import os\n\ndef f():\n    return 1\n\ndef g():\n    return 2\n")
+        diff = (
+            "--- a/a.py\n+++ b/a.py\n"
+            "@@ -1,3 +1,3 @@\n-def f():\n+def f(x):\n     return 1\n \n"
+            "@@ -4,3 +4,3 @@\n def changed_context():\n-    return 2\n+    return 3\n"
         )
-        self.assertTrue(error_message_found, "Error message for file write failure not printed.")
-
-        success_message_found = any(
-            f"Successfully wrote to {expected_filepath}" in args[0]
-            for args, _ in mock_print.call_args_list if args
-        )
-        self.assertFalse(success_message_found, "Success message printed despite write error.")
-
-    @patch('builtins.print')
-    @patch('os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_mixed_valid_and_empty_filepath_block(self, mock_file_open, mock_os_makedirs, mock_print):
-        input_text = (
-            "```\n"
-            "// valid/file.txt\n"
-            "valid content\n"
-            "```\n"
-            "```\n"
-            "// \n"
-            "ignored content\n"
-            "```\n"
-            "```python\n"
-            "// another/valid.py\n"
-            "pass\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        mock_print.assert_any_call("Found 3 code block(s). Processing...")
-        mock_print.assert_any_call("Warning: Found a code block with an empty filepath. Skipping.")
-
-        self.assertEqual(mock_os_makedirs.call_count, 2)
-        mock_os_makedirs.assert_any_call("valid", exist_ok=True)
-        mock_os_makedirs.assert_any_call("another", exist_ok=True)
-
-        self.assertEqual(mock_file_open.call_count, 2)
-        mock_file_open.assert_any_call("valid/file.txt", 'w', encoding='utf-8')
-        mock_file_open.assert_any_call("another/valid.py", 'w', encoding='utf-8')
-
-        handle_write_calls = mock_file_open().write.call_args_list
-        self.assertIn(call("valid content"), handle_write_calls)
-        self.assertIn(call("pass"), handle_write_calls)
-        self.assertNotIn(call("ignored content"), handle_write_calls)
-
-    @patch('builtins.print')
-    @patch('os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_block_with_empty_content(self, mock_file_open, mock_os_makedirs, mock_print):
-        input_text = (
-            "```\n"
-            "// path/empty_file.txt\n"
-            "\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        expected_filepath = "path/empty_file.txt"
-        mock_os_makedirs.assert_called_once_with("path", exist_ok=True)
-        mock_file_open.assert_called_once_with(expected_filepath, 'w', encoding='utf-8')
-        mock_file_open().write.assert_called_once_with("") # Empty content
-
-    @patch('builtins.print')
-    @patch('os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_content_containing_backticks_and_nested_fences(self, mock_file_open, mock_os_makedirs, mock_print):
-        input_text = (
-            "```\n"
-            "// path/to/file_with_backticks.md\n"
-            "This is a markdown file.\n"
-            "It can contain `inline code` and also fenced code blocks:\n"
-            "```python\n"
-            "print('nested')\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        expected_filepath = "path/to/file_with_backticks.md"
-        expected_content = (
-            "This is a markdown file.\n"
-            "It can contain `inline code` and also fenced code blocks:\n"
-            "```python\n"
-            "print('nested')"
-        )
-        mock_os_makedirs.assert_called_once_with("path/to", exist_ok=True)
-        mock_file_open.assert_called_once_with(expected_filepath, 'w', encoding='utf-8')
-        mock_file_open().write.assert_called_once_with(expected_content)
-
-    @patch('builtins.print')
-    @patch('os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_unexpected_error_on_file_write(self, mock_file_open, mock_os_makedirs, mock_print):
-        mock_file_open.return_value.write.side_effect = Exception("Unexpected cosmic ray")
-        input_text = (
-            "```\n"
-            "// path/to/surprise.txt\n"
-            "surprise data\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-        expected_filepath = "path/to/surprise.txt"
-
-        error_message_found = any(
-            f"An unexpected error occurred with {expected_filepath}: Unexpected cosmic ray" in args[0]
-            for args, _ in mock_print.call_args_list if args
-        )
-        self.assertTrue(error_message_found, "Unexpected error message not printed.")
-
-    # SEARCH/REPLACE TESTS
-    @patch('builtins.print')
-    @patch('os.path.exists', return_value=True)
-    @patch('builtins.open', new_callable=mock_open, read_data="original line1\nsearch content\noriginal line2")
-    def test_search_replace_block_success(self, mock_file_open, mock_exists, mock_print):
-        input_text = (
-            "```python:path/to/file.py\n"
-            "<<<<<<< SEARCH\n"
-            "search content\n"
-            "=======\n"
-            "replace content\n"
-            ">>>>>>> REPLACE\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        expected_filepath = "path/to/file.py"
-        mock_print.assert_any_call("Found 1 code block(s). Processing...")
-        mock_print.assert_any_call(f"  Processing: {expected_filepath}")
-        mock_print.assert_any_call("    [SEARCH/REPLACE mode]")
-
-        # Should have read the existing file
-        mock_file_open.assert_any_call(expected_filepath, 'r', encoding='utf-8')
-
-        # Should have written the updated content
-        mock_file_open.assert_any_call(expected_filepath, 'w', encoding='utf-8')
-        mock_file_open().write.assert_called_once_with("original line1\nreplace content\noriginal line2")
-
-        mock_print.assert_any_call("    Successfully updated path/to/file.py with replacements.")
-
-    @patch('builtins.print')
-    @patch('os.path.exists', return_value=False)
-    @patch('builtins.open', new_callable=mock_open)
-    def test_search_replace_block_file_not_found(self, mock_file_open, mock_exists, mock_print):
-        input_text = (
-            "```python:path/to/missing.py\n"
-            "<<<<<<< SEARCH\n"
-            "search content\n"
-            "=======\n"
-            "replace content\n"
-            ">>>>>>> REPLACE\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        expected_filepath = "path/to/missing.py"
-        mock_print.assert_any_call("    [SEARCH/REPLACE mode]")
-        mock_print.assert_any_call(f"    Error: File not found for SEARCH/REPLACE block: {expected_filepath}")
-        mock_file_open.assert_not_called()
-
-    @patch('builtins.print')
-    @patch('os.path.exists', return_value=True)
-    @patch('builtins.open', new_callable=mock_open, read_data="original content")
-    def test_search_replace_block_pattern_not_found(self, mock_file_open, mock_exists, mock_print):
-        input_text = (
-            "```python:path/to/file.py\n"
-            "<<<<<<< SEARCH\n"
-            "missing pattern\n"
-            "=======\n"
-            "replace content\n"
-            ">>>>>>> REPLACE\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        expected_filepath = "path/to/file.py"
-        mock_print.assert_any_call("    [SEARCH/REPLACE mode]")
-        mock_print.assert_any_call(f"    Warning: Search pattern not found in {expected_filepath}. No changes made.")
-        mock_file_open().write.assert_not_called()
-
-    @patch('builtins.print')
-    @patch('os.path.exists', return_value=True)
-    @patch('builtins.open', side_effect=OSError("Read error"))
-    def test_search_replace_block_os_error(self, mock_file_open, mock_exists, mock_print):
-        input_text = (
-            "```python:path/to/file.py\n"
-            "<<<<<<< SEARCH\n"
-            "search content\n"
-            "=======\n"
-            "replace content\n"
-            ">>>>>>> REPLACE\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        expected_filepath = "path/to/file.py"
-        mock_print.assert_any_call(f"    Error reading/writing {expected_filepath}: Read error")
-
-    @patch('builtins.print')
-    @patch('os.path.exists', return_value=True)
-    @patch('builtins.open', new_callable=mock_open, read_data="line1\nline2\nline3")
-    def test_search_replace_multiline_content(self, mock_file_open, mock_exists, mock_print):
-        input_text = (
-            "```python:path/to/file.py\n"
-            "<<<<<<< SEARCH\n"
-            "line1\n"
-            "line2\n"
-            "=======\n"
-            "new line1\n"
-            "new line2\n"
-            ">>>>>>> REPLACE\n"
-            "```"
-        )
-        extract_and_write_code_blocks(input_text)
-
-        mock_file_open().write.assert_called_once_with("new line1\nnew line2\nline3")
-
-    @patch('builtins.print')
-    @patch('os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('os.path.exists', side_effect=lambda path: path == "existing.py")
-    def test_mixed_write_and_search_replace_blocks(self, mock_exists, mock_file_open, mock_os_makedirs, mock_print):
-        input_text = (
-            "```\n"
-            "// new_file.txt\n"
-            "new content\n"
-            "```\n"
-            "```python:existing.py\n"
-            "<<<<<<< SEARCH\n"
-            "old\n"
-            "=======\n"
-            "new\n"
-            ">>>>>>> REPLACE\n"
-            "```"
-        )
-
-        # Setup mock for reading existing.py
-        read_handles = {
-            "existing.py": mock_open(read_data="line1\nold\nline3").return_value
-        }
-
-        # Setup mock for writing files
-        write_handles = {}
-
-        def open_side_effect(path, mode, *args, **kwargs):
-            if mode == 'r':
-                return read_handles.get(path, mock_open.return_value)
-            elif mode == 'w':
-                handle = mock_open.return_value
-                write_handles[path] = handle
-                return handle
-
-        mock_file_open.side_effect = open_side_effect
-
-        extract_and_write_code_blocks(input_text)
-
-        mock_print.assert_any_call("Found 2 code block(s). Processing...")
-        mock_print.assert_any_call("  Processing: new_file.txt")
-        mock_print.assert_any_call("    Successfully wrote to new_file.txt")
-        mock_print.assert_any_call("  Processing: existing.py")
-        mock_print.assert_any_call("    [SEARCH/REPLACE mode]")
-        mock_print.assert_any_call("    Successfully updated existing.py with replacements.")
-
-        # Verify writes
-        write_calls = mock_file_open.return_value.write.call_args_list
-        self.assertEqual(len(write_calls), 2)
-        self.assertEqual(write_calls[0][0][0], "new content")  # new_file.txt
-        self.assertEqual(write_calls[1][0][0], "line1\nnew\nline3")  # existing.py
+        logs = extract_and_apply_changes(fenced("a.py", diff, "diff"), self.root)
+        self.assertEqual(logs[0]["operation_type"], "unified_diff")
+        hunks = logs[0]["hunk_operations"]
+        self.assertEqual([(h["status"], h["offset"], h["fuzz"]) for h in hunks], [("success", 2, 0), ("success", 2, 1)])
+        self.assertEqual(self.read("a.py"), "import os\n\ndef f(x):\n    return 1\n\ndef g():\n    return 3\n")
+
+    def test_unified_diff_reports_unmatched_hunks_and_creates_files(self):
+        self.write("a.py", "x = 1\n")
+        text = (fenced("a.py", "@@ -1 +1 @@\n-y = 1\n+y = 2\n") +
+                fenced("new.py", "--- /dev/null\n+++ b/new.py\n@@ -0,0 +1,2 @@\n+a = 1\n+b = 2\n") +
+                fenced("notes.patch", "@@ -1 +1 @@\n-a\n+b\n"))
+        logs = extract_and_apply_changes(text, self.root)
+        self.assertEqual([log["status"] for log in logs], ["skipped", "success", "success"])
+        self.assertEqual(logs[0]["hunk_operations"][0]["status"], "not_found")
+        self.assertEqual(self.read("new.py"), "a = 1\nb = 2\n")
+        self.assertEqual(logs[2]["operation_type"], "write")
+
+    def test_unified_diff_follows_no_newline_markers(self):
+        self.write("add.py", "x = 1\ny = 1")
+        self.write("drop.py", "x = 1\ny = 1\n")
+        self.write("keep.py", "x = 1\ny = 1")
+        text = (fenced("add.py", "@@ -1,2 +1,2 @@\n x = 1\n-y = 1\n\\ No newline at end of file\n+y = 2\n") +
+                fenced("drop.py", "@@ -1,2 +1,2 @@\n x = 1\n-y = 1\n+y = 2\n\\ No newline at end of file\n") +
+                fenced("keep.py", "@@ -1,2 +1,2 @@\n-x = 1\n+x = 2\n y = 1\n\\ No newline at end of file\n") +
+                fenced("new.py", "--- /dev/null\n+++ b/new.py\n@@ -0,0 +1 @@\n+n = 2\n\\ No newline at end of file\n"))
+        logs = extract_and_apply_changes(text, self.root)
+        self.assertEqual([log["status"] for log in logs], ["success"] * 4)
+        self.assertEqual([self.read(name) for name in ("add.py", "drop.py", "keep.py", "new.py")],
+                         ["x = 1\ny = 2\n", "x = 1\ny = 2", "x = 2\ny = 1", "n = 2"])
+
+    def test_unified_diff_is_refused_on_a_mapped_file(self):
+        self.write("big.py", "x = 1\ny = 1\n")
+        self.write("small.py", "x = 1\n")
+        diff = "@@ -1 +1 @@\n-x = 1\n+x = 2\n"
+        logs = extract_and_apply_changes(fenced("big.py", diff) + fenced("small.py", diff), self.root, mmap_threshold=8)
+        self.assertEqual([log["status"] for log in logs], ["error", "success"])
+        self.assertIn("--mmap-threshold", logs[0]["message"])
+        self.assertEqual((self.read("big.py"), self.read("small.py")), ("x = 1\ny = 1\n", "x = 2\n"))
+        self.assertEqual(sorted(os.listdir(self.root)), ["big.py", "small.py"])
+
+    def test_manifest_batch_reports_each_record_in_order(self):
+        other = os.path.join(self.tmp.name, "other")
+        os.makedirs(other)
+        self.write("a.py", "x = 1\n")
+        manifest = os.path.join(self.tmp.name, "manifest.jsonl")
+        records = [
+            {"project_root": self.root, "response": fenced("a.py", sr_block("x = 1", "x = 2"))},
+            {"project_root": other, "response": fenced("b.py", "y = 1\n"), "readonly_files": ["b.py"]},
+            {"project_root": os.path.join(self.tmp.name, "missing"), "response": "x"},
+        ]
+        with open(manifest, 'w', encoding='utf-8') as f:
+            f.write("\n".join(json.dumps(record) for record in records) + "\n\nnot json\n")
+        for workers in (1, 2):
+            self.write("a.py", "x = 1\n")
+            results = []
+            summary = apply_manifest(manifest, results.append, workers=workers)
+            self.assertEqual([r["index"] for r in results], [0, 1, 2, 3])
+            self.assertEqual([r["status"] for r in results], ["success", "success", "error", "error"])
+            self.assertEqual(results[1]["operations"][0]["status"], "skipped")
+            self.assertEqual(self.read("a.py"), "x = 2\n")
+            self.assertEqual(summary["records"], 4)
+            self.assertEqual(summary["record_status"], {"success": 2, "error": 2})
+            self.assertEqual(summary["operation_status"], {"success": 1, "skipped": 1})
+
+    def test_batch_and_server_honour_dry_run(self):
+        self.write("a.py", "x = 1\n")
+        text = fenced("a.py", sr_block("x = 1", "x = 2"))
+        manifest = os.path.join(self.tmp.name, "manifest.jsonl")
+        with open(manifest, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"project_root": self.root, "response": text}) + "\n")
+        for workers in (1, 2):
+            results = []
+            apply_manifest(manifest, results.append, workers=workers, options={"dry_run": True, "profile": True})
+            self.assertIn("+x = 2\n", results[0]["patch"])
+            self.assertIn("profile", results[0])
+        result = handle_server_request({"text": text, "project_root": self.root}, {}, threading.Lock(), {"dry_run": True})
+        self.assertEqual(result["status"], "success")
+        self.assertIn("+x = 2\n", result["patch"])
+        self.assertEqual(self.read("a.py"), "x = 1\n")
+
+    def test_operations_are_reported_once_their_file_is_written(self):
+        text = "".join(fenced(f"m{i}.py", f"v = {i}\n") for i in range(10)) + fenced("../x.py", "x\n")
+        seen = []
+
+        def on_operation(op_log):
+            if op_log["status"] == "success":
+                self.assertEqual(self.read(op_log["filepath"]), f"v = {op_log['filepath'][1:-3]}")
+            seen.append(op_log)
+
+        logs = extract_and_apply_changes(text, self.root, jobs=4, on_operation=on_operation)
+        self.assertEqual(sorted(map(id, seen)), sorted(map(id, logs)))
+
+    def test_stream_summary_counts_the_batch_operations(self):
+        text = fenced("a.py", sr_block("x = 1", "x = 2") + sr_block("nope", "y")) + fenced("b/c.py", "c\n")
+        outputs = {}
+        for mode in ("batch", "stream"):
+            root = os.path.join(self.tmp.name, mode)
+            os.makedirs(root)
+            with open(os.path.join(root, "a.py"), 'w', encoding='utf-8') as f:
+                f.write("x = 1\n")
+            command = [sys.executable, apply.__file__] + (["--stream"] if mode == "stream" else [])
+            outputs[mode] = subprocess.run(command, input=text, capture_output=True, text=True, cwd=root).stdout
+        batch = json.loads(outputs["batch"])
+        events = [json.loads(line) for line in outputs["stream"].splitlines()]
+        self.assertEqual([event.pop("event") for event in events], ["operation"] * len(batch["operations"]) + ["summary"])
+        self.assertEqual(events[:-1], batch["operations"])
+        operations = batch.pop("operations")
+        self.assertEqual(events[-1], dict(batch, operation_count=len(operations),
+                                          operation_status={"success": 2}))
+
+    def test_profile_counts_bytes_and_phases(self):
+        self.write("a.py", "x = 1\n")
+        text = fenced("a.py", sr_block("x = 1", "x = 22") + sr_block("nope", "y")) + fenced("b.py", "hi\n")
+        profile = ApplyProfile()
+        logs = extract_and_apply_changes(text, self.root, profile=profile)
+        self.assertEqual([op["profile"]["scan_chars"] > 0 for op in logs[0]["sr_operations"]], [True, True])
+        self.assertEqual((logs[0]["profile"]["bytes_read"], logs[0]["profile"]["bytes_written"]), (6, 7))
+        summary = profile.summary(logs)
+        self.assertEqual(set(summary["phases_ms"]), {"parse", "read", "match", "write"})
+        self.assertEqual((summary["bytes_read"], summary["bytes_written"]), (6, 9))
+        self.assertNotIn("profile", extract_and_apply_changes(text, self.root)[0])
+
+    def test_ledger_recognizes_a_retried_response(self):
+        self.write("a.py", "x = 1\ny = 1\n")
+        ledger_path = os.path.join(self.tmp.name, "ledger")
+        text = fenced("a.py", sr_block("x = 1", "x = 2")) + fenced("a.py", sr_block("y = 1", "y = 2"))
+        first = extract_and_apply_changes(text, self.root, ledger=ApplyLedger(ledger_path))
+        self.assertEqual([log["status"] for log in first], ["success", "success"])
+        for write_through in (False, True):
+            logs = apply_blocks(tokenize_blocks(text), self.root, write_through=write_through, ledger=ApplyLedger(ledger_path))
+            self.assertEqual([log["status"] for log in logs], ["already_applied", "already_applied"])
+            self.assertEqual(logs[0]["sr_operations"][0]["status"], "already_applied")
+        self.assertEqual(self.read("a.py"), "x = 2\ny = 2\n")
+        # Without a ledger the retry cannot tell, and an edited file no longer matches the recorded keys.
+        self.assertEqual(extract_and_apply_changes(text, self.root)[0]["status"], "skipped")
+        self.write("a.py", "x = 1\ny = 2\n")
+        logs = extract_and_apply_changes(text, self.root, ledger=ApplyLedger(ledger_path))
+        self.assertEqual([log["status"] for log in logs], ["success", "skipped"])
+
+    def test_atomic_writes_all_files_or_none(self):
+        self.write("a.py", "x = 1\n")
+        self.write("b.py", "y = 1\n")
+        good = fenced("a.py", sr_block("x = 1", "x = 2")) + fenced("new/c.py", "z = 1\n")
+        logs = extract_and_apply_changes(good + fenced("missing.py", sr_block("a", "b")), self.root, jobs=2, atomic=True)
+        self.assertEqual([log["status"] for log in logs], ["rolled_back", "rolled_back", "error"])
+        self.assertEqual(self.read("a.py"), "x = 1\n")
+        self.assertEqual(sorted(os.listdir(self.root)), ["a.py", "b.py"])
+
+        seen = []
+        logs = extract_and_apply_changes(good + fenced("b.py", sr_block("nope", "y")), self.root,
+                                         on_operation=seen.append, atomic=True)
+        self.assertEqual([log["status"] for log in logs], ["success", "success", "skipped"])
+        self.assertEqual(seen, logs)
+        self.assertEqual((self.read("a.py"), self.read("new/c.py")), ("x = 2\n", "z = 1"))
+        self.assertEqual(sorted(os.listdir(self.root)), ["a.py", "b.py", "new"])
+
+    def test_rolled_back_operations_are_not_recorded_in_the_ledger(self):
+        self.write("a.py", "x = 1\n")
+        ledger_path = os.path.join(self.tmp.name, "ledger")
+        edit = fenced("a.py", sr_block("x = 1", "x = 2"))
+        for mmap_threshold in (1, 0):
+            logs = extract_and_apply_changes(edit + fenced("missing.py", sr_block("a", "b")), self.root, atomic=True,
+                                             mmap_threshold=mmap_threshold, ledger=ApplyLedger(ledger_path))
+            self.assertEqual([log["status"] for log in logs], ["rolled_back", "error"])
+        logs = extract_and_apply_changes(edit, self.root, atomic=True, mmap_threshold=1, ledger=ApplyLedger(ledger_path))
+        self.assertEqual(logs[0]["status"], "success")
+        self.assertEqual(self.read("a.py"), "x = 2\n")
+        logs = extract_and_apply_changes(edit, self.root, ledger=ApplyLedger(ledger_path))
+        self.assertEqual(logs[0]["status"], "already_applied")
+
+    def test_interrupted_transaction_is_recovered(self):
+        target = self.write("a.py", "x = 1\n")
+        tmp_path = self.write(".a.py.1-2.apply-tmp", "x = 2\n")
+        journal = os.path.join(self.root, ".apply-journal.json")
+        created = [os.path.join(self.root, "d"), os.path.join(self.root, "d", "e")]
+        for state, expected in (("staging", "x = 1\n"), ("committing", "x = 2\n")):
+            self.write(".a.py.1-2.apply-tmp", "x = 2\n")
+            if state == "staging":
+                self.write("d/e/.c.py.1-2.apply-tmp", "z\n")
+            with open(journal, 'w', encoding='utf-8') as f:
+                json.dump({"state": state, "txid": "1-2", "targets": [target, os.path.join(created[1], "c.py")],
+                           "created_dirs": created, "renames": [[tmp_path, target]]}, f)
+            logs = extract_and_apply_changes(fenced("b.py", "y\n"), self.root)
+            self.assertEqual([log["operation_type"] for log in logs], ["recovery", "write"])
+            self.assertEqual(self.read("a.py"), expected)
+            self.assertEqual(sorted(os.listdir(self.root)), ["a.py", "b.py"])
+
+    def test_journal_naming_files_outside_the_project_is_rejected(self):
+        outside = os.path.join(self.tmp.name, "victim.txt")
+        with open(outside, 'w', encoding='utf-8') as f:
+            f.write("keep\n")
+        payload = self.write("payload", "owned\n")
+        journal = os.path.join(self.root, ".apply-journal.json")
+        for record in ({"state": "committing", "txid": "1-2", "renames": [[payload, os.path.join(self.root, "..", "victim.txt")]]},
+                       {"state": "committing", "txid": "1-2", "renames": [[payload, os.path.join(self.root, "a.py")]]},
+                       {"state": "staging", "txid": "../x", "targets": [os.path.join(self.root, "a.py")]},
+                       {"state": "staging", "txid": "1-2", "targets": [outside]}):
+            with open(journal, 'w', encoding='utf-8') as f:
+                json.dump(record, f)
+            logs = extract_and_apply_changes(fenced("b.py", "y\n"), self.root)
+            self.assertEqual([(log["operation_type"], log["status"]) for log in logs], [("recovery", "error")])
+            with open(outside, 'r', encoding='utf-8') as f:
+                self.assertEqual(f.read(), "keep\n")
+            self.assertEqual(sorted(os.listdir(self.root)), [".apply-journal.json", "payload"])
+
+    def test_overlay_keeps_candidates_off_disk(self):
+        self.write("a.py", "x = 1\ny = 1\n")
+        candidates = [fenced("a.py", sr_block("x = 1", f"x = {i}")) + fenced("new.py", f"n = {i}\n") for i in (2, 3)]
+        overlays = [OverlayFS(self.root) for _ in candidates]
+        threads = [threading.Thread(target=extract_and_apply_changes, args=(text, self.root), kwargs={"overlay": overlay})
+                   for text, overlay in zip(candidates, overlays)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(os.listdir(self.root)), ["a.py"])
+        self.assertEqual(self.read("a.py"), "x = 1\ny = 1\n")
+        self.assertEqual([overlay.read_text("a.py") for overlay in overlays], ["x = 2\ny = 1\n", "x = 3\ny = 1\n"])
+        self.assertEqual(overlays[0].changed_files(), ["a.py", "new.py"])
+        self.assertEqual(overlays[0].diff(), (
+            "diff --git a/a.py b/a.py\n--- a/a.py\n+++ b/a.py\n@@ -1,2 +1,2 @@\n-x = 1\n+x = 2\n y = 1\n"
+            "diff --git a/new.py b/new.py\nnew file mode 100644\n--- /dev/null\n+++ b/new.py\n@@ -0,0 +1 @@\n+n = 2\n"
+            "\\ No newline at end of file\n"
+        ))
+        copy = overlays[1].materialize(os.path.join(self.tmp.name, "copy"))
+        with open(os.path.join(copy, "new.py"), 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), "n = 3")
+
+    def test_server_request_matches_main_result(self):
+        self.write("a.py", "x = 1\n")
+        request = {"text": fenced("a.py", sr_block("x = 1", "x = 2")), "project_root": self.root}
+        result = handle_server_request(request, {}, threading.Lock())
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["summary"], "Processed 1 operation(s).")
+        self.assertEqual(self.read("a.py"), "x = 2\n")
+        self.assertEqual(handle_server_request({"text": "", "project_root": self.root}, {}, threading.Lock())["status"], "error")
+
+    def test_server_keeps_only_recent_projects(self):
+        projects, lock = {}, threading.Lock()
+        roots = [os.path.join(self.tmp.name, f"p{i}") for i in range(SERVER_MAX_PROJECTS)]
+        for root in [self.root] + roots:
+            os.makedirs(root, exist_ok=True)
+            handle_server_request({"text": fenced("a.py", "x\n"), "project_root": root}, projects, lock)
+            if root == roots[0]:
+                handle_server_request({"text": fenced("a.py", "y\n"), "project_root": self.root}, projects, lock)
+        self.assertEqual(len(projects), SERVER_MAX_PROJECTS)
+        # self.root was used again after roots[0], so roots[0] is the least recently used.
+        self.assertNotIn(roots[0], projects)
+        self.assertIn(self.root, projects)
+
+    def test_server_does_not_evict_a_project_about_to_be_applied(self):
+        projects, lock = {}, threading.Lock()
+        roots = [os.path.join(self.tmp.name, f"p{i}") for i in range(SERVER_MAX_PROJECTS)]
+        for root in roots:
+            os.makedirs(root)
+            handle_server_request({"text": fenced("a.py", "x\n"), "project_root": root}, projects, lock)
+        self.assertTrue(all(state.users == 0 for state in projects.values()))
+        # A request has looked roots[0] up but not yet taken its lock.
+        waiting = projects[roots[0]]
+        waiting.users += 1
+        handle_server_request({"text": fenced("a.py", "x\n"), "project_root": self.root}, projects, lock)
+        self.assertIs(projects[roots[0]], waiting)
+        self.assertNotIn(roots[1], projects)
+
+class TestCandidateStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = CandidateStore(os.path.join(self.tmp.name, "candidates"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_save_deduplicates_and_merges_index(self):
+        first = self.store.save("response A\n", model="m1", tags=["task-1"])
+        again = self.store.save("response A\n", tags=["best"])
+        other = self.store.save("response B\n", model="m2")
+        self.assertEqual(first["id"], again["id"])
+        self.assertEqual(again["tags"], ["best", "task-1"])
+        self.assertEqual(again["model"], "m1")
+        blobs = [name for _, _, names in os.walk(self.store.objects_dir) for name in names]
+        self.assertEqual(len(blobs), 2)
+        self.assertEqual([entry["id"] for entry in self.store.list()], [first["id"], other["id"]])
+        self.assertEqual([entry["id"] for entry in self.store.list(tags=["best"])], [first["id"]])
+        self.assertEqual([entry["id"] for entry in self.store.list(model="m2")], [other["id"]])
+
+    def test_load_and_diff_by_prefix(self):
+        old = self.store.save("x = 1\ny = 2\n")["id"]
+        new = self.store.save("x = 1\ny = 3\n")["id"]
+        self.assertEqual(self.store.load(old[:8]), "x = 1\ny = 2\n")
+        diff = self.store.diff(old[:8], new)
+        self.assertIn("-y = 2\n+y = 3\n", diff)
+        with self.assertRaises(ValueError):
+            self.store.load("abc")
+        with self.assertRaises(ValueError):
+            self.store.load("0000")
+
+class TestBenchApply(unittest.TestCase):
+
+    def test_generated_case_applies_cleanly(self):
+        params = {"files": 3, "blocks_per_file": 2, "sr_per_block": 2, "file_size": 2048, "malformed_ratio": 0.0}
+        project, response = bench_apply.generate_case(**params)
+        self.assertEqual(bench_apply.generate_case(**params), (project, response))
+        with tempfile.TemporaryDirectory() as root:
+            bench_apply._write_project(root, project)
+            logs = extract_and_apply_changes(response, root)
+        self.assertEqual(len(logs), 6)
+        self.assertTrue(all(log["status"] == "success" for log in logs))
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,110 @@
+import time
+import random
+import difflib
+import unittest
+
+from diff_stats import diff_line_stats, diff_stats
+
+def apply_spans(old, new, spans):
+    """Rebuilds new from old using only the changed spans; unchanged lines must line up."""
+    out, a_pos, b_pos = [], 0, 0
+    for a_lo, a_hi, b_lo, b_hi in spans:
+        assert old[a_pos:a_lo] == new[b_pos:b_lo]
+        out.extend(old[a_pos:a_lo])
+        out.extend(new[b_lo:b_hi])
+        a_pos, b_pos = a_hi, b_hi
+    assert old[a_pos:] == new[b_pos:]
+    return out + old[a_pos:]
+
+def difflib_counts(old, new):
+    """(additions, deletions) of difflib's unified diff."""
+    diff = list(difflib.unified_diff(old, new, n=0))
+    return (sum(1 for line in diff if line.startswith('+') and not line.startswith('+++')),
+            sum(1 for line in diff if line.startswith('-') and not line.startswith('---')))
+
+class TestDiffStats(unittest.TestCase):
+
+    def test_simple_edit(self):
+        stats = diff_stats("a\nb\nc\nd\n", "a\nB\nc\nd\ne\n")
+        self.assertEqual((stats.additions, stats.deletions), (2, 1))
+        self.assertEqual(stats.spans, [(1, 2, 1, 2), (4, 4, 4, 5)])
+        self.assertFalse(stats.truncated)
+        self.assertEqual(diff_stats("x\n", "x\n").spans, [])
+
+    def test_spans_rebuild_new(self):
+        rng = random.Random(7)
+        for _ in range(1000):
+            old = [rng.choice("abcdefg") for _ in range(rng.randint(0, 40))]
+            new = list(old)
+            for _ in range(rng.randint(0, 6)):
+                i = rng.randint(0, len(new))
+                new[i:i + rng.randint(0, 3)] = [rng.choice("abcdxyz") for _ in range(rng.randint(0, 3))]
+            stats = diff_line_stats(old, new, max_hunks=rng.choice([None, 1, 3]))
+            self.assertEqual(apply_spans(old, new, stats.spans), new)
+            self.assertEqual(stats.additions - stats.deletions, len(new) - len(old))
+
+    def test_counts_are_no_worse_than_difflib_on_code_like_lines(self):
+        rng = random.Random(11)
+        for _ in range(1000):
+            old = [f"line {rng.randint(0, 500)}" for _ in range(rng.randint(0, 80))] + ["", "}", ""] * 3
+            rng.shuffle(old)
+            new = list(old)
+            for _ in range(rng.randint(0, 5)):
+                i = rng.randint(0, len(new))
+                new[i:i + rng.randint(0, 2)] = [f"new {rng.randint(0, 50)}" for _ in range(rng.randint(0, 2))]
+            expected = difflib_counts(old, new)
+            stats = diff_line_stats(old, new)
+            self.assertLessEqual(stats.deletions, expected[1], (old, new))
+            self.assertEqual(stats.additions - stats.deletions, expected[0] - expected[1])
+
+    def test_repeated_blocks_line_up_with_their_own_copies(self):
+        # Every line occurs once per copy, so no line is unique to anchor on. difflib is run on
+        # each copy alone; over the concatenation it lines up the wrong copies too. Each edit
+        # changes one line, so edits/edits is the minimum.
+        rng = random.Random(3)
+        block = [f"    value_{k} = {k}" if k % 4 else "" for k in range(400)]
+        for copies, edits in ((3, 30), (10, 300)):
+            old = block * copies
+            new = list(old)
+            for i in rng.sample(range(len(new)), edits):
+                new[i] += "  # edited"
+            expected = [0, 0]
+            for start in range(0, len(old), len(block)):
+                counts = difflib_counts(old[start:start + len(block)], new[start:start + len(block)])
+                expected = [expected[0] + counts[0], expected[1] + counts[1]]
+            stats = diff_line_stats(old, new)
+            self.assertLessEqual(stats.deletions, expected[1])
+            self.assertEqual((stats.additions, stats.deletions), (edits, edits))
+
+    def test_region_of_only_common_lines_falls_back_to_difflib(self):
+        old = ["", "}"] * 100
+        new = old[:50] + ["x"] + old[50:]
+        stats = diff_line_stats(old, new)
+        self.assertEqual((stats.additions, stats.deletions), (1, 0))
+        self.assertEqual(apply_spans(old, new, stats.spans), new)
+
+    def test_large_region_of_common_lines_is_split_in_linear_time(self):
+        # Four distinct lines, so every line is far too common to anchor on and the region is
+        # too large for difflib. Changes that keep the line count are still counted exactly.
+        old = ["    pass", "", "}", "    return x"] * 5000
+        new = ["changed" if i % 50 == 0 else line for i, line in enumerate(old)]
+        started = time.perf_counter()
+        for max_hunks in (None, 5):
+            stats = diff_line_stats(old, new, max_hunks=max_hunks)
+            self.assertEqual((stats.additions, stats.deletions), (400, 400))
+            self.assertEqual(apply_spans(old, new, stats.spans), new)
+        self.assertEqual(len(stats.spans), 5)
+        self.assertLess(time.perf_counter() - started, 2.0)
+
+    def test_hunk_cap_bounds_the_work(self):
+        old = [f"line {i}" for i in range(2000)]
+        new = [line + "!" if i % 10 == 0 else line for i, line in enumerate(old)]
+        full = diff_line_stats(old, new)
+        self.assertEqual((full.additions, full.deletions, len(full.spans)), (200, 200, 200))
+        capped = diff_line_stats(old, new, max_hunks=5)
+        self.assertTrue(capped.truncated)
+        self.assertEqual(len(capped.spans), 5)
+        self.assertEqual(apply_spans(old, new, capped.spans), new)
+
+if __name__ == '__main__':
+    unittest.main()
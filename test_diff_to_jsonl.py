@@ -0,0 +1,70 @@
+import os
+import json
+import tempfile
+import unittest
+import subprocess
+from unittest import mock
+
+from diff_to_jsonl import batch_output, find_instances, main
+
+def git(cwd, *args):
+    subprocess.run(['git', '-c', 'user.name=t', '-c', 'user.email=t@t', *args], cwd=cwd, check=True, capture_output=True)
+
+class TestDiffToJsonlBatch(unittest.TestCase):
+
+    def make_instances(self, root, names, broken=()):
+        for name in names:
+            path = os.path.join(root, name)
+            os.mkdir(path)
+            if name in broken:
+                continue    # not a git repository
+            with open(os.path.join(path, "f.txt"), 'w') as f:
+                f.write("old\n")
+            git(path, 'init', '-q')
+            git(path, 'add', '.')
+            git(path, 'commit', '-q', '-m', 'init')
+            with open(os.path.join(path, "f.txt"), 'w') as f:
+                f.write(f"new {name}\n")
+
+    def read_ids(self, output):
+        with open(output) as f:
+            return [json.loads(line)["instance_id"] for line in f]
+
+    def test_batch_appends_in_order_and_reports_failures(self):
+        with tempfile.TemporaryDirectory() as root:
+            self.make_instances(root, ["b", "a", "c"], broken=["c"])
+            output = os.path.join(root, "preds.jsonl")
+            with open(output, 'w') as f:
+                f.write('{"instance_id": "earlier"}\n')
+
+            failures = batch_output(find_instances(root), output, "m", workers=2, append=True)
+
+            self.assertEqual([instance_id for instance_id, _ in failures], ["c"])
+            with open(output) as f:
+                records = [json.loads(line) for line in f]
+            self.assertEqual([r["instance_id"] for r in records], ["earlier", "a", "b"])
+            self.assertIn("+new a", records[1]["model_patch"])
+            self.assertEqual(records[2]["model_name_or_path"], "m")
+
+    def test_output_is_replaced_unless_appending_and_appends_skip_recorded_instances(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = os.path.join(tmp, "instances")
+            os.mkdir(root)
+            self.make_instances(root, ["a", "b"])
+            output = os.path.join(tmp, "preds.jsonl")
+            with open(output, 'w') as f:
+                f.write('{"instance_id": "earlier"}\n')
+
+            def run(*args):
+                with mock.patch("sys.argv", ["diff_to_jsonl.py", "--root", root, "--output", output, "--workers", "2", *args]), \
+                        mock.patch("builtins.print"):
+                    main()
+
+            run()
+            self.assertEqual(self.read_ids(output), ["a", "b"])
+            self.make_instances(root, ["c"])
+            run("--append")
+            self.assertEqual(self.read_ids(output), ["a", "b", "c"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import json
+import unittest
+import urllib.error
+import urllib.request
+
+import openai_standin
+
+class TestOpenAIStandin(unittest.TestCase):
+
+    def start(self, **config):
+        server, base_url = openai_standin.start_in_thread(openai_standin.StandinConfig(ttft=0, token_rate=0, seed=1, **config))
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, base_url
+
+    def post(self, base_url, body):
+        request = urllib.request.Request(base_url + "/chat/completions", data=json.dumps(body).encode('utf-8'),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.read().decode('utf-8')
+
+    def test_completion_echoes_prediction_or_code(self):
+        server, base_url = self.start()
+        body = {"model": "m", "messages": [{"role": "user", "content": "merge <code>x = 1\n</code> please"}]}
+        result = json.loads(self.post(base_url, body))
+        self.assertEqual(result["choices"][0]["message"]["content"], "x = 1\n")
+        self.assertEqual(result["usage"]["completion_tokens"], 4)
+        result = json.loads(self.post(base_url, dict(body, prediction={"type": "content", "content": "a b"})))
+        self.assertEqual(result["choices"][0]["message"]["content"], "a b")
+        self.assertEqual(result["usage"]["completion_tokens_details"]["accepted_prediction_tokens"], 2)
+        self.assertEqual(server.stats.snapshot()["completion_tokens"], 6)
+
+    def test_stream_sends_deltas_usage_and_done(self):
+        _, base_url = self.start()
+        raw = self.post(base_url, {"messages": [{"role": "user", "content": "one two three"}], "stream": True,
+                                   "stream_options": {"include_usage": True}})
+        events = [line[len("data: "):] for line in raw.split("\n\n") if line]
+        self.assertEqual(events[-1], "[DONE]")
+        chunks = [json.loads(event) for event in events[:-1]]
+        text = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks if c["choices"])
+        self.assertEqual(text, "one two three")
+        self.assertEqual(chunks[-1]["usage"]["completion_tokens"], 3)
+
+    def test_injected_rate_limits(self):
+        server, base_url = self.start(rate_limit_rate=1.0, retry_after=7)
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            self.post(base_url, {"messages": [{"role": "user", "content": "hi"}]})
+        self.assertEqual(raised.exception.code, 429)
+        self.assertEqual(raised.exception.headers["Retry-After"], "7")
+        self.assertEqual(server.stats.snapshot()["rate_limited"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,322 @@
+import os
+import sys
+import json
+import asyncio
+import types
+import tempfile
+import unittest
+import contextlib
+import io
+from unittest import mock
+
+# update_code.py imports the OpenAI client at module level; the functions tested here never call it.
+if "openai" not in sys.modules:
+    try:
+        import openai  # noqa: F401
+    except ImportError:
+        sys.modules["openai"] = types.SimpleNamespace(OpenAI=None, AsyncOpenAI=None)
+
+from update_code import (
+    CHANGE_SIZE_BUCKETS,
+    FILE_SIZE_BUCKETS,
+    StreamStats,
+    StreamingWriter,
+    append_metrics,
+    bucket,
+    find_region,
+    local_merge,
+    metrics_record,
+    parse_args,
+    read_manifest,
+    region_tail,
+    split_region,
+    summarize_metrics,
+    try_local_merge,
+    update_file_async,
+    update_file_content,
+)
+import update_code
+
+MARKER = "# ... existing code ..."
+
+CODE = "def a():\n    x = 1\n    return None\n\ndef b():\n    y = 2\n    return y\n"
+
+class TestLocalMerge(unittest.TestCase):
+
+    def test_inserts_lines_between_anchors(self):
+        snippet = f"{MARKER}\ndef b():\n    y = 2\n    z = y + 1\n    return y\n"
+        self.assertEqual(local_merge(CODE, snippet), CODE.replace("y = 2\n", "y = 2\n    z = y + 1\n"))
+        code = "def b():\n    y = 2\n\n    return y\n"
+        snippet = f"{MARKER}\ndef b():\n    y = 2\n    z = y + 1\n    return y\n"
+        self.assertEqual(local_merge(code, snippet), code.replace("y = 2\n", "y = 2\n    z = y + 1\n"))
+
+    def test_replaced_missing_or_reordered_lines_are_left_to_the_model(self):
+        # Replacing y = 2 and inserting before it look the same; so does a line after the last anchor.
+        self.assertIsNone(local_merge(CODE, f"{MARKER}\ndef b():\n    y = 3\n    return y\n{MARKER}"))
+        self.assertIsNone(local_merge(CODE, f"{MARKER}\ndef b():\n    y = 3\n{MARKER}"))
+        self.assertIsNone(local_merge(CODE, f"{MARKER}\ndef b():\n    return y\n{MARKER}"))
+        code = "def b():\n    y = 2\n    z = 3\n    return y\n"
+        self.assertIsNone(local_merge(code, f"{MARKER}\ndef b():\n    z = 3\n    y = 2\n    return y\n"))
+
+    def test_try_local_merge_reports_why_the_model_is_needed(self):
+        self.assertEqual(try_local_merge("b.py", CODE, "def c():\n    pass\n"), (None, "no markers, skipped"))
+        self.assertEqual(try_local_merge("b.py", CODE, f"{MARKER}\ndef b():\n    y = 3\n"), (None, "ambiguous"))
+        snippet = f"{MARKER}\ndef b():\n    y = 2\n    z = (\n    return y\n"
+        self.assertEqual(try_local_merge("b.py", CODE, snippet), (None, "failed validation"))
+        self.assertIsNotNone(try_local_merge("b.txt", CODE, snippet)[0])
+
+    def test_appended_section_must_not_redefine_a_name(self):
+        self.assertIsNone(local_merge(CODE, f"{MARKER}\ndef b(z=1):\n    return z\n"))
+
+    def test_new_definition_after_final_marker_is_appended(self):
+        snippet = f"{MARKER}\n\ndef c():\n    return None\n"
+        self.assertEqual(local_merge(CODE, snippet), CODE + "\ndef c():\n    return None\n")
+
+    def test_head_must_be_the_first_line_of_the_section(self):
+        # "return None" also closes a(); anchoring on it would put def c() inside a().
+        self.assertIsNone(local_merge(CODE, f"{MARKER}\ndef c():\n    return None\n{MARKER}\ndef b():\n    y = 2\n"))
+        self.assertEqual(local_merge(CODE, f"{MARKER}\ndef c():\n    return None"), CODE + "def c():\n    return None\n")
+        self.assertIsNone(local_merge(CODE, f"{MARKER}\n    x = 0\n    return None\n{MARKER}"))
+
+    def test_ambiguous_head_is_left_to_the_model(self):
+        code = "def a():\n    return y\n\ndef b():\n    return y\n"
+        self.assertIsNone(local_merge(code, f"{MARKER}\n    return y\n    # done\n{MARKER}"))
+
+    def test_snippet_without_markers_is_left_to_the_model(self):
+        self.assertIsNone(local_merge(CODE, "def c():\n    return None\n"))
+        self.assertIsNone(local_merge(CODE, "def b():\n    y = 3\n    return y\n"))
+
+class FakeClient:
+    """Answers every merge request with a fixed completion and records the requests."""
+
+    def __init__(self, content):
+        self.requests = []
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+        self.content = content
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=self.content))],
+                                     usage=None)
+
+class TestUpdateFileContent(unittest.TestCase):
+
+    LOAD = "def load(path):\n    timeout = 10\n    return open(path, timeout)\n"
+
+    def update(self, snippet, merged):
+        with tempfile.TemporaryDirectory() as tmp:
+            target = os.path.join(tmp, "load.py")
+            with open(target, 'w') as f:
+                f.write(self.LOAD)
+            client = FakeClient(merged)
+            args = types.SimpleNamespace(gpt4o=False, no_local=False, whole_file=True, stream=False, metrics=None)
+            out = io.StringIO()
+            with mock.patch.object(update_code, "OpenAI", lambda: client), \
+                    mock.patch.object(update_code, "get_update_snippet", lambda: snippet), \
+                    contextlib.redirect_stdout(out):
+                update_file_content(target, model_args=args)
+            self.output = out.getvalue()
+            with open(target) as f:
+                return client, f.read()
+
+    def test_changed_line_after_the_head_asks_the_model(self):
+        merged = self.LOAD.replace("10", "30")
+        client, content = self.update(f"{MARKER}\ndef load(path):\n    timeout = 30\n    {MARKER}\n", merged)
+        self.assertEqual(len(client.requests), 1)
+        self.assertEqual(content, merged)
+        self.assertIn("Local merge: ambiguous\n", self.output)
+
+    def test_changed_signature_asks_the_model(self):
+        merged = self.LOAD.replace("(path)", '(path, encoding="utf-8")')
+        client, content = self.update(f'{MARKER}\ndef load(path, encoding="utf-8"):\n    ...\n', merged)
+        self.assertEqual(len(client.requests), 1)
+        self.assertEqual(content, merged)
+
+CLASSES = (
+    "import os\n\n"
+    "class A:\n    def __init__(self):\n        self.a = 1\n\n"
+    "class B:\n    def __init__(self):\n        self.b = 2\n\n    def run(self):\n        return self.b\n\n"
+    + "".join(f"def helper_{i}(value):\n    return value + {i}\n\n" for i in range(10))
+)
+
+class TestFindRegion(unittest.TestCase):
+
+    def test_definition_names_select_their_top_level_span(self):
+        start, end, method = find_region(CLASSES, "    def run(self):\n        return self.b * 2\n")
+        self.assertEqual(method, "ast")
+        self.assertEqual(CLASSES.splitlines()[start + 3], "class B:")
+        self.assertEqual(end, 15)
+        self.assertEqual(find_region(CLASSES, "def helper_4(value):\n    return value - 4\n")[2], "ast")
+
+    def test_name_defined_in_two_classes_is_not_resolved_by_ast(self):
+        # Both classes define __init__; the unique line self.b = 2 places the edit in B instead.
+        start, end, method = find_region(CLASSES, "    def __init__(self):\n        self.b = 3\n        self.b = 2\n")
+        self.assertEqual(method, "anchor")
+        self.assertEqual((start, end), (5, 12))
+        self.assertIsNone(find_region(CLASSES, "    def __init__(self):\n        pass\n"))
+
+    def test_new_definition_or_unparsable_code_is_not_resolved_by_ast(self):
+        self.assertIsNone(find_region(CLASSES, "def brand_new():\n    pass\n"))
+        self.assertIsNone(find_region("def f(:\n", "def f():\n    pass\n"))
+
+    def test_code_outside_the_named_definitions_needs_the_whole_file(self):
+        self.assertIsNone(find_region(CLASSES, "import json\n\ndef helper_4(value):\n    return json.dumps(value)\n"))
+        self.assertIsNone(find_region(CLASSES, "LIMIT = 3\n\ndef helper_4(value):\n    return min(value, LIMIT)\n"))
+        snippet = "@staticmethod\ndef helper_4(\n    value,\n):\n    # clamp\n    return value - 4\n"
+        self.assertEqual(find_region(CLASSES, snippet)[2], "ast")
+
+    def test_region_covering_most_of_the_file_is_dropped(self):
+        code = "def a():\n    return 1\n\ndef b():\n    return 2\n"
+        self.assertIsNone(find_region(code, "def a():\n    return 3\n"))
+
+class TestSplitRegion(unittest.TestCase):
+
+    def test_split_and_rejoin(self):
+        code = "one\ntwo\nthree\nfour\n"
+        self.assertEqual(split_region(code, (1, 3, "ast")), ("one\n", "two\nthree\n", "four\n"))
+        self.assertEqual(split_region(code, (0, 4, "anchor")), ("", code, ""))
+
+    def test_region_tail_restores_a_dropped_newline(self):
+        self.assertEqual(region_tail("two\nthree\n", "TWO\nthree"), "\n")
+        self.assertEqual(region_tail("two\nthree\n", "TWO\nthree\n"), "")
+        self.assertEqual(region_tail("last line", "LAST LINE"), "")
+
+class TestStreaming(unittest.TestCase):
+
+    def test_stream_stats_summary(self):
+        stats = StreamStats()
+        self.assertEqual(stats.summary(), {"ttft": None, "itl_p50": None, "itl_p90": None, "itl_p99": None})
+        stats.start = 10.0
+        stats.arrivals = [10.5, 10.6, 10.8, 11.1, 11.5]
+        summary = stats.summary()
+        self.assertAlmostEqual(summary["ttft"], 0.5)
+        self.assertAlmostEqual(summary["itl_p50"], 0.3)
+        self.assertAlmostEqual(summary["itl_p99"], 0.4)
+
+    def test_writer_replaces_target_only_when_complete(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            target = os.path.join(tmp, "a.py")
+            with open(target, 'w') as f:
+                f.write("old\n")
+            writer = StreamingWriter(target)
+            writer.write("new")
+            writer.discard()
+            writer = StreamingWriter(target)
+            with open(target) as f:
+                self.assertEqual(f.read(), "old\n")
+            writer.write("new\n")
+            writer.replace()
+            with open(target) as f:
+                self.assertEqual(f.read(), "new\n")
+            self.assertEqual(os.listdir(tmp), ["a.py"])
+
+class FakeAsyncClient:
+    """Answers every merge request with the predicted code after applying `edit` to it."""
+
+    def __init__(self, edit):
+        self.requests = []
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+        self.edit = edit
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        content = self.edit(kwargs["prediction"]["content"])
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))],
+                                     usage=None)
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def path(self, name, content=None):
+        path = os.path.join(self.tmp.name, name)
+        if content is not None:
+            with open(path, 'w') as f:
+                f.write(content)
+        return path
+
+    def test_read_manifest(self):
+        manifest = self.path("m.jsonl", json.dumps({"file": "a.py", "snippet": "x"}) + "\n\n"
+                             + json.dumps({"file": "b.py", "snippet": "y"}) + "\n")
+        self.assertEqual(read_manifest(manifest), [("a.py", "x"), ("b.py", "y")])
+        bad = self.path("bad.jsonl", json.dumps({"file": "a.py"}) + "\n")
+        with self.assertRaisesRegex(ValueError, "bad.jsonl:1"):
+            read_manifest(bad)
+
+    def update(self, client, file_path, snippet, **kwargs):
+        return asyncio.run(update_file_async(client, asyncio.Semaphore(1), "m", file_path, snippet, **kwargs))
+
+    def test_local_merge_needs_no_request(self):
+        target = self.path("a.py", CODE)
+        result = self.update(None, target, f"{MARKER}\ndef b():\n    y = 2\n    z = y + 1\n    return y\n")
+        self.assertEqual((result["status"], result["mode"], result["additions"]), ("success", "local", 1))
+        with open(target) as f:
+            self.assertEqual(f.read(), CODE.replace("y = 2\n", "y = 2\n    z = y + 1\n"))
+
+    def test_region_is_sent_and_spliced_back(self):
+        target = self.path("classes.py", CLASSES)
+        client = FakeAsyncClient(lambda code: code.replace("return self.b", "return self.b * 2"))
+        result = self.update(client, target, "    def run(self):\n        return self.b * 2\n", local=False)
+        self.assertEqual((result["status"], result["mode"]), ("success", "region (ast)"))
+        self.assertNotIn("helper_9", client.requests[0]["prediction"]["content"])
+        with open(target) as f:
+            self.assertEqual(f.read(), CLASSES.replace("return self.b", "return self.b * 2"))
+        self.assertEqual(self.update(client, self.path("missing.py"), "x")["status"], "error")
+
+    def test_anchor_region_that_does_not_parse_falls_back_to_the_whole_file(self):
+        target = self.path("classes.py", CLASSES)
+        fixed = CLASSES.replace("self.b = 2", "self.b = 3")
+        client = FakeAsyncClient(lambda code: fixed if code == CLASSES else code.replace("self.b = 2", "self.b = (3"))
+        result = self.update(client, target, "    def __init__(self):\n        self.b = 3\n        self.b = 2\n", local=False)
+        self.assertEqual((result["status"], result["mode"], len(client.requests)), ("success", "whole file", 2))
+        with open(target) as f:
+            self.assertEqual(f.read(), fixed)
+        self.assertEqual(result["local"], "disabled by --no-local")
+
+class TestMetrics(unittest.TestCase):
+
+    def test_metrics_are_opt_in(self):
+        with mock.patch.object(update_code, "DEFAULT_METRICS_PATH", None):
+            with mock.patch.object(sys, "argv", ["update_code.py", "a.py"]):
+                self.assertIsNone(parse_args().metrics)
+            with mock.patch.object(sys, "argv", ["update_code.py", "a.py", "--metrics", "m.jsonl"]):
+                self.assertEqual(parse_args().metrics, "m.jsonl")
+            with mock.patch.object(sys, "argv", ["update_code.py", "--summary"]), \
+                    contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+                parse_args()
+
+    def test_bucket_bounds_are_exclusive(self):
+        self.assertEqual([bucket(n, FILE_SIZE_BUCKETS) for n in (0, 4095, 4096, 65536)],
+                         ["<4KB", "<4KB", "4-16KB", ">=64KB"])
+        self.assertEqual([bucket(n, CHANGE_SIZE_BUCKETS) for n in (5, 6, 100, 101)],
+                         ["0-5 lines", "6-20 lines", "21-100 lines", ">100 lines"])
+
+    def test_summary_groups_runs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "metrics.jsonl")
+            append_metrics(path, metrics_record("a.py", "whole file", "m1", 100, 2, 1, 1.0,
+                                                accepted_prediction_tokens=30, rejected_prediction_tokens=10))
+            append_metrics(path, metrics_record("b.py", "region (ast)", "m1", 5000, 50, 0, 3.0,
+                                                accepted_prediction_tokens=10, rejected_prediction_tokens=0))
+            append_metrics(path, metrics_record("c.py", "local", "m1", 100, 1, 1, 0.0))
+            with open(path, 'a') as f:
+                f.write('{"torn": ')
+            append_metrics("", metrics_record("d.py", "local", "m1", 1, 1, 1, 0.0))
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                summarize_metrics(path)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("3 run(s) in "))
+        # label -> [runs, p50 s, mean s, accepted, rejected, accept %]
+        rows = {line[:22].strip(): line[22:].split() for line in lines[1:] if line.strip()}
+        self.assertEqual(rows["m1"], ["2", "3.00", "2.00", "40", "10", "80.0"])
+        self.assertEqual(rows["m1 (local)"], ["1", "0.00", "0.00", "0", "0", "-"])
+        self.assertEqual(rows["<4KB"], ["2", "1.00", "0.50", "30", "10", "75.0"])
+        self.assertEqual(rows["4-16KB"], ["1", "3.00", "3.00", "10", "0", "100.0"])
+        self.assertEqual(rows["21-100 lines"][0], "1")
+        self.assertEqual(rows["0-5 lines"][0], "2")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,29 @@
 import argparse
+import ast
+import asyncio
+import json
+import os
+import re
+import shutil
+import tempfile
 import time
-import difflib
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from diff_stats import diff_stats
+
+# Lines of unchanged code sent on each side of a region, so the model sees where it sits.
+REGION_CONTEXT_LINES = 3
+# Above this fraction of the file, a region saves too little to be worth the splice.
+MAX_REGION_FRACTION = 0.8
+MIN_ANCHOR_LENGTH = 8
+DEFAULT_CONCURRENCY = 4
+# Metrics are only recorded when a path is given, here or with --metrics.
+DEFAULT_METRICS_PATH = os.environ.get("UPDATE_CODE_METRICS") or None
+# Upper bounds (exclusive) of the --summary buckets; the last bucket is open-ended.
+FILE_SIZE_BUCKETS = [(4 * 1024, "<4KB"), (16 * 1024, "4-16KB"), (64 * 1024, "16-64KB"), (None, ">=64KB")]
+CHANGE_SIZE_BUCKETS = [(6, "0-5 lines"), (21, "6-20 lines"), (101, "21-100 lines"), (None, ">100 lines")]
+DEFINITION_RE = re.compile(r"^\s*(?:async\s+def|def|class)\s+(\w+)", re.MULTILINE)
+# A comment line starting with "...", as in "# ... existing code ..."
+EXISTING_CODE_RE = re.compile(r"^\s*(?:#|//|/\*|<!--|--)\s*\.\.\.")
 
 SYSTEM_PROMPT = """You are an coding assistant that helps merge code updates, ensuring every modification is fully integrated."""
 
@@ -20,12 +42,39 @@ Provide the complete updated code without any wrapping tags."""
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Update code file using OpenAI API')
-    parser.add_argument('file_path', help='Path to the file to be updated')
+    parser.add_argument('file_path', nargs='?', help='Path to the file to be updated')
     parser.add_argument('--debug', action='store_true', help='Enable debug output')
     group = parser.add_mutually_exclusive_group()
     group.add_argument('--gpt4o', action='store_true', help='Use GPT-4o model')
     group.add_argument('--mini', action='store_true', default=True, help='Use GPT-4o-mini model (default)')
-    return parser.parse_args()
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream the completion into a temporary file that replaces the target when done, '
+                             'and report time-to-first-token and inter-token latency')
+    parser.add_argument('--no-local', action='store_true',
+                        help='Always ask the model instead of first trying a local anchor-based merge')
+    parser.add_argument('--whole-file', action='store_true',
+                        help='Always send the whole file instead of only the regions the snippet touches')
+    parser.add_argument('--batch', metavar='MANIFEST',
+                        help='Update every {"file", "snippet"} record of a JSONL manifest concurrently')
+    parser.add_argument('--metrics', default=DEFAULT_METRICS_PATH, metavar='PATH',
+                        help='Append each run\'s latency and prediction token counts to this JSONL file. '
+                             'Off unless this or $UPDATE_CODE_METRICS is set; "" disables it for one run')
+    parser.add_argument('--summary', action='store_true',
+                        help='Summarize the metrics file by model, file size and change size, then exit')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, metavar='N',
+                        help=f'Requests in flight at once in --batch mode (default: {DEFAULT_CONCURRENCY})')
+    args = parser.parse_args()
+    if args.batch:
+        if args.file_path or args.stream or args.summary:
+            parser.error('--batch reads files and snippets from the manifest and cannot be combined '
+                         'with a file path or --stream')
+        if args.concurrency < 1:
+            parser.error('--concurrency must be at least 1')
+    elif not args.file_path and not args.summary:
+        parser.error('a file path, --batch or --summary is required')
+    if args.summary and not args.metrics:
+        parser.error('--summary reads the metrics file; pass --metrics PATH or set $UPDATE_CODE_METRICS')
+    return args
 
 def get_update_snippet():
     print("Paste in the update snippet, then type Ctrl + D:")
@@ -40,14 +89,394 @@ def get_update_snippet():
         return "\n".join(lines)
 
 def count_line_changes(old_content, new_content):
-    old_lines = old_content.splitlines()
-    new_lines = new_content.splitlines()
-    
-    diff = list(difflib.unified_diff(old_lines, new_lines, n=0))
-    additions = sum(1 for line in diff if line.startswith('+') and not line.startswith('+++'))
-    deletions = sum(1 for line in diff if line.startswith('-') and not line.startswith('---'))
-    
-    return additions, deletions
+    stats = diff_stats(old_content, new_content)
+    return stats.additions, stats.deletions
+
+def definition_spans(tree):
+    """Returns {name: (first line, last line)} for every top-level def/class, 0-based and inclusive.
+    Methods map to the span of their top-level class. Names defined under more than one top-level
+    node (say __init__ of two classes) are left out: the snippet alone cannot say which it edits."""
+    spans, ambiguous = {}, set()
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list]) - 1
+        span = (start, node.end_lineno - 1)
+        for child in ast.walk(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                if spans.setdefault(child.name, span) != span:
+                    ambiguous.add(child.name)
+    for name in ambiguous:
+        del spans[name]
+    return spans
+
+def ast_region(code, update_snippet):
+    """Line span of the top-level definitions the snippet names, or None if any name is unknown."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    names = DEFINITION_RE.findall(update_snippet)
+    if not names:
+        return None
+    spans = definition_spans(tree)
+    if any(name not in spans for name in names):
+        return None  # a new definition: where it goes is a whole-file decision
+    return min(spans[name][0] for name in names), max(spans[name][1] for name in names)
+
+def has_code_outside_definitions(update_snippet):
+    """
+    True when the snippet has lines at its outermost indentation that are not part of a
+    def/class (say a new import or constant next to an edited function). A region around the
+    definitions would leave those lines nowhere to go.
+    """
+    lines = [line for line in update_snippet.splitlines() if line.strip()]
+    if not lines:
+        return False
+    indent = min(len(line) - len(line.lstrip()) for line in lines)
+    for line in lines:
+        if len(line) - len(line.lstrip()) != indent:
+            continue
+        stripped = line.strip()
+        if DEFINITION_RE.match(line) or EXISTING_CODE_RE.match(line) or stripped.startswith(("@", "#", ")", "]", "}")):
+            continue
+        return True
+    return False
+
+def anchor_region(code_lines, update_snippet):
+    """Line span covered by snippet lines that occur exactly once in the code, or None."""
+    positions = {}
+    for i, line in enumerate(code_lines):
+        positions.setdefault(line.strip(), []).append(i)
+    anchors = [
+        positions[line.strip()][0] for line in update_snippet.splitlines()
+        if len(line.strip()) >= MIN_ANCHOR_LENGTH and len(positions.get(line.strip(), ())) == 1
+    ]
+    if not anchors:
+        return None
+    return min(anchors), max(anchors)
+
+def find_region(code, update_snippet):
+    """
+    Returns (start, end, method) for the lines of code the snippet touches, widened by
+    REGION_CONTEXT_LINES (end exclusive), or None when the whole file should be merged,
+    including when the snippet adds code outside the definitions it names.
+    """
+    if DEFINITION_RE.search(update_snippet) and has_code_outside_definitions(update_snippet):
+        return None
+    code_lines = code.splitlines(keepends=True)
+    method = "ast"
+    span = ast_region(code, update_snippet)
+    if span is None:
+        method = "anchor"
+        span = anchor_region(code_lines, update_snippet)
+    if span is None:
+        return None
+    start = max(0, span[0] - REGION_CONTEXT_LINES)
+    end = min(len(code_lines), span[1] + 1 + REGION_CONTEXT_LINES)
+    if end - start > MAX_REGION_FRACTION * len(code_lines):
+        return None
+    return start, end, method
+
+def split_snippet(update_snippet):
+    """
+    Splits a snippet at its "... existing code ..." marker lines. Returns (sections, markers):
+    the runs of lines between markers, and whether a marker precedes each section.
+    """
+    sections, markers = [], []
+    current, after_marker = [], False
+    for line in update_snippet.splitlines():
+        if EXISTING_CODE_RE.match(line):
+            if current:
+                sections.append(current)
+                markers.append(after_marker)
+            current, after_marker = [], True
+        else:
+            current.append(line)
+    if any(line.strip() for line in current):
+        sections.append(current)
+        markers.append(after_marker)
+    return sections, markers
+
+def trim_blank_lines(lines, leading=True):
+    start, end = 0, len(lines)
+    while leading and start < end and not lines[start].strip():
+        start += 1
+    while end > start and not lines[end - 1].strip():
+        end -= 1
+    return lines[start:end]
+
+def find_anchor(section_lines, original_keys, start, stop, candidates):
+    """
+    Returns (section index, original index) for the first section line in `candidates` order
+    that occurs exactly once in original_keys[start:stop], (None, None) if none occurs, or
+    raises ValueError if the first line that occurs is ambiguous.
+    """
+    for i in candidates:
+        key = section_lines[i].strip()
+        if not key:
+            continue
+        hits = [j for j in range(start, stop) if original_keys[j] == key]
+        if len(hits) == 1:
+            return i, hits[0]
+        if hits:
+            raise ValueError(f"ambiguous anchor {key!r}")
+    return None, None
+
+def interleave(span, span_keys, section):
+    """
+    Merges a section into the original lines between its anchors when those lines appear in
+    it in order, so every other section line is an insertion. Blank original lines the section
+    leaves out are kept. Returns the merged lines, or None when a non-blank original line is
+    missing or out of order: the section then replaces or moves code, which is the model's call.
+    """
+    merged, k = [], 0
+    for line in section:
+        # Blank lines the snippet did not repeat are skipped over, and kept.
+        m = k
+        while line.strip() and m < len(span) and not span_keys[m]:
+            m += 1
+        if m < len(span) and line.strip() == span_keys[m]:
+            merged.extend(span[k:m + 1])
+            k = m + 1
+        else:
+            merged.append(line)
+    if any(span_keys[k:]):
+        return None
+    return merged + span[k:]
+
+def local_merge(code, update_snippet):
+    """
+    Merges a snippet without the model. Each section between "... existing code ..." markers
+    must start and end with lines found exactly once in the file, and keep every original line
+    between them in order; its other lines are inserted where they stand. A section that starts
+    with a new line is only accepted last, after a marker, and is appended to the file unless
+    it redefines a name the file already defines. Returns the new content, or None for a
+    snippet without markers or a section that cannot be merged that way.
+    """
+    if not any(EXISTING_CODE_RE.match(line) for line in update_snippet.splitlines()):
+        return None  # without markers the snippet may be a whole file or a fragment; the model decides
+    raw_sections, markers = split_snippet(update_snippet)
+    sections = [trim_blank_lines(section) for section in raw_sections]
+    if not sections:
+        return None
+    original = code.splitlines()
+    keys = [line.strip() for line in original]
+    try:
+        # Heads are found in order, each after the previous one. Anchoring a later line of the
+        # section would put the lines before it in the middle of whatever code precedes that line.
+        heads, cursor = [], 0
+        for section in sections:
+            head, position = find_anchor(section, keys, cursor, len(keys), [0])
+            heads.append((head, position))
+            if position is not None:
+                cursor = position + 1
+        out, cursor = [], 0
+        for n, (section, (head, position)) in enumerate(zip(sections, heads)):
+            if position is None:
+                # Only a new top-level section after a final marker has an obvious place: the end of the file.
+                if n != len(sections) - 1 or not markers[n] or section[0][:1].isspace():
+                    return None
+                # A changed signature does not anchor; appending it would define the name twice.
+                if set(DEFINITION_RE.findall("\n".join(section))) & set(DEFINITION_RE.findall(code)):
+                    return None
+                out.extend(original[cursor:])
+                out.extend(trim_blank_lines(raw_sections[n], leading=False))
+                cursor = len(original)
+                continue
+            next_head = next((p for _, p in heads[n + 1:] if p is not None), len(original))
+            tail, tail_position = find_anchor(section, keys, position, next_head, range(len(section) - 1, head - 1, -1))
+            # New lines after the last anchor may modify the lines that follow it or be inserted
+            # before them; the snippet cannot say which.
+            if tail != len(section) - 1:
+                return None
+            merged = interleave(original[position:tail_position + 1], keys[position:tail_position + 1], section)
+            if merged is None:
+                return None
+            out.extend(original[cursor:position])
+            out.extend(merged)
+            cursor = tail_position + 1
+        out.extend(original[cursor:])
+    except ValueError:
+        return None
+    new_content = "\n".join(out)
+    if code.endswith("\n"):
+        new_content += "\n"
+    return new_content
+
+def try_local_merge(file_path, code, update_snippet):
+    """
+    Returns (new content, None) for a local merge that validates, or (None, reason) saying why
+    the model is needed: the snippet has no markers, is ambiguous, or fails validate_merge.
+    """
+    if not any(EXISTING_CODE_RE.match(line) for line in update_snippet.splitlines()):
+        return None, "no markers, skipped"
+    new_content = local_merge(code, update_snippet)
+    if new_content is None:
+        return None, "ambiguous"
+    if not validate_merge(file_path, new_content):
+        return None, "failed validation"
+    return new_content, None
+
+def validate_merge(file_path, new_content):
+    """Returns False when a merged Python file no longer parses."""
+    if not file_path.endswith(".py"):
+        return True
+    try:
+        ast.parse(new_content)
+    except SyntaxError:
+        return False
+    return True
+
+class StreamStats:
+    """Arrival times of streamed deltas, for time-to-first-token and inter-token latency."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.arrivals = []
+
+    def record(self):
+        self.arrivals.append(time.perf_counter())
+
+    def summary(self):
+        gaps = sorted(b - a for a, b in zip(self.arrivals, self.arrivals[1:]))
+
+        def percentile(q):
+            return gaps[min(len(gaps) - 1, int(q * len(gaps)))] if gaps else None
+
+        return {
+            "ttft": self.arrivals[0] - self.start if self.arrivals else None,
+            "itl_p50": percentile(0.5),
+            "itl_p90": percentile(0.9),
+            "itl_p99": percentile(0.99),
+        }
+
+class StreamingWriter:
+    """
+    Writes merged output to a temporary file next to the target as it streams in;
+    replace() swaps it in atomically once the stream is complete.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        fd, self.tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(file_path)}.", suffix=".tmp",
+                                             dir=os.path.dirname(os.path.abspath(file_path)))
+        self.file = os.fdopen(fd, 'w')
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+        self.file.write(text)
+        self.file.flush()
+
+    def content(self):
+        return "".join(self.parts)
+
+    def replace(self):
+        self.file.close()
+        shutil.copymode(self.file_path, self.tmp_path)
+        os.replace(self.tmp_path, self.file_path)
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+def merge_request(model, code, update_snippet):
+    """Keyword arguments for a chat completion that merges the snippet into code."""
+    return dict(
+        model=model,
+        messages=[
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": USER_PROMPT.format(code, update_snippet)
+            }
+        ],
+        prediction={
+            "type": "content",
+            "content": code
+        }
+    )
+
+def request_merge(client, model, code, update_snippet, writer=None, stats=None):
+    """
+    Asks the model to merge the snippet into code. Returns (merged code, usage).
+    With a writer, the completion is streamed and each delta is written as it arrives.
+    """
+    request = merge_request(model, code, update_snippet)
+    if writer is None:
+        completion = client.chat.completions.create(**request)
+        return completion.choices[0].message.content, completion.usage
+
+    parts = []
+    usage = None
+    for chunk in client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **request):
+        if chunk.choices and chunk.choices[0].delta.content:
+            stats.record()
+            parts.append(chunk.choices[0].delta.content)
+            writer.write(chunk.choices[0].delta.content)
+        if chunk.usage:
+            usage = chunk.usage  # sent in a final chunk without choices
+    return "".join(parts), usage
+
+def split_region(code, region):
+    """Returns (prefix, region code, suffix) of code for a region from find_region."""
+    start, end, _ = region
+    code_lines = code.splitlines(keepends=True)
+    return "".join(code_lines[:start]), "".join(code_lines[start:end]), "".join(code_lines[end:])
+
+def region_tail(region_code, merged):
+    """The newline to put back when the model dropped the one ending the region."""
+    return "\n" if region_code.endswith("\n") and not merged.endswith("\n") else ""
+
+def merge_region(client, model, code, update_snippet, region, file_path, writer=None, stats=None):
+    """
+    Merges the snippet into the region of code only and splices the result back.
+    Returns (new content, usage), or None if the spliced file fails validate_merge.
+    """
+    prefix, region_code, suffix = split_region(code, region)
+    if writer is not None:
+        writer.write(prefix)
+    merged, usage = request_merge(client, model, region_code, update_snippet, writer, stats)
+    tail = region_tail(region_code, merged)
+    if writer is not None:
+        writer.write(tail + suffix)
+    new_content = prefix + merged + tail + suffix
+    if not validate_merge(file_path, new_content):
+        return None
+    return new_content, usage
+
+def merge(client, model, code, update_snippet, region, file_path, stream=False, debug=False):
+    """
+    Merges the snippet into the code of file_path, region-scoped when a region is given,
+    falling back to the whole file. With stream, the completion is streamed into the file.
+    Returns (new content, usage, region actually used, StreamStats or None).
+    """
+    for attempt in ([region, None] if region else [None]):
+        writer = StreamingWriter(file_path) if stream else None
+        stats = StreamStats() if stream else None
+        try:
+            if attempt:
+                result = merge_region(client, model, code, update_snippet, attempt, file_path, writer, stats)
+            else:
+                result = request_merge(client, model, code, update_snippet, writer, stats)
+            if result is None:
+                if debug:
+                    print("Merged region does not parse, retrying with the whole file")
+                if writer is not None:
+                    writer.discard()
+                continue
+            if writer is not None:
+                writer.replace()
+            return result + (attempt, stats)
+        except BaseException:
+            if writer is not None:
+                writer.discard()
+            raise
 
 def update_file_content(file_path, debug=False, model_args=None):
     # Read the input file
@@ -78,52 +507,266 @@ def update_file_content(file_path, debug=False, model_args=None):
             print("Making API call to OpenAI...")
         
         start_time = time.time()
-        
-        completion = client.chat.completions.create(
-            model="gpt-4o" if args.gpt4o else "gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": SYSTEM_PROMPT
-                },
-                {
-                    "role": "user",
-                    "content": USER_PROMPT.format(code, update_snippet)
-                }
-            ],
-            prediction={
-                "type": "content",
-                "content": code
-            }
-        )
-
-        # Get the modified content
-        new_content = completion.choices[0].message.content
+        model = "gpt-4o" if model_args.gpt4o else "gpt-4o-mini"
 
-        # Write the modified content back to the file
+        # Most "... existing code ..." snippets can be merged by anchoring on unchanged lines
+        new_content, local_outcome = (None, "disabled by --no-local") if model_args.no_local else \
+            try_local_merge(file_path, code, update_snippet)
+        if new_content is not None:
+            with open(file_path, 'w') as file:
+                file.write(new_content)
+            additions, deletions = count_line_changes(code, new_content)
+            elapsed_time = time.time() - start_time
+            print(f"Successfully updated {file_path} locally (anchored on unchanged lines, no API call)")
+            print(f"Lines changed: +{additions} -{deletions}")
+            print(f"Time: {elapsed_time:.3f}s")
+            append_metrics(model_args.metrics, metrics_record(
+                file_path, "local", model, len(code.encode()), additions, deletions, elapsed_time))
+            return
         if debug:
-            print(f"Writing updated content ({len(new_content)} characters)")
-        with open(file_path, 'w') as file:
-            file.write(new_content)
+            print(f"Local merge: {local_outcome}, asking the model")
+
+        # Send only the definitions the snippet touches when they can be located
+        region = None if model_args.whole_file else find_region(code, update_snippet)
+        new_content, usage, region, stats = merge(client, model, code, update_snippet, region, file_path,
+                                                  model_args.stream, debug)
+
+        # Write the modified content back to the file (streaming already replaced it)
+        if stats is None:
+            if debug:
+                print(f"Writing updated content ({len(new_content)} characters)")
+            with open(file_path, 'w') as file:
+                file.write(new_content)
         
         end_time = time.time()
         elapsed_time = end_time - start_time
-        completion_tokens = completion.usage.completion_tokens
+        completion_tokens = usage.completion_tokens if usage else 0
         throughput = completion_tokens / elapsed_time
         
         # Count line changes
         additions, deletions = count_line_changes(code, new_content)
         
-        model_name = "GPT-4o" if args.gpt4o else "GPT-4o-mini"
+        model_name = "GPT-4o" if model_args.gpt4o else "GPT-4o-mini"
         print(f"Successfully updated {file_path} using {model_name}")
+        print(f"Local merge: {local_outcome}")
+        if region:
+            print(f"Merged lines {region[0] + 1}-{region[1]} of {len(code.splitlines())} (located by {region[2]})")
+        else:
+            print("Merged the whole file")
         print(f"Lines changed: +{additions} -{deletions}")
         print(f"Throughput: {throughput:.2f} tokens/second ({completion_tokens} tokens in {elapsed_time:.2f}s)")
+        if stats is not None:
+            latency = stats.summary()
+            if latency["ttft"] is not None:
+                print(f"Time to first token: {latency['ttft'] * 1000:.0f}ms")
+            if latency["itl_p50"] is not None:
+                print(f"Inter-token latency: p50 {latency['itl_p50'] * 1000:.1f}ms, "
+                      f"p90 {latency['itl_p90'] * 1000:.1f}ms, p99 {latency['itl_p99'] * 1000:.1f}ms")
+        tokens = usage_tokens(usage)
+        if tokens["accepted_prediction_tokens"] is not None:
+            print(f"Predicted output: {tokens['accepted_prediction_tokens']} accepted, "
+                  f"{tokens['rejected_prediction_tokens']} rejected tokens")
+        append_metrics(model_args.metrics, metrics_record(
+            file_path, f"region ({region[2]})" if region else "whole file", model, len(code.encode()),
+            additions, deletions, elapsed_time, ttft=stats.summary()["ttft"] if stats else None, **tokens))
 
     except Exception as e:
         print(f"Error during API call or file writing: {e}")
 
+def read_manifest(manifest_path):
+    """Returns the [(file, snippet)] pairs of a JSONL manifest, in order."""
+    pairs = []
+    with open(manifest_path, 'r') as file:
+        for line_no, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                pairs.append((record["file"], record["snippet"]))
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"{manifest_path}:{line_no}: expected a {{\"file\", \"snippet\"}} object ({e})")
+    return pairs
+
+async def update_file_async(client, semaphore, model, file_path, update_snippet, whole_file=False, local=True):
+    """
+    Merges one snippet into one file, region-scoped when possible, and writes the result.
+    Returns a stats dict for the file; failures are reported in it rather than raised.
+    """
+    result = {"file": file_path, "status": "error"}
+    try:
+        with open(file_path, 'r') as file:
+            code = file.read()
+        new_content, local_outcome = try_local_merge(file_path, code, update_snippet) if local else \
+            (None, "disabled by --no-local")
+        result["local"] = local_outcome
+        if new_content is not None:
+            with open(file_path, 'w') as file:
+                file.write(new_content)
+            additions, deletions = count_line_changes(code, new_content)
+            result.update({"status": "success", "mode": "local", "file_bytes": len(code.encode()),
+                           "additions": additions, "deletions": deletions, "seconds": 0.0, "throughput": 0.0})
+            result.update(usage_tokens(None), completion_tokens=0)
+            return result
+        region = None if whole_file else find_region(code, update_snippet)
+        async with semaphore:
+            start_time = time.perf_counter()
+            for attempt in ([region, None] if region else [None]):
+                if attempt:
+                    prefix, region_code, suffix = split_region(code, attempt)
+                else:
+                    prefix, region_code, suffix = "", code, ""
+                completion = await client.chat.completions.create(**merge_request(model, region_code, update_snippet))
+                merged = completion.choices[0].message.content
+                new_content = prefix + merged + (region_tail(region_code, merged) if attempt else "") + suffix
+                if not attempt or validate_merge(file_path, new_content):
+                    break
+            elapsed_time = time.perf_counter() - start_time
+        with open(file_path, 'w') as file:
+            file.write(new_content)
+        additions, deletions = count_line_changes(code, new_content)
+        tokens = usage_tokens(completion.usage)
+        completion_tokens = tokens["completion_tokens"] or 0
+        result.update(tokens)
+        result.update({
+            "status": "success", "mode": f"region ({attempt[2]})" if attempt else "whole file",
+            "file_bytes": len(code.encode()), "additions": additions, "deletions": deletions,
+            "completion_tokens": completion_tokens, "seconds": elapsed_time,
+            "throughput": completion_tokens / elapsed_time if elapsed_time else 0.0,
+        })
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+async def update_files_async(pairs, model, concurrency, whole_file=False, local=True):
+    """
+    Runs update_file_async for every (file, snippet) pair, at most `concurrency` at a time.
+    Snippets for the same file are merged one after another. Results are in manifest order.
+    """
+    client = AsyncOpenAI()
+    semaphore = asyncio.Semaphore(concurrency)
+    by_file = {}
+    for index, (file_path, snippet) in enumerate(pairs):
+        by_file.setdefault(os.path.abspath(file_path), []).append((index, file_path, snippet))
+    results = [None] * len(pairs)
+
+    async def update_in_order(entries):
+        for index, file_path, snippet in entries:
+            results[index] = await update_file_async(client, semaphore, model, file_path, snippet, whole_file, local)
+
+    await asyncio.gather(*(update_in_order(entries) for entries in by_file.values()))
+    return results
+
+def batch_update(model_args):
+    try:
+        pairs = read_manifest(model_args.batch)
+    except (OSError, ValueError) as e:
+        print(f"Error reading manifest: {e}")
+        return
+    model = "gpt-4o" if model_args.gpt4o else "gpt-4o-mini"
+    if model_args.debug:
+        print(f"Updating {len(pairs)} file(s) with {model}, {model_args.concurrency} at a time")
+
+    start_time = time.perf_counter()
+    results = asyncio.run(update_files_async(pairs, model, model_args.concurrency, model_args.whole_file,
+                                             not model_args.no_local))
+    elapsed_time = time.perf_counter() - start_time
+    for result in results:
+        if result["status"] == "success":
+            append_metrics(model_args.metrics, metrics_record(model=model, **result))
+
+    for result in results:
+        if result["status"] == "success" and result["mode"] == "local":
+            print(f"{result['file']}: +{result['additions']} -{result['deletions']} lines, merged locally")
+        elif result["status"] == "success":
+            print(f"{result['file']}: +{result['additions']} -{result['deletions']} lines, {result['mode']}, "
+                  f"{result['throughput']:.2f} tokens/second ({result['completion_tokens']} tokens in {result['seconds']:.2f}s), "
+                  f"local merge: {result['local']}")
+        else:
+            print(f"{result['file']}: error: {result['error']}")
+
+    succeeded = [result for result in results if result["status"] == "success"]
+    total_tokens = sum(result["completion_tokens"] for result in succeeded)
+    print("-" * 40)
+    print(f"Updated {len(succeeded)}/{len(results)} file(s) in {elapsed_time:.2f}s")
+    print(f"Lines changed: +{sum(r['additions'] for r in succeeded)} -{sum(r['deletions'] for r in succeeded)}")
+    if elapsed_time:
+        print(f"Combined throughput: {total_tokens / elapsed_time:.2f} tokens/second ({total_tokens} tokens)")
+
+def usage_tokens(usage):
+    """Token counts of a completion's usage, None where the API did not report them."""
+    details = getattr(usage, "completion_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "accepted_prediction_tokens": getattr(details, "accepted_prediction_tokens", None),
+        "rejected_prediction_tokens": getattr(details, "rejected_prediction_tokens", None),
+    }
+
+def metrics_record(file, mode, model, file_bytes, additions, deletions, seconds, ttft=None, prompt_tokens=None,
+                   completion_tokens=None, accepted_prediction_tokens=None, rejected_prediction_tokens=None, **_):
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "file": file, "mode": mode, "model": model, "file_bytes": file_bytes,
+        "additions": additions, "deletions": deletions, "latency_s": round(seconds, 4),
+        "ttft_s": round(ttft, 4) if ttft is not None else None,
+        "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+        "accepted_prediction_tokens": accepted_prediction_tokens,
+        "rejected_prediction_tokens": rejected_prediction_tokens,
+    }
+
+def append_metrics(metrics_path, record):
+    if not metrics_path:
+        return
+    try:
+        with open(metrics_path, 'a') as file:
+            file.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Warning: could not record metrics in {metrics_path}: {e}")
+
+def bucket(value, buckets):
+    return next(label for bound, label in buckets if bound is None or value < bound)
+
+def summarize_metrics(metrics_path):
+    """Prints run counts, latency and prediction acceptance grouped by model, file size and change size."""
+    records = []
+    try:
+        with open(metrics_path, 'r') as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue  # a torn line from an interrupted run
+    except FileNotFoundError:
+        print(f"No metrics recorded yet in {metrics_path}")
+        return
+
+    dimensions = [
+        ("Model", lambda r: r["model"] if r["mode"] != "local" else f"{r['model']} (local)"),
+        ("File size", lambda r: bucket(r["file_bytes"], FILE_SIZE_BUCKETS)),
+        ("Change size", lambda r: bucket(r["additions"] + r["deletions"], CHANGE_SIZE_BUCKETS)),
+    ]
+    print(f"{len(records)} run(s) in {metrics_path}")
+    for title, key in dimensions:
+        groups = {}
+        for record in records:
+            groups.setdefault(key(record), []).append(record)
+        print()
+        print(f"{title:<22} {'runs':>5} {'p50 s':>7} {'mean s':>7} {'accepted':>9} {'rejected':>9} {'accept %':>9}")
+        for name, group in sorted(groups.items()):
+            latencies = sorted(r["latency_s"] for r in group)
+            accepted = sum(r.get("accepted_prediction_tokens") or 0 for r in group)
+            rejected = sum(r.get("rejected_prediction_tokens") or 0 for r in group)
+            rate = f"{100 * accepted / (accepted + rejected):.1f}" if accepted + rejected else "-"
+            print(f"{name:<22} {len(group):>5} {latencies[len(latencies) // 2]:>7.2f} "
+                  f"{sum(latencies) / len(latencies):>7.2f} {accepted:>9} {rejected:>9} {rate:>9}")
+
 if __name__ == "__main__":
     args = parse_args()
     if args.debug:
         print("Debug mode enabled")
-    update_file_content(args.file_path, args.debug, args)
+    if args.summary:
+        summarize_metrics(args.metrics)
+    elif args.batch:
+        batch_update(args)
+    else:
+        update_file_content(args.file_path, args.debug, args)